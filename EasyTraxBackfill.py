@@ -0,0 +1,446 @@
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import EasyTraxBatch as Batch
+import EasyTraxCache as Cache
+import EasyTraxCodes as Codes
+import EasyTraxShare as Share
+import EasyTraxStore as Store
+import EasyTraxWatch as Watch
+
+
+DEFAULT_JOURNAL = 'EasyTrax_backfill.jsonl'
+REPORT_PATTERN = 'W*.txt'
+# how many reports each worker is given ahead of time, so a worker never waits for the next one.
+REPORTS_AHEAD_PER_WORKER = 4
+
+
+class EasyTraxBackfill:
+    """Converts every report in an archive, and picks up where it left off if it is stopped part way through.
+
+    To fill the results store (see EasyTraxStore), or make the WTX reports again after the code tables change,
+    thousands of archived reports have to go through EasyTraxParse and EasyTraxConvert, which takes hours. This class
+    walks archive_directory (and every directory under it) for reports, converts them in a pool of worker processes,
+    and writes the outcome of each one to a journal as soon as it finishes.
+
+    The journal is a text file with one JSON record per line: the report (relative to archive_directory), its size,
+    modified time and SHA-256, the SHA-256 of the code tables it was converted with, the directory its WTX report was
+    written under, the results database it was stored in, the column mode, and the job result (status, job number,
+    counts, error). Each record is flushed to disk as it is written, so a backfill that is stopped (Ctrl+C, a crash, a
+    reboot) loses at most the jobs that were running.
+
+    When the backfill is run again, reports whose journal record says they converted, with the same contents, the
+    same code tables, into the same WTX reports directory, and the same results database (or none), with the same
+    column mode, are skipped. The size and modified time are checked first, so an unchanged report is skipped without
+    being read, and a restart over thousands of reports only takes seconds. A report that has changed (or every
+    report, once any of those settings change, ex. a run with --store after one without) is converted again. Reports
+    that failed are skipped as well, unless retry_failed is True, as they would fail the same way until they are
+    fixed (which changes them).
+
+    Can be run from the command line:
+
+        python EasyTraxBackfill.py "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Archive" -o WTX_reports --store
+
+    Attributes
+    ----------
+    archive_directory : str
+        the top directory of the archive.
+
+    journal_path : str
+        the journal file.
+
+    wtx_reports_directory : str
+        the directory WTX reports are written under. If None, EasyTraxConvert's default (WTX_reports) is used.
+
+    workers : int
+        the amount of worker processes. If None, one per CPU.
+
+    column_mode : str
+        how EasyTraxParse reads the data tables, 'split' or 'fixed-width'.
+
+    cache_directory : str
+        the directory parsed tables are cached in (see EasyTraxCache), or None.
+
+    results_database : str
+        the SQLite database parsed results are stored in (see EasyTraxStore), or None.
+
+    retry_failed : bool
+        whether reports that failed before are converted again.
+
+    codes_hash : str
+        the SHA-256 of the code tables (EasyTraxCodes.json) being used.
+
+    output_directory : str
+        the full path WTX reports are written under, kept in each journal record.
+
+    store_path : str
+        the full path of results_database (or None), kept in each journal record.
+
+    journal : dict
+        report (relative to archive_directory) : its latest journal record.
+
+    report_paths : list(str)
+        every report found in archive_directory, relative to it, in sorted order.
+
+    to_convert : list(str)
+        the reports in report_paths that still need converting.
+
+    stopped : bool
+        set by stop(), so no more reports are started.
+
+    counts : dict
+        the amount of reports 'converted', 'failed', 'skipped' (already done), and 'unchanged' (touched, but with the
+        same contents) by this run.
+
+    Methods
+    -------
+    * `easy_trax_backfill_controller()` -
+        loads the journal, finds the reports, converts the ones not done yet, and returns a summary.
+
+    * `load_journal()` -
+        reads the journal left by earlier runs, and rewrites it with only the latest record of each report.
+
+    * `find_reports()` -
+        fills report_paths and to_convert.
+
+        * `is_done(relative_path, report_stat)` -
+            checks the journal to see if a report can be skipped.
+
+        * `is_current(journal_record)` -
+            checks a journal record was made with the same code tables, WTX reports directory, results database,
+            and column mode.
+
+    * `convert_reports()` -
+        converts the reports in to_convert, writing each outcome to the journal as it finishes.
+
+        * `write_journal_record(journal_file, journal_record)` -
+            adds a record to the journal, and flushes it to disk.
+
+    * `stop()` -
+        stops starting new reports. The ones already running are finished and journaled.
+    """
+
+    def __init__(self, archive_directory, journal_path=DEFAULT_JOURNAL, wtx_reports_directory=None, workers=None,
+                 column_mode='split', cache_directory=None, results_database=None, retry_failed=False):
+        """
+        Parameters
+        ----------
+        archive_directory : str
+            the top directory of the archive.
+        journal_path : str
+            the journal file. Made if it doesn't exist.
+        wtx_reports_directory : str
+            the directory WTX reports are written under.
+        workers : int
+            the amount of worker processes to use.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+        cache_directory : str
+            the directory to cache parsed tables in, or None.
+        results_database : str
+            the SQLite database to store parsed results in, or None.
+        retry_failed : bool
+            whether to convert reports that failed before again.
+        """
+
+        self.archive_directory = archive_directory
+        self.journal_path = journal_path
+        self.wtx_reports_directory = wtx_reports_directory
+        self.workers = workers
+        self.column_mode = column_mode
+        self.cache_directory = cache_directory
+        self.results_database = results_database
+        self.retry_failed = retry_failed
+        self.codes_hash = Codes.get_registry().signature[2]
+        self.output_directory = Share.get_output_root()
+        if wtx_reports_directory is not None:
+            self.output_directory = os.path.abspath(wtx_reports_directory)
+        self.store_path = None if results_database is None else os.path.abspath(results_database)
+        self.journal = {}
+        self.report_paths = []
+        self.to_convert = []
+        self.stopped = False
+        self.counts = {'converted': 0, 'failed': 0, 'skipped': 0, 'unchanged': 0}
+
+    def easy_trax_backfill_controller(self):
+        """executes the various methods in the right order.
+
+        Returns
+        -------
+        summary : str
+            the counts of the run, ready to print.
+        """
+
+        start = time.perf_counter()
+        self.load_journal()
+        self.find_reports()
+        self.convert_reports()
+        seconds = time.perf_counter() - start
+        summary = (str(len(self.report_paths)) + ' reports found, ' + str(self.counts['skipped']) +
+                   ' already done, ' + str(self.counts['converted']) + ' converted, ' +
+                   str(self.counts['unchanged']) + ' unchanged, ' + str(self.counts['failed']) + ' failed, ' +
+                   '%.1f s.' % seconds)
+        remaining = len(self.to_convert) - self.counts['converted'] - self.counts['failed'] - self.counts['unchanged']
+        if remaining:
+            summary += '\nStopped with ' + str(remaining) + ' reports left, run it again to carry on.'
+        return summary
+
+    def load_journal(self):
+        """reads the journal left by earlier runs into journal, keeping the latest record of each report. If the
+        journal holds superseded records, it is rewritten (via a temporary file) with only the latest ones, so it
+        doesn't keep growing from run to run. A line that can't be read (ex. cut off by a crash) is ignored."""
+
+        line_count = 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as journal_file:
+                for line in journal_file:
+                    line_count += 1
+                    try:
+                        journal_record = json.loads(line)
+                        self.journal[journal_record['report']] = journal_record
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            return
+        if line_count > len(self.journal):
+            try:
+                with Share.replacing_file(self.journal_path, 'w', 'utf-8') as journal_file:
+                    for journal_record in self.journal.values():
+                        journal_file.write(json.dumps(journal_record) + '\n')
+                    journal_file.flush()
+                    os.fsync(journal_file.fileno())
+            except OSError:
+                pass
+
+    def find_reports(self):
+        """walks archive_directory for reports, filling report_paths, and to_convert with those not done yet."""
+
+        report_paths = []
+        for directory, directory_names, filenames in os.walk(self.archive_directory):
+            directory_names.sort()
+            for filename in filenames:
+                if fnmatch.fnmatch(filename, REPORT_PATTERN):
+                    report_paths.append(os.path.relpath(os.path.join(directory, filename), self.archive_directory))
+        self.report_paths = sorted(report_paths)
+        self.to_convert = []
+        for relative_path in self.report_paths:
+            try:
+                report_stat = os.stat(os.path.join(self.archive_directory, relative_path))
+            except OSError:
+                report_stat = None
+            if report_stat is not None and self.is_done(relative_path, report_stat):
+                self.counts['skipped'] += 1
+            else:
+                self.to_convert.append(relative_path)
+
+    def is_done(self, relative_path, report_stat):
+        """checks the journal to see if a report was already converted, unchanged, with the same code tables (or
+        failed, unless retry_failed is True).
+
+        Parameters
+        ----------
+        relative_path : str
+            the report, relative to archive_directory.
+        report_stat : os.stat_result
+            the report's stat.
+
+        Returns
+        -------
+        bool
+            True if the report can be skipped.
+        """
+
+        journal_record = self.journal.get(relative_path)
+        if not self.is_current(journal_record):
+            return False
+        if journal_record.get('size') != report_stat.st_size or journal_record.get('mtime') != report_stat.st_mtime_ns:
+            return False
+        if journal_record.get('status') == 'ok':
+            return True
+        return journal_record.get('status') == 'failed' and not self.retry_failed
+
+    def is_current(self, journal_record):
+        """checks a journal record (or None) was made with the same code tables, writing to the same WTX reports
+        directory and results database, reading the tables in the same column mode, so its outcome still holds."""
+
+        return (journal_record is not None and journal_record.get('codes hash') == self.codes_hash and
+                journal_record.get('output') == self.output_directory and
+                journal_record.get('store') == self.store_path and
+                journal_record.get('column mode') == self.column_mode)
+
+    def convert_reports(self):
+        """converts the reports in to_convert in a process pool, and writes the outcome of each to the journal as
+        soon as it finishes.
+
+        only a few reports per worker are handed out at a time, so stop() (or Ctrl+C) takes effect quickly: the
+        reports already running are finished and journaled, and the rest are left for the next run.
+        """
+
+        if not self.to_convert:
+            return
+        workers = self.workers or os.cpu_count() or 1
+        workers = min(workers, len(self.to_convert))
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_path)), exist_ok=True)
+        report_queue = list(reversed(self.to_convert))
+        running = {}
+        with open(self.journal_path, 'a', encoding='utf-8') as journal_file, \
+                ProcessPoolExecutor(max_workers=workers, initializer=Watch.ignore_interrupts) as executor:
+            try:
+                while report_queue or running:
+                    while report_queue and not self.stopped and len(running) < workers * REPORTS_AHEAD_PER_WORKER:
+                        relative_path = report_queue.pop()
+                        # only a report that converted can be skipped for having the same contents, one that
+                        # failed (ex. as the WTX reports directory couldn't be written) is always tried again
+                        journal_record = self.journal.get(relative_path)
+                        known_hash = None
+                        if self.is_current(journal_record) and journal_record.get('status') == 'ok':
+                            known_hash = journal_record.get('input hash')
+                        future = executor.submit(backfill_report, os.path.join(self.archive_directory,
+                                                                               relative_path),
+                                                 known_hash, self.wtx_reports_directory, self.column_mode,
+                                                 self.cache_directory, self.results_database)
+                        running[future] = relative_path
+                    if not running:
+                        break
+                    finished, not_finished = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        relative_path = running.pop(future)
+                        try:
+                            journal_record = future.result()
+                        except Exception as exc:
+                            # the worker process itself died (convert_report_file catches everything else)
+                            journal_record = {'status': 'failed', 'error': type(exc).__name__ + ': ' + str(exc)}
+                        if journal_record['status'] == 'unchanged':
+                            # the same contents as when it was converted, only the modified time changed
+                            self.counts['unchanged'] += 1
+                            journal_record = dict(self.journal[relative_path], size=journal_record['size'],
+                                                  mtime=journal_record['mtime'])
+                        elif journal_record['status'] == 'ok':
+                            self.counts['converted'] += 1
+                        else:
+                            self.counts['failed'] += 1
+                        journal_record['report'] = relative_path
+                        journal_record['codes hash'] = self.codes_hash
+                        journal_record['output'] = self.output_directory
+                        journal_record['store'] = self.store_path
+                        journal_record['column mode'] = self.column_mode
+                        self.journal[relative_path] = journal_record
+                        self.write_journal_record(journal_file, journal_record)
+            except KeyboardInterrupt:
+                self.stopped = True
+                for future in running:
+                    future.cancel()
+                raise
+
+    def write_journal_record(self, journal_file, journal_record):
+        """adds a record to the journal as one line of JSON, and flushes it to disk, so it survives a crash."""
+
+        journal_file.write(json.dumps(journal_record) + '\n')
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+    def stop(self):
+        """stops starting new reports. The ones already running are finished and journaled first."""
+
+        self.stopped = True
+
+
+def backfill_report(report_path, known_hash, wtx_reports_directory, column_mode, cache_directory, results_database):
+    """hashes a report, and converts it (see EasyTraxBatch.convert_report_file) unless its hash is known_hash.
+
+    module level so it can be sent to worker processes.
+
+    Parameters
+    ----------
+    report_path : str
+        the full path of the report.
+    known_hash : str or None
+        the SHA-256 of the report when it was last converted with the current code tables, if it was.
+    wtx_reports_directory, column_mode, cache_directory, results_database
+        see EasyTraxBatch.convert_report_lines().
+
+    Returns
+    -------
+    journal_record : dict
+        the size, modified time, and SHA-256 of the report, the time it finished, and the job number, status ('ok',
+        'failed', or 'unchanged' if the hash was known_hash), counts, seconds, and error of the job.
+    """
+
+    try:
+        report_stat = os.stat(report_path)
+        input_hash = hashlib.sha256()
+        with open(report_path, 'rb') as report_file:
+            for block in iter(lambda: report_file.read(1 << 16), b''):
+                input_hash.update(block)
+        input_hash = input_hash.hexdigest()
+    except OSError as exc:
+        return {'status': 'failed', 'error': type(exc).__name__ + ': ' + str(exc)}
+    journal_record = {'size': report_stat.st_size,
+                      'mtime': report_stat.st_mtime_ns,
+                      'input hash': input_hash}
+    if input_hash == known_hash:
+        journal_record['status'] = 'unchanged'
+        return journal_record
+    job_result = Batch.convert_report_file(report_path, wtx_reports_directory, column_mode, cache_directory,
+                                           results_database=results_database)
+    for key in ('job number', 'status', 'samples', 'lines', 'results stored', 'total seconds', 'error'):
+        journal_record[key] = job_result[key]
+    journal_record['finished'] = time.strftime('%Y-%m-%d %H:%M:%S')
+    return journal_record
+
+
+def main(argv=None):
+    """command line entry point. Backfills an archive until it is done, or Ctrl+C is pressed.
+
+    Returns
+    -------
+    int
+        0 if every report is done, 1 if any failed, or it was stopped early.
+    """
+
+    parser = argparse.ArgumentParser(description='Convert every report in an archive, carrying on from where an '
+                                                 'earlier run stopped.')
+    parser.add_argument('archive', help='the top directory of the archive (every directory under it is searched).')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL,
+                        help='the journal file, which records each report done (defaults to ' + DEFAULT_JOURNAL +
+                             ' in the current directory).')
+    parser.add_argument('-o', '--output', default=None,
+                        help='directory to write WTX reports under (defaults to EASYTRAX_OUTPUT_ROOT, or WTX_reports '
+                             'on the T: drive).')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='amount of worker processes (defaults to one per CPU).')
+    parser.add_argument('--fixed-width', action='store_true',
+                        help='read data tables by column position rather than by splitting on spaces.')
+    parser.add_argument('--cache', nargs='?', const=Cache.DEFAULT_CACHE_DIRECTORY, default=None,
+                        help='cache parsed tables between runs (optionally in the given directory).')
+    parser.add_argument('--store', nargs='?', const=Store.DEFAULT_DATABASE, default=None, metavar='DATABASE',
+                        help='also store the parsed results in a SQLite database (optionally the given file).')
+    parser.add_argument('--retry-failed', action='store_true', help='convert reports that failed before again.')
+    args = parser.parse_args(argv)
+    backfill = EasyTraxBackfill(args.archive, args.journal, args.output, args.workers,
+                                'fixed-width' if args.fixed_width else 'split', args.cache, args.store,
+                                args.retry_failed)
+    try:
+        summary = backfill.easy_trax_backfill_controller()
+    except KeyboardInterrupt:
+        print('Stopped. Every report finished so far is in ' + args.journal + ', run it again to carry on.')
+        return 1
+    print(summary)
+    converted = set(backfill.to_convert)
+    failed = [journal_record for journal_record in backfill.journal.values()
+              if journal_record.get('status') == 'failed' and journal_record['report'] in converted]
+    for journal_record in failed:
+        print(journal_record['report'] + ': ' + str(journal_record.get('error')))
+    if failed or backfill.stopped:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
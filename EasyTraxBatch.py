@@ -0,0 +1,538 @@
+import argparse
+import functools
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import EasyTraxParse as Parse
+import EasyTraxConvert as Convert
+import EasyTraxBundle as Bundle
+import EasyTraxCache as Cache
+import EasyTraxDiagnostics as Diagnostics
+import EasyTraxInput as Input
+import EasyTraxMetrics as Metrics
+import EasyTraxShare as Share
+import EasyTraxStore as Store
+
+
+class EasyTraxBatch:
+    """Converts every report in a directory to WTX format without the TK window.
+
+    EasyTraxTK converts one job per button click. When there are a lot of FirstChoice reports waiting in
+    Files_To_Report, this class finds all of them (every file matching W*.txt), and runs each one through
+    EasyTraxParse and EasyTraxConvert in its own worker process. The parse and convert classes are used exactly as
+    EasyTraxTK uses them, so the WTX files produced are identical to the ones made by clicking the button.
+
+    Once every job has finished, a summary table is printed with the outcome and timings of each job.
+
+    Can be run from the command line:
+
+        python EasyTraxBatch.py "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Files_To_Report"
+
+    Attributes
+    ----------
+    report_directory : str
+        the directory to look in for reports (usually Files_To_Report).
+
+    wtx_reports_directory : str
+        the directory WTX reports are written under. If None, EasyTraxConvert's default (WTX_reports) is used.
+
+    workers : int
+        the amount of worker processes to convert jobs with. If None, one per CPU.
+
+    column_mode : str
+        how EasyTraxParse reads the data tables, 'split' or 'fixed-width'.
+
+    cache_directory : str
+        the directory parsed tables are cached in between runs (see EasyTraxCache). If None, nothing is cached.
+
+    metrics_directory : str
+        the directory the stage metrics (see EasyTraxMetrics) of slow jobs are saved in. If None, no metrics are
+        recorded.
+
+    profile : bool
+        whether to also run cProfile on each job, and save the profile of slow jobs next to their metrics.
+
+    slow_seconds : float
+        jobs that take at least this long have their metrics (and profile) saved. 0 saves every job.
+
+    input_cache : EasyTraxShare.EasyTraxInputCache or None
+        if given, report_directory is on a network share: the reports are copied to the local disk first (only those
+        that have changed since the last run), and converted from there.
+
+    spooler : EasyTraxShare.EasyTraxSpooler or None
+        if given, the WTX reports are written to the spooler's local spool_directory, and copied to its output_root
+        in the background as each job finishes. wtx_reports_directory isn't used.
+
+    results_database : str or None
+        if given, the parsed results of each job are also stored in this SQLite database (see EasyTraxStore).
+
+    replacement : bool
+        if True, each job whose results changed since its last WTX report also gets a replacement report, to upload
+        instead (see EasyTraxConvert.write_replacement_report()), for re-uploading corrected jobs.
+
+    report_paths : list(str)
+        the full paths of the reports found in report_directory.
+
+    job_results : list(dict)
+        one dictionary per job, as returned by convert_report_file().
+
+    Methods
+    -------
+    * `easy_trax_batch_controller()` -
+        finds the reports, converts them, and returns the summary table.
+
+    * `find_reports()` -
+        fills report_paths with every W*.txt file in report_directory (or their local copies), in sorted order.
+
+    * `convert_reports()` -
+        converts every report in report_paths, in parallel if more than one worker is being used.
+
+        * `spool_job_result(job_result)` -
+            hands the WTX report of a job to the spooler, if there is one.
+
+    * `format_summary_table()` -
+        formats job_results into a table, one row per job.
+    """
+
+    def __init__(self, report_directory, wtx_reports_directory=None, workers=None, column_mode='split',
+                 cache_directory=None, metrics_directory=None, profile=False, slow_seconds=0.0, input_cache=None,
+                 spooler=None, results_database=None, replacement=False):
+        """
+        Parameters
+        ----------
+        report_directory : str
+            the directory to look in for reports.
+        wtx_reports_directory : str
+            the directory WTX reports are written under.
+        workers : int
+            the amount of worker processes to use.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+        cache_directory : str
+            the directory to cache parsed tables in, or None.
+        metrics_directory : str
+            the directory to save the metrics of slow jobs in, or None.
+        profile : bool
+            whether to run cProfile on each job.
+        slow_seconds : float
+            the time a job has to take to have its metrics saved.
+        input_cache : EasyTraxShare.EasyTraxInputCache
+            the local cache to read report_directory through, or None.
+        spooler : EasyTraxShare.EasyTraxSpooler
+            the spooler to write WTX reports through, or None.
+        results_database : str
+            the SQLite database to store parsed results in, or None.
+        replacement : bool
+            whether to make replacement reports.
+        """
+
+        self.report_directory = report_directory
+        self.wtx_reports_directory = wtx_reports_directory
+        self.workers = workers
+        self.column_mode = column_mode
+        self.cache_directory = cache_directory
+        self.metrics_directory = metrics_directory
+        self.profile = profile
+        self.slow_seconds = slow_seconds
+        self.input_cache = input_cache
+        self.spooler = spooler
+        self.results_database = results_database
+        self.replacement = replacement
+        self.report_paths = []
+        self.job_results = []
+
+    def easy_trax_batch_controller(self):
+        """executes the various methods in the right order.
+
+        Returns
+        -------
+        summary_table : str
+            the summary table of the conversion, ready to print.
+        """
+
+        self.find_reports()
+        self.convert_reports()
+        if self.spooler is not None:
+            self.spooler.flush(Share.DEFAULT_FLUSH_SECONDS)
+        return self.format_summary_table()
+
+    def find_reports(self):
+        """fills report_paths with every W*.txt file in report_directory, in sorted order. With an input_cache, the
+        directory is listed once, and the local copies are used."""
+
+        if self.input_cache is not None:
+            self.report_paths = self.input_cache.prefetch('W*.txt')
+            return
+        self.report_paths = sorted(glob.glob(os.path.join(self.report_directory, 'W*.txt')))
+
+    def convert_reports(self):
+        """converts every report in report_paths, filling job_results.
+
+        with one worker (or one report) the jobs are converted in this process, otherwise they are spread over a
+        process pool. Results are kept in the same order as report_paths either way. With a spooler, each WTX report
+        is handed to it as soon as its job is done, so copying to the share overlaps with converting the next jobs.
+        """
+
+        workers = self.workers or os.cpu_count() or 1
+        workers = min(workers, len(self.report_paths))
+        wtx_reports_directory = self.wtx_reports_directory
+        if self.spooler is not None:
+            wtx_reports_directory = self.spooler.spool_directory
+        # a partial of a module level function can still be sent to the worker processes
+        convert_job = functools.partial(convert_report_file,
+                                        wtx_reports_directory=wtx_reports_directory,
+                                        column_mode=self.column_mode,
+                                        cache_directory=self.cache_directory,
+                                        metrics_directory=self.metrics_directory,
+                                        profile=self.profile,
+                                        slow_seconds=self.slow_seconds,
+                                        results_database=self.results_database,
+                                        replacement=self.replacement)
+        if workers <= 1:
+            self.job_results = [self.spool_job_result(job_result) for job_result in
+                                map(convert_job, self.report_paths)]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                self.job_results = [self.spool_job_result(job_result) for job_result in
+                                    executor.map(convert_job, self.report_paths)]
+
+    def spool_job_result(self, job_result):
+        """hands the WTX report (and replacement report) of a job that converted to the spooler, if there is one.
+
+        Returns
+        -------
+        job_result : dict
+            the job result passed.
+        """
+
+        if self.spooler is not None and job_result['status'] == 'ok' and job_result['wtx path']:
+            self.spooler.submit(job_result['wtx path'])
+            if job_result['upload path'] and job_result['upload path'] != job_result['wtx path']:
+                self.spooler.submit(job_result['upload path'])
+        return job_result
+
+    def format_summary_table(self):
+        """formats job_results into a table, one row per job, with a totals line at the bottom (see
+        format_summary_table())."""
+
+        return format_summary_table(self.job_results)
+
+
+def convert_report_file(report_path, wtx_reports_directory=None, column_mode='split', cache_directory=None,
+                        metrics_directory=None, profile=False, slow_seconds=0.0, results_database=None,
+                        replacement=False):
+    """reads a report, and runs it through EasyTraxParse and EasyTraxConvert, the same way EasyTraxTK does.
+
+    module level (rather than a method) so it can be sent to worker processes. Any exception raised while reading,
+    parsing or converting is caught and recorded in the result, so one bad report doesn't stop the rest of the
+    batch. Once the report is read, the work is done by convert_report_lines().
+
+    Parameters
+    ----------
+    report_path : str
+        the full path of the report to convert (ex. '...\\Files_To_Report\\W161000.txt').
+    wtx_reports_directory, column_mode, cache_directory, metrics_directory, profile, slow_seconds, results_database,
+    replacement
+        see convert_report_lines().
+
+    Returns
+    -------
+    job_result : dict
+        see convert_report_lines().
+    """
+
+    start = time.perf_counter()
+    # the job number typed into EasyTraxTK doesn't include the 'W'
+    job_number = os.path.splitext(os.path.basename(report_path))[0][1:]
+    try:
+        mb_file_contents = Input.read_report_lines(report_path)
+    except Exception as exc:
+        job_result = get_empty_job_result('W' + job_number, report_path)
+        job_result['status'] = 'failed'
+        job_result['error'] = type(exc).__name__ + ': ' + str(exc)
+        job_result['total seconds'] = time.perf_counter() - start
+        return job_result
+    job_result = convert_report_lines(mb_file_contents, job_number, report_path, wtx_reports_directory, column_mode,
+                                      cache_directory, metrics_directory, profile, slow_seconds, results_database,
+                                      replacement)
+    job_result['total seconds'] = time.perf_counter() - start
+    return job_result
+
+
+def convert_report_lines(mb_file_contents, job_number, report_path, wtx_reports_directory=None, column_mode='split',
+                         cache_directory=None, metrics_directory=None, profile=False, slow_seconds=0.0,
+                         results_database=None, replacement=False):
+    """runs the lines of one report through EasyTraxParse and EasyTraxConvert.
+
+    module level so it can be sent to worker processes. Used by convert_report_file(), and by EasyTraxSplit for the
+    jobs found in a multi-job export. Any exception raised while parsing or converting is caught and recorded in the
+    result.
+
+    Parameters
+    ----------
+    mb_file_contents : list(str)
+        the lines of the report. The first line is the report header, with the client and the job number.
+    job_number : str
+        the job number, without the 'W'. Only used until the report header has been read.
+    report_path : str
+        where the report came from, for the summary table.
+    wtx_reports_directory : str
+        the directory WTX reports are written under. If None, EasyTraxConvert's default is used.
+    column_mode : str
+        'split' or 'fixed-width', see EasyTraxParse.
+    cache_directory : str
+        the directory to cache parsed tables in (see EasyTraxCache), or None to parse every table.
+    metrics_directory : str
+        if given, the time and counters of each stage are recorded (see EasyTraxMetrics), and if the job takes at
+        least slow_seconds, saved in this directory as '<job number>.metrics.json'.
+    profile : bool
+        if metrics_directory is given, also run cProfile, and save the profile as '<job number>.prof' (read it with
+        pstats).
+    slow_seconds : float
+        the time a job has to take to have its metrics saved.
+    results_database : str
+        if given, the parsed samples and results are also stored in this SQLite database (see EasyTraxStore), once
+        the WTX report has been written, so only for jobs that haven't failed. A job that can't be stored has failed.
+    replacement : bool
+        if True, also write a replacement report if any lines changed since the job's last WTX report (see
+        EasyTraxConvert.write_replacement_report()).
+
+    Returns
+    -------
+    job_result : dict
+        the job number, status ('ok' or 'failed'), sample and line counts, timings, and logs for the job. The logs
+        are EasyTraxDiagnostics, use str() to get the text. If metrics were recorded, 'metrics' holds them (as
+        returned by EasyTraxMetrics.as_dict()), otherwise it is None. 'wtx path' is the WTX report written (see
+        EasyTraxBundle), and 'wtx unchanged' is True if it was already up to date, so wasn't written again. A job whose
+        WTX report couldn't be written, or has no lines in it, or whose replacement report couldn't be made, has
+        failed. 'results stored' is the amount of results stored in results_database. 'upload path' is the report to
+        upload (the replacement report in replacement mode, or '' if nothing changed), and 'lines changed' the amount
+        of lines that are new or different since the last WTX report.
+    """
+
+    start = time.perf_counter()
+    job_result = get_empty_job_result('W' + job_number, report_path)
+    metrics = Metrics.EasyTraxMetrics.disabled()
+    if metrics_directory is not None:
+        metrics = Metrics.EasyTraxMetrics(profile)
+    try:
+        table_cache = None
+        if cache_directory is not None:
+            table_cache = Cache.EasyTraxTableCache(cache_directory)
+        with metrics.profiling():
+            parsing_script = Parse.EasyTraxParse(job_number, mb_file_contents, column_mode=column_mode,
+                                                 table_cache=table_cache, metrics=metrics)
+            samples_dictionary, job_dictionary, parse_log = parsing_script.easy_trax_parse_controller()
+            convert_start = time.perf_counter()
+            job_result['parse seconds'] = convert_start - start
+            job_result['job number'] = job_dictionary['job number']
+            job_result['samples'] = len(samples_dictionary)
+            job_result['parse log'] = parse_log
+            converting_script = Convert.EasyTraxConvert(samples_dictionary, job_dictionary, wtx_reports_directory,
+                                                        metrics, replacement)
+            job_result['convert log'] = converting_script.easy_trax_convert_controller()
+        job_result['convert seconds'] = time.perf_counter() - convert_start
+        job_result['lines'] = converting_script.wtx_lines_written
+        job_result['wtx path'] = converting_script.get_wtx_report_filename()
+        job_result['wtx unchanged'] = converting_script.wtx_report_unchanged
+        job_result['upload path'] = converting_script.wtx_upload_filename
+        job_result['lines changed'] = converting_script.wtx_lines_changed
+        if converting_script.wtx_write_error:
+            job_result['status'] = 'failed'
+            job_result['error'] = converting_script.wtx_write_error
+        elif converting_script.wtx_replacement_error:
+            job_result['status'] = 'failed'
+            job_result['error'] = converting_script.wtx_replacement_error
+        elif not converting_script.wtx_lines_written:
+            job_result['status'] = 'failed'
+            job_result['error'] = 'no WTX lines were made from the report, see the parse and convert logs.'
+        if results_database is not None and job_result['status'] == 'ok':
+            with metrics.stage('store') as stage:
+                with Store.EasyTraxResultsStore(results_database) as results_store:
+                    job_result['results stored'] = results_store.store_job(samples_dictionary, job_dictionary,
+                                                                           report_path)
+                stage.count('results stored', job_result['results stored'])
+    except Exception as exc:
+        job_result['status'] = 'failed'
+        job_result['error'] = type(exc).__name__ + ': ' + str(exc)
+    job_result['total seconds'] = time.perf_counter() - start
+    if metrics.enabled:
+        job_result['metrics'] = metrics.as_dict()
+        if job_result['total seconds'] >= slow_seconds:
+            save_metrics(metrics, metrics_directory, job_result)
+    return job_result
+
+
+def get_empty_job_result(job_number, report_path):
+    """returns the result of a job that hasn't been converted yet, filled in by convert_report_lines()."""
+
+    return {'job number': job_number,
+            'report path': report_path,
+            'status': 'ok',
+            'samples': 0,
+            'lines': 0,
+            'parse seconds': 0.0,
+            'convert seconds': 0.0,
+            'total seconds': 0.0,
+            'parse log': Diagnostics.EasyTraxDiagnostics(),
+            'convert log': Diagnostics.EasyTraxDiagnostics(),
+            'metrics': None,
+            'wtx path': '',
+            'wtx unchanged': False,
+            'upload path': '',
+            'lines changed': 0,
+            'results stored': 0,
+            'error': ''}
+
+
+def format_summary_table(job_results):
+    """formats the results of some jobs into a table, one row per job, with a totals line at the bottom.
+
+    Parameters
+    ----------
+    job_results : list(dict)
+        one dictionary per job, as returned by convert_report_file() or convert_report_lines().
+
+    Returns
+    -------
+    summary_table : str
+        the table, one line per job.
+    """
+
+    header = ['Job', 'Status', 'Samples', 'Lines', 'Parse (s)', 'Convert (s)', 'Total (s)']
+    rows = []
+    for result in job_results:
+        rows.append([result['job number'],
+                     result['status'],
+                     str(result['samples']),
+                     str(result['lines']),
+                     '%.3f' % result['parse seconds'],
+                     '%.3f' % result['convert seconds'],
+                     '%.3f' % result['total seconds']])
+    widths = [len(item) for item in header]
+    for row in rows:
+        widths = [max(width, len(item)) for width, item in zip(widths, row)]
+    table_lines = ['  '.join(item.ljust(width) for item, width in zip(header, widths)).rstrip(),
+                   '  '.join('-' * width for width in widths)]
+    for row in rows:
+        table_lines.append('  '.join(item.ljust(width) for item, width in zip(row, widths)).rstrip())
+    converted = len([result for result in job_results if result['status'] == 'ok'])
+    unchanged = len([result for result in job_results if result['status'] == 'ok' and result['wtx unchanged']])
+    table_lines.append('\n' + str(len(job_results)) + ' jobs, ' + str(converted) + ' converted, ' +
+                       str(len(job_results) - converted) + ' failed, ' +
+                       str(unchanged) + ' WTX reports already up to date, ' +
+                       '%.3f' % sum(result['total seconds'] for result in job_results) + ' s total.')
+    return '\n'.join(table_lines)
+
+
+def save_metrics(metrics, metrics_directory, job_result):
+    """saves the metrics of a job as '<job number>.metrics.json' in metrics_directory, along with its profile as
+    '<job number>.prof' if there is one. If they can't be written, the job isn't failed for it."""
+
+    metrics_path = os.path.join(metrics_directory, job_result['job number'].replace('/', '-'))
+    try:
+        os.makedirs(metrics_directory, exist_ok=True)
+        metrics.write_json(metrics_path + '.metrics.json', **{'job number': job_result['job number'],
+                                                              'status': job_result['status'],
+                                                              'job seconds': job_result['total seconds']})
+        metrics.write_profile(metrics_path + '.prof')
+    except OSError:
+        pass
+
+
+def main(argv=None):
+    """command line entry point. Converts a directory of reports, prints the summary table.
+
+    Returns
+    -------
+    int
+        0 if every job converted, 1 if any failed.
+    """
+
+    parser = argparse.ArgumentParser(description='Convert every W*.txt report in a directory to WTX format.')
+    parser.add_argument('report_directory', nargs='?', default=None,
+                        help='directory containing the reports (defaults to EASYTRAX_INPUT_ROOT, or Files_To_Report '
+                             'on the T: drive).')
+    parser.add_argument('-o', '--output', default=None,
+                        help='directory to write WTX reports under (defaults to EASYTRAX_OUTPUT_ROOT, or WTX_reports '
+                             'on the T: drive).')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='amount of worker processes (defaults to one per CPU).')
+    parser.add_argument('--fixed-width', action='store_true',
+                        help='read data tables by column position rather than by splitting on spaces.')
+    parser.add_argument('--cache', nargs='?', const=Cache.DEFAULT_CACHE_DIRECTORY, default=None,
+                        help='cache parsed tables between runs, so only changed tables are parsed again '
+                             '(optionally in the given directory).')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='also print the parse and convert logs of each job.')
+    parser.add_argument('--metrics', default=None, metavar='DIR',
+                        help='record the time and counters of each stage, and save them for slow jobs in DIR.')
+    parser.add_argument('--profile', action='store_true',
+                        help='with --metrics, also save a cProfile file for slow jobs.')
+    parser.add_argument('--slow', type=float, default=0.0, metavar='SECONDS',
+                        help='with --metrics, only save jobs that take at least this long (defaults to every job).')
+    parser.add_argument('--bundle', default=None, metavar='DIR',
+                        help='also merge the WTX reports into upload files per WaterTrax client, in DIR.')
+    parser.add_argument('--bundle-lines', type=int, default=Bundle.DEFAULT_MAX_LINES,
+                        help='with --bundle, the most lines in one upload file.')
+    parser.add_argument('--bundle-bytes', type=int, default=Bundle.DEFAULT_MAX_BYTES,
+                        help='with --bundle, the most bytes in one upload file.')
+    parser.add_argument('--input-cache', nargs='?', const=Share.DEFAULT_INPUT_CACHE_DIRECTORY, default=None,
+                        metavar='DIR', help='copy the reports to the local disk first, and only the ones that have '
+                                            'changed since the last run (optionally into the given directory).')
+    parser.add_argument('--spool', nargs='?', const=Share.DEFAULT_SPOOL_DIRECTORY, default=None, metavar='DIR',
+                        help='write the WTX reports to the local disk first (optionally in the given directory), and '
+                             'copy them to the output directory in the background, retrying if it fails.')
+    parser.add_argument('--retries', type=int, default=Share.DEFAULT_RETRIES,
+                        help='with --spool, the amount of times a failed copy is tried again.')
+    parser.add_argument('--store', nargs='?', const=Store.DEFAULT_DATABASE, default=None, metavar='DATABASE',
+                        help='also store the parsed results in a SQLite database, for EasyTraxStore.py query '
+                             '(optionally the given database file).')
+    parser.add_argument('--replacement', action='store_true',
+                        help='for corrected reports: if any results changed since the last WTX report, also write a '
+                             'replacement report (W161000_R.txt) to upload instead.')
+    args = parser.parse_args(argv)
+    if args.report_directory is None:
+        args.report_directory = Share.get_input_root()
+    input_cache = None
+    if args.input_cache:
+        input_cache = Share.EasyTraxInputCache(args.report_directory, args.input_cache)
+    spooler = None
+    if args.spool:
+        spooler = Share.EasyTraxSpooler(args.output, args.spool, args.retries).start()
+    batch = EasyTraxBatch(args.report_directory, args.output, args.workers,
+                          'fixed-width' if args.fixed_width else 'split', args.cache, args.metrics, args.profile,
+                          args.slow, input_cache, spooler, args.store, args.replacement)
+    summary_table = batch.easy_trax_batch_controller()
+    if not batch.report_paths:
+        print('No W*.txt reports found in ' + args.report_directory)
+        return 1
+    for result in batch.job_results:
+        if result['error']:
+            print(result['job number'] + ': ' + result['error'])
+        if args.verbose:
+            print('\n' + result['job number'] + str(result['parse log']) + str(result['convert log']))
+    print(summary_table)
+    if spooler is not None:
+        for spool_path, error in spooler.failed.items():
+            print(spool_path + " couldn't be copied to " + spooler.output_root +
+                  ' (it will be tried again next time): ' + error)
+        not_copied = spooler.sync_queue.unfinished_tasks
+        if not_copied:
+            print(str(not_copied) + ' WTX reports were still waiting to be copied to ' + spooler.output_root +
+                  ' (they stay in the spool, and will be copied next time).')
+        print(str(spooler.synced) + ' WTX reports copied to ' + spooler.output_root + '.')
+    if args.bundle:
+        bundle = Bundle.bundle_job_results(batch.job_results, args.bundle, args.bundle_lines, args.bundle_bytes)
+        print(bundle.format_bundle_table())
+    if [result for result in batch.job_results if result['status'] != 'ok'] or \
+            (spooler and (spooler.failed or spooler.sync_queue.unfinished_tasks)):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
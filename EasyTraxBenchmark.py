@@ -0,0 +1,457 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import EasyTraxParse as Parse
+import EasyTraxConvert as Convert
+import EasyTraxInput as Input
+import EasyTraxSynthetic as Synthetic
+from EasyTraxParse import EasyTraxTable
+
+
+# bump if the layout of the scaling results JSON changes.
+RESULTS_FORMAT = 1
+# the stages of a conversion timed by the scaling benchmark, in order.
+STAGES = ('read', 'parse', 'convert')
+
+
+class EasyTraxBenchmark:
+    """Times EasyTraxParse on real reports, so changes to the parser can be checked for speed.
+
+    Currently compares the two column modes of EasyTraxTable (split and fixed-width) on the same reports. Each
+    report is parsed repeat times in each mode, and the best time of each is kept (the best time is the one least
+    affected by whatever else the computer is doing). The parsed samples_dictionary of both modes is also compared,
+    so a speed up that changes the output is caught.
+
+    Can be run from the command line:
+
+        python EasyTraxBenchmark.py columns W161000.txt W161001.txt
+
+    Attributes
+    ----------
+    report_paths : list(str)
+        the reports to benchmark.
+
+    repeat : int
+        the amount of times each report is parsed in each mode.
+
+    results : list(dict)
+        one dictionary per report, as returned by benchmark_column_modes().
+
+    Methods
+    -------
+    * `compare_column_modes()` -
+        benchmarks every report in report_paths, filling results.
+
+    * `format_column_mode_table()` -
+        formats results into a table, one row per report.
+    """
+
+    def __init__(self, report_paths, repeat=5):
+        """
+        Parameters
+        ----------
+        report_paths : list(str)
+            the reports to benchmark.
+        repeat : int
+            the amount of times each report is parsed in each mode.
+        """
+
+        self.report_paths = report_paths
+        self.repeat = repeat
+        self.results = []
+
+    def compare_column_modes(self):
+        """benchmarks every report in report_paths in both column modes, filling results."""
+
+        self.results = []
+        for report_path in self.report_paths:
+            mb_file_contents = Input.read_report_lines(report_path)
+            result = benchmark_column_modes(mb_file_contents, self.repeat)
+            result['report path'] = report_path
+            self.results.append(result)
+
+    def format_column_mode_table(self):
+        """formats results into a table, one row per report.
+
+        Returns
+        -------
+        table : str
+            the table, one line per report.
+        """
+
+        table_lines = ['%-30s %8s %12s %12s %8s %6s' % ('Report', 'Lines', 'Split (ms)', 'Fixed (ms)', 'Speedup',
+                                                        'Same')]
+        for result in self.results:
+            table_lines.append('%-30s %8d %12.3f %12.3f %7.2fx %6s' % (result['report path'][-30:],
+                                                                     result['lines'],
+                                                                     result['split seconds'] * 1000,
+                                                                     result['fixed-width seconds'] * 1000,
+                                                                     result['split seconds'] /
+                                                                     max(result['fixed-width seconds'], 1e-9),
+                                                                     'yes' if result['same result'] else 'NO'))
+        return '\n'.join(table_lines)
+
+
+class EasyTraxScalingBenchmark:
+    """Times each stage of a conversion (reading the report, EasyTraxParse, and EasyTraxConvert) on made-up reports
+    of growing size, so it can be seen how EasyTrax scales, and whether a change made it slower.
+
+    A report is made for each sample count with EasyTraxSynthetic (the same settings always make the same report),
+    written to a temporary directory, and converted repeat times. The best time of each stage is kept. The report is
+    then converted once more with tracemalloc running, to get the peak memory of each stage (tracemalloc slows
+    everything down, so the timed runs don't use it).
+
+    The results can be saved as JSON, along with the commit, Python version and settings they were made with, and
+    a saved file can be passed back in to compare against:
+
+        python EasyTraxBenchmark.py scaling -n 10 100 1000 -o before.json
+        python EasyTraxBenchmark.py scaling -n 10 100 1000 -o after.json --compare before.json
+
+    Attributes
+    ----------
+    sample_counts : list(int)
+        the amount of samples in each report.
+
+    tables : int
+        the amount of horizontal tables in each report.
+
+    analytes : int
+        the amount of analytes in each horizontal table.
+
+    repeat : int
+        the amount of times each report is converted.
+
+    column_mode : str
+        'split' or 'fixed-width', see EasyTraxParse.
+
+    results : list(dict)
+        one dictionary per report, as returned by benchmark_stages().
+
+    Methods
+    -------
+    * `run()` -
+        benchmarks a report of each size, filling results.
+
+    * `as_json()` -
+        returns the results, and what they were made with, as a dictionary.
+
+    * `write_json(results_path)` -
+        saves as_json() to a file.
+
+    * `format_scaling_table(previous=None)` -
+        formats results into a table, one row per report, compared to previous results if given.
+    """
+
+    def __init__(self, sample_counts, tables=2, analytes=5, repeat=3, column_mode=EasyTraxTable.SPLIT_COLUMNS):
+        """
+        Parameters
+        ----------
+        sample_counts : list(int)
+            the amount of samples in each report.
+        tables : int
+            the amount of horizontal tables in each report.
+        analytes : int
+            the amount of analytes in each horizontal table.
+        repeat : int
+            the amount of times each report is converted.
+        column_mode : str
+            'split' or 'fixed-width'.
+        """
+
+        self.sample_counts = sample_counts
+        self.tables = tables
+        self.analytes = analytes
+        self.repeat = repeat
+        self.column_mode = column_mode
+        self.results = []
+
+    def run(self):
+        """makes and benchmarks a report of each size, filling results."""
+
+        self.results = []
+        with tempfile.TemporaryDirectory() as temporary_directory:
+            for samples in self.sample_counts:
+                report = Synthetic.EasyTraxSyntheticReport(samples, self.tables, self.analytes)
+                report_path = os.path.join(temporary_directory, report.job_number + '.txt')
+                Synthetic.write_report(report_path, report.generate())
+                result = benchmark_stages(report_path, os.path.join(temporary_directory, 'WTX_reports'),
+                                          self.repeat, self.column_mode)
+                result['samples'] = samples
+                self.results.append(result)
+
+    def as_json(self):
+        """returns the results, and the commit, Python version, settings and time they were made with.
+
+        Returns
+        -------
+        results_json : dict
+            ready for json.dump().
+        """
+
+        return {'format': RESULTS_FORMAT,
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'commit': get_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'settings': {'tables': self.tables,
+                             'analytes': self.analytes,
+                             'repeat': self.repeat,
+                             'column mode': self.column_mode},
+                'results': self.results}
+
+    def write_json(self, results_path):
+        """saves as_json() to results_path."""
+
+        with open(results_path, 'w') as results_file:
+            json.dump(self.as_json(), results_file, indent=2)
+
+    def format_scaling_table(self, previous=None):
+        """formats results into a table, one row per report.
+
+        Parameters
+        ----------
+        previous : dict
+            results saved by an earlier run (see load_results). If given, each row also shows how the total time
+            compares to the report with the same sample count in previous (ex. 1.10x is 10% slower).
+
+        Returns
+        -------
+        table : str
+            the table, one line per report.
+        """
+
+        previous_results = {}
+        if previous is not None:
+            previous_results = {result['samples']: result for result in previous['results']}
+        table_lines = ['%8s %8s %10s %10s %12s %10s %10s %8s' % ('Samples', 'Lines', 'Read (ms)', 'Parse (ms)',
+                                                                  'Convert (ms)', 'Total (ms)', 'Peak (KiB)',
+                                                                  'Change')]
+        for result in self.results:
+            change = ''
+            if result['samples'] in previous_results:
+                change = '%.2fx' % (result['total seconds'] /
+                                    max(previous_results[result['samples']]['total seconds'], 1e-9))
+            table_lines.append('%8d %8d %10.3f %10.3f %12.3f %10.3f %10d %8s' % (
+                result['samples'],
+                result['lines'],
+                result['read seconds'] * 1000,
+                result['parse seconds'] * 1000,
+                result['convert seconds'] * 1000,
+                result['total seconds'] * 1000,
+                max(result[stage + ' peak bytes'] for stage in STAGES) // 1024,
+                change))
+        return '\n'.join(table_lines)
+
+
+def time_parse(mb_file_contents, repeat, **parse_options):
+    """parses a report repeat times, and returns the best time and the parsed samples_dictionary.
+
+    Parameters
+    ----------
+    mb_file_contents : list(str)
+        the lines of the report.
+    repeat : int
+        the amount of times to parse the report.
+    parse_options
+        passed on to EasyTraxParse (ex. column_mode).
+
+    Returns
+    -------
+    best_seconds, samples_dictionary : float, dict
+    """
+
+    best_seconds = None
+    samples_dictionary = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        samples_dictionary = Parse.EasyTraxParse('', mb_file_contents, **parse_options).easy_trax_parse_controller()[0]
+        seconds = time.perf_counter() - start
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    return best_seconds, samples_dictionary
+
+
+def benchmark_column_modes(mb_file_contents, repeat=5):
+    """parses one report in both column modes.
+
+    Returns
+    -------
+    result : dict
+        the amount of lines, the best time of each mode, and whether both modes gave the same samples_dictionary.
+    """
+
+    split_seconds, split_samples = time_parse(mb_file_contents, repeat, column_mode=EasyTraxTable.SPLIT_COLUMNS)
+    fixed_seconds, fixed_samples = time_parse(mb_file_contents, repeat, column_mode=EasyTraxTable.FIXED_WIDTH_COLUMNS)
+    return {'lines': len(mb_file_contents),
+            'split seconds': split_seconds,
+            'fixed-width seconds': fixed_seconds,
+            'same result': split_samples == fixed_samples}
+
+
+def benchmark_stages(report_path, wtx_reports_directory, repeat=3, column_mode=EasyTraxTable.SPLIT_COLUMNS):
+    """converts one report repeat times, timing each stage, then once more measuring the peak memory of each stage.
+
+    Parameters
+    ----------
+    report_path : str
+        the report to convert.
+    wtx_reports_directory : str
+        the directory to write the WTX report under.
+    repeat : int
+        the amount of timed conversions.
+    column_mode : str
+        'split' or 'fixed-width'.
+
+    Returns
+    -------
+    result : dict
+        the amount of lines, samples parsed and WTX lines written, and for each stage in STAGES the best time
+        ('<stage> seconds') and the peak memory allocated while it ran ('<stage> peak bytes'). 'total seconds' is the
+        sum of the best times.
+    """
+
+    result = {'lines': 0, 'samples parsed': 0, 'wtx lines': 0}
+    for stage in STAGES:
+        result[stage + ' seconds'] = None
+    for _ in range(repeat):
+        stage_seconds = run_stages(report_path, wtx_reports_directory, column_mode, result)
+        for stage in STAGES:
+            if result[stage + ' seconds'] is None or stage_seconds[stage] < result[stage + ' seconds']:
+                result[stage + ' seconds'] = stage_seconds[stage]
+    result['total seconds'] = sum(result[stage + ' seconds'] for stage in STAGES)
+    tracemalloc.start()
+    try:
+        stage_peaks = run_stages(report_path, wtx_reports_directory, column_mode, result, measure_memory=True)
+    finally:
+        tracemalloc.stop()
+    for stage in STAGES:
+        result[stage + ' peak bytes'] = stage_peaks[stage]
+    return result
+
+
+def run_stages(report_path, wtx_reports_directory, column_mode, result, measure_memory=False):
+    """reads, parses and converts a report once, the same way EasyTraxBatch does.
+
+    Parameters
+    ----------
+    result : dict
+        the line, sample and WTX line counts are written to it.
+    measure_memory : bool
+        if True (tracemalloc must be running), the peak memory of each stage is returned rather than its time.
+
+    Returns
+    -------
+    stage_measures : dict
+        stage : seconds, or peak bytes if measure_memory is True.
+    """
+
+    stage_measures = {}
+
+    def start_stage():
+        if measure_memory:
+            tracemalloc.reset_peak()
+            return tracemalloc.get_traced_memory()[0]
+        return time.perf_counter()
+
+    def end_stage(stage, stage_start):
+        if measure_memory:
+            stage_measures[stage] = tracemalloc.get_traced_memory()[1] - stage_start
+        else:
+            stage_measures[stage] = time.perf_counter() - stage_start
+
+    stage_start = start_stage()
+    mb_file_contents = Input.read_report_lines(report_path)
+    end_stage('read', stage_start)
+    stage_start = start_stage()
+    job_number = os.path.splitext(os.path.basename(report_path))[0][1:]
+    samples_dictionary, job_dictionary, parse_log = Parse.EasyTraxParse(
+        job_number, mb_file_contents, column_mode=column_mode).easy_trax_parse_controller()
+    end_stage('parse', stage_start)
+    stage_start = start_stage()
+    converting_script = Convert.EasyTraxConvert(samples_dictionary, job_dictionary, wtx_reports_directory)
+    converting_script.easy_trax_convert_controller()
+    end_stage('convert', stage_start)
+    result['lines'] = len(mb_file_contents)
+    result['samples parsed'] = len(samples_dictionary)
+    result['wtx lines'] = converting_script.wtx_lines_written
+    return stage_measures
+
+
+def get_commit():
+    """returns the git commit the benchmark is being run on, or None if it can't be found (ex. not a git checkout)."""
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_results(results_path):
+    """returns scaling results saved by EasyTraxScalingBenchmark.write_json().
+
+    Raises
+    ------
+    ValueError
+        if the file was saved in a different RESULTS_FORMAT.
+    """
+
+    with open(results_path, 'r') as results_file:
+        results = json.load(results_file)
+    if results.get('format') != RESULTS_FORMAT:
+        raise ValueError(results_path + ' is not a scaling results file of format ' + str(RESULTS_FORMAT))
+    return results
+
+
+def main(argv=None):
+    """command line entry point.
+
+    Returns
+    -------
+    int
+        0, or 1 if the column modes gave different results for any report (columns command).
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark the EasyTrax parser.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    columns = commands.add_parser('columns', help='compare the split and fixed-width column modes on reports.')
+    columns.add_argument('reports', nargs='+', help='the reports to parse.')
+    columns.add_argument('-r', '--repeat', type=int, default=5, help='times to parse each report in each mode.')
+    scaling = commands.add_parser('scaling', help='time each stage on made-up reports of growing size.')
+    scaling.add_argument('-n', '--samples', type=int, nargs='+', default=[10, 100, 1000],
+                         help='sample counts, one report each.')
+    scaling.add_argument('-t', '--tables', type=int, default=2, help='horizontal tables in each report.')
+    scaling.add_argument('-a', '--analytes', type=int, default=5, help='analytes in each horizontal table.')
+    scaling.add_argument('-r', '--repeat', type=int, default=3, help='times to convert each report.')
+    scaling.add_argument('--fixed-width', action='store_true',
+                         help='read data tables by column position rather than by splitting on spaces.')
+    scaling.add_argument('-o', '--output', default=None, help='save the results to this JSON file.')
+    scaling.add_argument('--compare', default=None, help='compare against results saved by an earlier run.')
+    args = parser.parse_args(argv)
+    if args.command == 'scaling':
+        previous = load_results(args.compare) if args.compare else None
+        scaling_benchmark = EasyTraxScalingBenchmark(args.samples, args.tables, args.analytes, args.repeat,
+                                                     'fixed-width' if args.fixed_width else 'split')
+        scaling_benchmark.run()
+        print(scaling_benchmark.format_scaling_table(previous))
+        if args.output:
+            scaling_benchmark.write_json(args.output)
+        return 0
+    benchmark = EasyTraxBenchmark(args.reports, args.repeat)
+    benchmark.compare_column_modes()
+    print(benchmark.format_column_mode_table())
+    if [result for result in benchmark.results if not result['same result']]:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
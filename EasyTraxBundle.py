@@ -0,0 +1,311 @@
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import EasyTraxShare as Share
+
+
+# the most lines, and bytes, in one upload file. Big enough for a busy week of one client, small enough to upload.
+DEFAULT_MAX_LINES = 20000
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024
+MANIFEST_NAME = 'manifest.json'
+# bump if the layout of the manifest changes.
+MANIFEST_FORMAT = 1
+# the field of a WTX line holding the WaterTrax client ID (see EasyTraxConvert.generate_water_trax_report_lines).
+CLIENT_ID_FIELD = 5
+
+
+class EasyTraxBundle:
+    """Merges the WTX reports of many jobs into a few upload files, one set per WaterTrax client.
+
+    EasyTraxConvert writes one WTX file per job (WTX_reports\\<job>\\<job>.txt), so a busy week means dozens of
+    separate uploads. A WTX file can hold the lines of any amount of reports, as long as they are for the same client
+    (every line carries the client ID, from WaterTraxRequiredFileFieldDict[6]), so this class groups the jobs by
+    client ID, and writes the lines of each group into upload files, called shards.
+
+    A shard holds at most max_lines lines and max_bytes bytes. Jobs are kept whole where they can be: a job that
+    doesn't fit in the current shard starts a new one. Only a job bigger than a whole shard is split over more than
+    one. Jobs without a client ID (the client isn't in EasyTraxCodes.json) can't be uploaded, and are left out.
+
+    Shards are named <client ID>_<shard number>.txt, and written to bundle_directory with a manifest.json listing
+    which jobs (and how many of their lines) went into which shard. Shards left over from the last bundle written
+    there are removed, so the directory always matches its manifest.
+
+    Can be run from the command line, on WTX reports that have already been made:
+
+        python EasyTraxBundle.py "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\WTX_reports" -o Uploads
+
+    or with --bundle in EasyTraxBatch.py and EasyTraxSplit.py, on the jobs they convert.
+
+    Attributes
+    ----------
+    bundle_directory : str
+        the directory the shards and manifest are written to.
+
+    max_lines : int
+        the most lines in one shard.
+
+    max_bytes : int
+        the most bytes in one shard.
+
+    reports : list(tuple)
+        (job number, WTX report path) of each job added, in the order they were added.
+
+    shards : list(dict)
+        one dictionary per shard written: its file name, client ID, line and byte counts, and jobs.
+
+    skipped : list(dict)
+        the job number, and reason, of each job left out.
+
+    Methods
+    -------
+    * `add_report(job_number, wtx_path)` -
+        adds the WTX report of a job to the bundle.
+
+    * `write()` -
+        groups the reports by client, writes the shards and the manifest, and returns the manifest.
+
+        * `read_report_lines(job_number, wtx_path)` -
+            returns the client ID and lines of one WTX report.
+
+        * `write_shard(client_id, shard_lines, shard_bytes, shard_jobs)` -
+            writes one shard, and adds it to shards.
+
+        * `remove_old_shards(shard_names)` -
+            removes shards listed in the previous manifest that aren't part of this one.
+
+    * `format_bundle_table()` -
+        formats shards into a table, one row per shard.
+    """
+
+    def __init__(self, bundle_directory, max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Parameters
+        ----------
+        bundle_directory : str
+            the directory to write the shards and manifest to. Made if needed.
+        max_lines : int
+            the most lines in one shard.
+        max_bytes : int
+            the most bytes in one shard.
+        """
+
+        if max_lines < 1 or max_bytes < 1:
+            raise ValueError('max_lines and max_bytes must be at least 1')
+        self.bundle_directory = bundle_directory
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.reports = []
+        self.shards = []
+        self.skipped = []
+
+    def add_report(self, job_number, wtx_path):
+        """adds the WTX report of a job to the bundle. Nothing is read until write().
+
+        Parameters
+        ----------
+        job_number : str
+            the job number (ex. 'W161000').
+        wtx_path : str
+            the full path of the job's WTX report.
+        """
+
+        self.reports.append((job_number, wtx_path))
+
+    def write(self):
+        """groups the reports by client ID, and writes them into shards, and the manifest.
+
+        within a client, jobs are kept in the order they were added.
+
+        Returns
+        -------
+        manifest : dict
+            what was written to manifest.json.
+        """
+
+        clients = {}
+        self.shards = []
+        self.skipped = []
+        for job_number, wtx_path in self.reports:
+            client_id, report_lines = self.read_report_lines(job_number, wtx_path)
+            if report_lines:
+                clients.setdefault(client_id, []).append((job_number, report_lines))
+        os.makedirs(self.bundle_directory, exist_ok=True)
+        for client_id, jobs in clients.items():
+            shard_lines = []
+            shard_bytes = 0
+            shard_jobs = []
+            for job_number, report_lines in jobs:
+                job_bytes = sum(len(line) for line in report_lines)
+                if shard_lines and (len(shard_lines) + len(report_lines) > self.max_lines or
+                                    shard_bytes + job_bytes > self.max_bytes):
+                    # doesn't fit, the job starts the next shard
+                    self.write_shard(client_id, shard_lines, shard_bytes, shard_jobs)
+                    shard_lines, shard_bytes, shard_jobs = [], 0, []
+                job_lines_in_shard = 0
+                for line in report_lines:
+                    if shard_lines and (len(shard_lines) + 1 > self.max_lines or
+                                        shard_bytes + len(line) > self.max_bytes):
+                        # only a job bigger than a whole shard gets here
+                        shard_jobs.append({'job number': job_number, 'lines': job_lines_in_shard, 'split': True})
+                        self.write_shard(client_id, shard_lines, shard_bytes, shard_jobs)
+                        shard_lines, shard_bytes, shard_jobs = [], 0, []
+                        job_lines_in_shard = 0
+                    shard_lines.append(line)
+                    shard_bytes += len(line)
+                    job_lines_in_shard += 1
+                shard_jobs.append({'job number': job_number, 'lines': job_lines_in_shard,
+                                   'split': job_lines_in_shard != len(report_lines)})
+            if shard_lines:
+                self.write_shard(client_id, shard_lines, shard_bytes, shard_jobs)
+        self.remove_old_shards([shard['file'] for shard in self.shards])
+        manifest = {'format': MANIFEST_FORMAT,
+                    'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'max lines': self.max_lines,
+                    'max bytes': self.max_bytes,
+                    'shards': self.shards,
+                    'skipped': self.skipped}
+        with Share.replacing_file(os.path.join(self.bundle_directory, MANIFEST_NAME)) as manifest_file:
+            manifest_file.write(json.dumps(manifest, indent=1).encode('utf-8'))
+        return manifest
+
+    def read_report_lines(self, job_number, wtx_path):
+        """returns the client ID and lines of one WTX report. A report that can't be read, is empty, or has no client
+        ID is added to skipped instead.
+
+        the lines are kept as bytes, exactly as they are in the file, so the size of a shard is known exactly.
+
+        Returns
+        -------
+        client_id, report_lines : str, list(bytes)
+            report_lines is empty if the report was skipped.
+        """
+
+        try:
+            with open(wtx_path, 'rb') as wtx_file:
+                report_lines = wtx_file.read().splitlines(True)
+        except OSError as exc:
+            self.skipped.append({'job number': job_number, 'reason': type(exc).__name__ + ': ' + str(exc)})
+            return None, []
+        if not report_lines:
+            self.skipped.append({'job number': job_number, 'reason': 'no WTX lines'})
+            return None, []
+        if not report_lines[-1].endswith(b'\n'):
+            report_lines[-1] += b'\n'
+        fields = report_lines[0].split(b'|')
+        client_id = fields[CLIENT_ID_FIELD].decode('ascii', 'replace') if len(fields) > CLIENT_ID_FIELD else ''
+        if not client_id.isdigit():
+            self.skipped.append({'job number': job_number, 'reason': 'no client ID'})
+            return None, []
+        return client_id, report_lines
+
+    def write_shard(self, client_id, shard_lines, shard_bytes, shard_jobs):
+        """writes one shard, and adds it to shards."""
+
+        shard_number = len([shard for shard in self.shards if shard['client id'] == client_id]) + 1
+        shard_name = '%s_%03d.txt' % (client_id, shard_number)
+        with Share.replacing_file(os.path.join(self.bundle_directory, shard_name)) as shard_file:
+            shard_file.writelines(shard_lines)
+        self.shards.append({'file': shard_name,
+                            'client id': client_id,
+                            'lines': len(shard_lines),
+                            'bytes': shard_bytes,
+                            'jobs': shard_jobs})
+
+    def remove_old_shards(self, shard_names):
+        """removes the shards listed in the manifest already in bundle_directory, if they aren't in shard_names."""
+
+        try:
+            with open(os.path.join(self.bundle_directory, MANIFEST_NAME), 'r') as manifest_file:
+                old_manifest = json.load(manifest_file)
+            old_shard_names = [shard['file'] for shard in old_manifest['shards']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        for shard_name in old_shard_names:
+            if shard_name not in shard_names and os.path.basename(shard_name) == shard_name:
+                try:
+                    os.remove(os.path.join(self.bundle_directory, shard_name))
+                except OSError:
+                    pass
+
+    def format_bundle_table(self):
+        """formats shards into a table, one row per shard, followed by the jobs that were left out.
+
+        Returns
+        -------
+        table : str
+            the table.
+        """
+
+        table_lines = ['%-16s %10s %8s %10s  %s' % ('Shard', 'Client ID', 'Lines', 'Bytes', 'Jobs')]
+        for shard in self.shards:
+            table_lines.append('%-16s %10s %8d %10d  %s' % (shard['file'], shard['client id'], shard['lines'],
+                                                            shard['bytes'],
+                                                            ', '.join(job['job number'] + (' (part)' if job['split']
+                                                                                           else '')
+                                                                      for job in shard['jobs'])))
+        for skipped in self.skipped:
+            table_lines.append(skipped['job number'] + ' left out: ' + skipped['reason'])
+        return '\n'.join(table_lines)
+
+
+def bundle_job_results(job_results, bundle_directory, max_lines=DEFAULT_MAX_LINES, max_bytes=DEFAULT_MAX_BYTES):
+    """bundles the WTX reports of the jobs that converted, from EasyTraxBatch or EasyTraxSplit.
+
+    Parameters
+    ----------
+    job_results : list(dict)
+        as returned by EasyTraxBatch.convert_report_lines(). Jobs that failed, or have nothing to upload, are left
+        out. The 'upload path' of each job is used, so in replacement mode only the replacement reports are bundled.
+    bundle_directory, max_lines, max_bytes
+        see EasyTraxBundle.
+
+    Returns
+    -------
+    bundle : EasyTraxBundle
+        the written bundle.
+    """
+
+    bundle = EasyTraxBundle(bundle_directory, max_lines, max_bytes)
+    for job_result in job_results:
+        if job_result['status'] == 'ok' and job_result.get('upload path'):
+            bundle.add_report(job_result['job number'], job_result['upload path'])
+    bundle.write()
+    return bundle
+
+
+def main(argv=None):
+    """command line entry point. Bundles every WTX report under a directory, prints the shards.
+
+    Returns
+    -------
+    int
+        0, or 1 if no reports were found.
+    """
+
+    parser = argparse.ArgumentParser(description='Merge WTX reports into a few upload files per WaterTrax client.')
+    parser.add_argument('wtx_reports_directory', help='directory holding the WTX reports (usually WTX_reports).')
+    parser.add_argument('-o', '--output', required=True, help='directory to write the upload files to.')
+    parser.add_argument('--max-lines', type=int, default=DEFAULT_MAX_LINES, help='the most lines in one file.')
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES, help='the most bytes in one file.')
+    args = parser.parse_args(argv)
+    # each report is in a folder named after its job: WTX_reports\W161000\W161000.txt. Replacement reports
+    # (W161000_R.txt, see EasyTraxConvert.write_replacement_report) repeat the lines of the report, so are left out.
+    wtx_paths = [wtx_path for wtx_path in sorted(glob.glob(os.path.join(args.wtx_reports_directory, '*', '*.txt')))
+                 if not os.path.splitext(wtx_path)[0].endswith('_R')]
+    if not wtx_paths:
+        print('No WTX reports found in ' + args.wtx_reports_directory)
+        return 1
+    bundle = EasyTraxBundle(args.output, args.max_lines, args.max_bytes)
+    for wtx_path in wtx_paths:
+        bundle.add_report(os.path.splitext(os.path.basename(wtx_path))[0], wtx_path)
+    bundle.write()
+    print(bundle.format_bundle_table())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
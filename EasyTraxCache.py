@@ -0,0 +1,265 @@
+import hashlib
+import os
+import pickle
+
+import EasyTraxDiagnostics as Diagnostics
+import EasyTraxModel as Model
+import EasyTraxParse as Parse
+import EasyTraxShare as Share
+
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'tables')
+# the most disk space (in bytes) the cache is allowed to use before the least recently used tables are removed.
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# bump if the layout of the cached tables changes, so old entries are never used.
+CACHE_FORMAT = 1
+
+
+class EasyTraxTableCache:
+    """Keeps the parsed result of every data table on disk, so a report that is run again only has its changed tables
+    parsed again.
+
+    The usual way to fix a report is to run it, read the log, fix one table by hand (ex. 'Domoic Acid' to
+    'Domoic_Acid'), and run it again. Every other table in the report is exactly the same as the first time, so
+    EasyTraxParse asks the cache for each table before parsing it. Each table is looked up by a hash of its text (and
+    its kind, the column mode, and the version of the parser), so an edited table is simply a different entry.
+
+    The finished result of each report (its samples_dictionary, job_dictionary, and parse_log) is cached too, under
+    a hash of the whole report, so a report that hasn't changed at all isn't parsed or merged again.
+
+    Each table (and report) is kept in its own file in cache_directory. When the files take up more than max_bytes,
+    the entries that were used least recently are removed (see trim()).
+
+    Attributes
+    ----------
+    cache_directory : str
+        the directory the cached entries are kept in.
+
+    max_bytes : int
+        the most disk space the cached entries can use.
+
+    hits : int
+        the amount of tables and reports read from the cache.
+
+    misses : int
+        the amount of tables and reports that weren't in the cache.
+
+    Methods
+    -------
+    * `get_key(table)` -
+        returns the hash a table is cached under.
+
+    * `get_report_key(mb_file, column_mode)` -
+        returns the hash a whole report is cached under.
+
+    * `get(table)` -
+        returns the cached result of a table, or None.
+
+    * `put(table, table_data)` -
+        caches the result of a table.
+
+    * `get_report(mb_file, column_mode)` -
+        returns the cached result of a whole report, or None.
+
+    * `put_report(mb_file, column_mode, report_data)` -
+        caches the result of a whole report.
+
+    * `get_entry(key)` / `put_entry(key, data)` -
+        read and write one cached file.
+
+    * `trim()` -
+        removes the least recently used entries until the cache fits in max_bytes.
+    """
+
+    def __init__(self, cache_directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        Parameters
+        ----------
+        cache_directory : str
+            the directory to keep the cached entries in. Made when the first entry is cached.
+        max_bytes : int
+            the most disk space the cached entries can use.
+        """
+
+        self.cache_directory = cache_directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, table):
+        """returns the hash a table is cached under.
+
+        Parameters
+        ----------
+        table : EasyTraxParse.EasyTraxTable
+            the table.
+
+        Returns
+        -------
+        key : str
+            the sha256 of the table's text, kind, and column mode, and of the parser.
+        """
+
+        return hash_lines(table.raw_lines, 'table', table.kind, table.column_mode)
+
+    def get_report_key(self, mb_file, column_mode):
+        """returns the hash a whole report is cached under.
+
+        Parameters
+        ----------
+        mb_file : list(str)
+            the lines of the report.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+
+        Returns
+        -------
+        key : str
+            the sha256 of the report's text and column mode, and of the parser.
+        """
+
+        return hash_lines(mb_file, 'report', column_mode)
+
+    def get_filename(self, key):
+        """returns the file the entry for key is kept in."""
+
+        return os.path.join(self.cache_directory, key + '.pickle')
+
+    def get(self, table):
+        """returns the cached result of a table, or None if it isn't cached.
+
+        Parameters
+        ----------
+        table : EasyTraxParse.EasyTraxTable
+            the table.
+
+        Returns
+        -------
+        table_data
+            the result of table.parse(), or None.
+        """
+
+        return self.get_entry(self.get_key(table))
+
+    def put(self, table, table_data):
+        """caches the result of a table.
+
+        Parameters
+        ----------
+        table : EasyTraxParse.EasyTraxTable
+            the table.
+        table_data
+            the result of table.parse().
+        """
+
+        self.put_entry(self.get_key(table), table_data)
+
+    def get_report(self, mb_file, column_mode):
+        """returns the cached result of a whole report, or None if it isn't cached.
+
+        Returns
+        -------
+        report_data : tuple
+            (samples_dictionary, job_dictionary, parse_log), as returned by
+            EasyTraxParse.easy_trax_parse_controller(), or None.
+        """
+
+        return self.get_entry(self.get_report_key(mb_file, column_mode))
+
+    def put_report(self, mb_file, column_mode, report_data):
+        """caches the result of a whole report, (samples_dictionary, job_dictionary, parse_log)."""
+
+        self.put_entry(self.get_report_key(mb_file, column_mode), report_data)
+
+    def get_entry(self, key):
+        """returns what is cached under key, or None if nothing is (or the cached file can't be read).
+
+        an entry that is found has its file's modified time updated, which is what trim() uses to work out which
+        entries were used least recently.
+        """
+
+        filename = self.get_filename(key)
+        try:
+            with open(filename, 'rb') as cache_file:
+                data = pickle.load(cache_file)
+            os.utime(filename)
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError, ImportError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put_entry(self, key, data):
+        """caches data under key, via a temporary file so other processes never see half an entry. If it can't be
+        written (ex. read only share), nothing happens."""
+
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            with Share.replacing_file(self.get_filename(key)) as cache_file:
+                pickle.dump(data, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError:
+            pass
+
+    def trim(self):
+        """removes the least recently used entries until the cache fits in max_bytes.
+
+        Returns
+        -------
+        removed : int
+            the amount of entries removed.
+        """
+
+        try:
+            entries = [entry for entry in os.scandir(self.cache_directory) if entry.name.endswith('.pickle')]
+        except OSError:
+            return 0
+        cached_files = []
+        total_bytes = 0
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            cached_files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+        removed = 0
+        for modified_time, size, path in sorted(cached_files):
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+        return removed
+
+
+def hash_lines(lines, *labels):
+    """returns the sha256 of some lines of a report, along with the labels given, CACHE_FORMAT, and the parser."""
+
+    lines_hash = hashlib.sha256()
+    lines_hash.update('|'.join((str(CACHE_FORMAT), get_parser_signature()) + labels).encode('utf-8') + b'\n')
+    for line in lines:
+        lines_hash.update(line.encode('utf-8', 'surrogatepass'))
+    return lines_hash.hexdigest()
+
+
+_parser_signature = None
+
+
+def get_parser_signature():
+    """returns the sha256 of the modules that make and hold parsed data (EasyTraxParse.py, EasyTraxModel.py, and
+    EasyTraxDiagnostics.py), so results cached by an older version of the parser aren't used."""
+
+    global _parser_signature
+    if _parser_signature is None:
+        parser_hash = hashlib.sha256()
+        try:
+            for module in (Parse, Model, Diagnostics):
+                with open(module.__file__, 'rb') as module_file:
+                    parser_hash.update(module_file.read())
+            _parser_signature = parser_hash.hexdigest()
+        except OSError:
+            _parser_signature = 'unknown'
+    return _parser_signature
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from types import MappingProxyType
+
+import EasyTraxShare as Share
+
+
+DEFAULT_CODES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'EasyTraxCodes.json')
+# bump if the layout of the compiled cache changes, so old caches are ignored.
+CACHE_FORMAT = 1
+# the data file versions this module knows how to read.
+SUPPORTED_VERSIONS = (1,)
+# how often (in seconds) get_registry() checks the data file for changes.
+RELOAD_CHECK_SECONDS = 2.0
+
+
+class EasyTraxCodeRegistry:
+    """The WaterTrax code tables (analytes, units, clients, months), loaded once and shared by every conversion.
+
+    The tables live in EasyTraxCodes.json rather than in the python source, so adding a new analyte code or client
+    only means editing the data file. The file looks like:
+
+    * version : the layout version of the file (currently 1).
+
+    * revision : free text, updated whenever the codes are edited (ex. the date).
+
+    * required_file_fields : the version number, transaction purposes, lab ID, and client list.
+
+    * analyte_codes : MB Labs analyte name : [analyte code, WTX description], grouped into sections (miscellaneous,
+      metals, microcystins). Sections are only there to keep the file readable, they are merged together on load.
+
+    * unit_codes : unit : unit code
+
+    * month_codes : MB Labs month abbreviation : WTX month number
+
+    Registries are read only. Use get_registry() rather than making one directly - it keeps one registry per data
+    file for the whole process, and swaps in a new one when the data file changes.
+
+    Attributes
+    ----------
+    data_file : str
+        the full path of the data file the registry was loaded from.
+
+    signature : tuple
+        (modified time, size, sha256) of the data file when it was loaded.
+
+    version : int
+        the layout version of the data file.
+
+    revision : str
+        the revision of the codes in the data file.
+
+    required_file_fields : mapping
+        the same layout EasyTraxConvert has always used for WaterTraxRequiredFileFieldDict:
+        1: version number, 2: transaction purposes, 4: lab ID, 6: ((client name, client identifier, client ID), ...)
+
+    analyte_codes : mapping
+        MB Labs name : (analyte code, WTX description)
+
+    unit_codes : mapping
+        unit : unit code
+
+    month_codes : mapping
+        month abbreviation ('Jan') : month number ('01')
+
+    client_ids : mapping
+        client identifier (as found on the first line of a report) : client ID
+
+    Methods
+    -------
+    * `get_client_id(client_identifier)` -
+        returns the client ID for a client identifier, or None.
+    """
+
+    __slots__ = ('data_file', 'signature', 'version', 'revision', 'required_file_fields', 'analyte_codes',
+                 'unit_codes', 'month_codes', 'client_ids')
+
+    def __init__(self, data_file, signature, tables):
+        """
+        Parameters
+        ----------
+        data_file : str
+            the full path of the data file.
+        signature : tuple
+            (modified time, size, sha256) of the data file.
+        tables : dict
+            the compiled tables, as made by compile_code_tables().
+        """
+
+        set_attribute = object.__setattr__
+        set_attribute(self, 'data_file', data_file)
+        set_attribute(self, 'signature', signature)
+        set_attribute(self, 'version', tables['version'])
+        set_attribute(self, 'revision', tables['revision'])
+        required_file_fields = dict(tables['required_file_fields'])
+        required_file_fields[6] = tuple(tuple(client) for client in required_file_fields[6])
+        set_attribute(self, 'required_file_fields', MappingProxyType(required_file_fields))
+        set_attribute(self, 'analyte_codes', MappingProxyType(tables['analyte_codes']))
+        set_attribute(self, 'unit_codes', MappingProxyType(tables['unit_codes']))
+        set_attribute(self, 'month_codes', MappingProxyType(tables['month_codes']))
+        set_attribute(self, 'client_ids', MappingProxyType(tables['client_ids']))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('EasyTraxCodeRegistry is read only, edit ' + os.path.basename(self.data_file) +
+                             ' instead.')
+
+    def get_client_id(self, client_identifier):
+        """returns the client ID for a client identifier.
+
+        Parameters
+        ----------
+        client_identifier : str
+            the client identifier, as found on the first line of a report (ex. 'BC Ferry').
+
+        Returns
+        -------
+        int or None
+            the 5 digit WaterTrax client ID, or None if the identifier isn't in the client list.
+        """
+
+        return self.client_ids.get(client_identifier)
+
+
+def compile_code_tables(data):
+    """turns the contents of the data file into the tables the registry is built from.
+
+    when the same client identifier is used by more than one client, the last one listed wins, which is what
+    EasyTraxConvert's old search through the client list did.
+
+    Parameters
+    ----------
+    data : dict
+        the decoded contents of the data file.
+
+    Returns
+    -------
+    tables : dict
+        plain dictionaries and tuples only, so it can be pickled into the compiled cache.
+
+    Raises
+    ------
+    ValueError
+        if the data file is a version this module can't read, or is missing a table.
+    """
+
+    if data.get('version') not in SUPPORTED_VERSIONS:
+        raise ValueError('EasyTrax code file version ' + str(data.get('version')) + ' is not supported.')
+    try:
+        fields = data['required_file_fields']
+        clients = tuple((client['name'], client['identifier'], client['client_id']) for client in fields['clients'])
+        analyte_codes = {}
+        for section in data['analyte_codes'].values():
+            for name, code_and_description in section.items():
+                analyte_codes[name] = (code_and_description[0], code_and_description[1])
+        return {'version': data['version'],
+                'revision': data.get('revision', ''),
+                'required_file_fields': {1: fields['version_no'],
+                                         2: tuple(fields['transaction_purposes']),
+                                         4: fields['lab_id'],
+                                         6: clients},
+                'analyte_codes': analyte_codes,
+                'unit_codes': dict(data['unit_codes']),
+                'month_codes': dict(data['month_codes']),
+                'client_ids': {client[1]: client[2] for client in clients}}
+    except (KeyError, IndexError, TypeError, AttributeError) as exc:
+        raise ValueError('EasyTrax code file is missing or has a malformed table: ' + repr(exc))
+
+
+def get_cache_filename(data_file):
+    """returns where the compiled cache for a data file is kept (in __pycache__, next to the data file)."""
+
+    directory, name = os.path.split(data_file)
+    return os.path.join(directory, '__pycache__', os.path.splitext(name)[0] + '.codes-' + str(CACHE_FORMAT) + '.pickle')
+
+
+def load_registry(data_file=DEFAULT_CODES_FILE):
+    """loads a registry from a data file, using the compiled cache if it is still good.
+
+    the cache is used straight away if the data file's modified time and size haven't changed. If they have, the
+    data file is hashed - if the contents are the same (the file was only touched or copied), the cache is still
+    used, otherwise the data file is decoded and compiled again. The cache is rewritten whenever it was out of date.
+    If it can't be written (ex. read only share), the registry is still returned.
+
+    Parameters
+    ----------
+    data_file : str
+        the full path of the data file.
+
+    Returns
+    -------
+    EasyTraxCodeRegistry
+        the registry.
+    """
+
+    stat = os.stat(data_file)
+    cache_filename = get_cache_filename(data_file)
+    cache = None
+    try:
+        with open(cache_filename, 'rb') as cache_file:
+            cache = pickle.load(cache_file)
+        if cache.get('format') != CACHE_FORMAT:
+            cache = None
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        cache = None
+    if cache is not None and cache['mtime_ns'] == stat.st_mtime_ns and cache['size'] == stat.st_size:
+        return EasyTraxCodeRegistry(data_file, (stat.st_mtime_ns, stat.st_size, cache['sha256']), cache['tables'])
+    with open(data_file, 'rb') as code_file:
+        contents = code_file.read()
+    sha256 = hashlib.sha256(contents).hexdigest()
+    if cache is not None and cache['sha256'] == sha256:
+        tables = cache['tables']
+    else:
+        tables = compile_code_tables(json.loads(contents.decode('utf-8')))
+    write_cache(cache_filename, {'format': CACHE_FORMAT,
+                                 'mtime_ns': stat.st_mtime_ns,
+                                 'size': stat.st_size,
+                                 'sha256': sha256,
+                                 'tables': tables})
+    return EasyTraxCodeRegistry(data_file, (stat.st_mtime_ns, stat.st_size, sha256), tables)
+
+
+def write_cache(cache_filename, cache):
+    """writes the compiled cache, via a temporary file so other processes never see half a cache."""
+
+    try:
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+        with Share.replacing_file(cache_filename) as cache_file:
+            pickle.dump(cache, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(data_file=DEFAULT_CODES_FILE):
+    """returns the shared registry for a data file, loading it the first time it is asked for.
+
+    every RELOAD_CHECK_SECONDS, the data file's modified time and size are checked. If either has changed, the
+    registry is reloaded, so a long running converter picks up new codes without being restarted. If the edited
+    file can't be read (ex. it is half saved, or has a typo), the last good registry keeps being used, and the
+    file is tried again at the next check.
+
+    Parameters
+    ----------
+    data_file : str
+        the full path of the data file.
+
+    Returns
+    -------
+    EasyTraxCodeRegistry
+        the registry.
+    """
+
+    data_file = os.path.abspath(data_file)
+    now = time.monotonic()
+    with _registries_lock:
+        entry = _registries.get(data_file)
+        if entry is not None and now - entry[1] < RELOAD_CHECK_SECONDS:
+            return entry[0]
+        if entry is None:
+            registry = load_registry(data_file)
+        else:
+            registry = entry[0]
+            try:
+                stat = os.stat(data_file)
+                if (stat.st_mtime_ns, stat.st_size) != registry.signature[:2]:
+                    registry = load_registry(data_file)
+            except (OSError, ValueError):
+                pass
+        _registries[data_file] = (registry, now)
+        return registry
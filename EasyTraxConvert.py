@@ -1,5 +1,33 @@
 import os.path
 import errno
+import hashlib
+import locale
+
+import EasyTraxCodes as Codes
+import EasyTraxDiagnostics as Diagnostics
+import EasyTraxMetrics as Metrics
+import EasyTraxShare as Share
+
+
+# positions of the fields of a WTX report line that EasyTrax fills in (see generate_water_trax_report_lines). The
+# other fields, up to WTX_FIELD_COUNT, are optional and left empty.
+VERSION_FIELD = 0
+PURPOSE_FIELD = 1
+LAB_ID_FIELD = 3
+CLIENT_ID_FIELD = 5
+LOCATION_FIELD = 6
+REPORT_ID_FIELD = 7
+SAMPLE_ID_FIELD = 9
+DATE_FIELD = 11
+TIME_FIELD = 12
+ANALYTE_CODE_FIELD = 15
+VALUE_FIELD = 16
+UNIT_CODE_FIELD = 17
+WTX_FIELD_COUNT = 30
+
+# WTX reports are written the way a file opened in text mode would write them, in the default encoding, with '\n'
+# written as the line ending of the operating system, as they always have been.
+WTX_ENCODING = locale.getpreferredencoding(False)
 
 
 class EasyTraxConvert:
@@ -7,14 +35,13 @@ class EasyTraxConvert:
 
     when passed a dictionary in the format
 
-    * key : [value1, value2, value3, [list1], [list2], [list3]... [listx]]
+    * key : EasyTraxSample
 
         * where key is the sample name
 
-        * value1, value2, value3 are sample location code, sample date, sample time
-
-        * list1, list2, list3... listx are triplet lists of [analyte, units, value] and
-          x is the total amount of analytes for each sample (can be different for each sample)
+        * the EasyTraxSample (see EasyTraxModel) holds the sample location code, sample date, sample time, and
+          results, a list of EasyTraxResult (analyte, units, value). The amount of results can be different for
+          each sample.
 
     A WTX file is produced from this information.
 
@@ -53,14 +80,63 @@ class EasyTraxConvert:
     samples_dictionary : dict
         the dictionary containing sample information. the format is given in the above pre-amble.
 
+    result_codes : dict
+        (analyte, unit) : (analyte code, unit code), or None if either isn't in the code tables. Each analyte and
+        unit pair is looked up once per job, the first time a result uses it.
+
     job_dictionary: dict
         the dictionary containing job-level information. Currently only the job number and the client identifier.
 
+    wtx_reports_directory: str
+        the directory WTX reports are written under. If None, EASYTRAX_OUTPUT_ROOT is used if it is set, otherwise
+        the WTX_reports folder on the T: drive.
+
     wtx_format_report: list
-        the list where WTX formatted report lines are appended once made.
+        the list where WTX formatted report lines are appended once made. Only filled by
+        populate_water_trax_report_list(), the controller streams lines straight to the report file instead.
+
+    wtx_lines_written: int
+        the amount of WTX formatted report lines produced by the controller.
+
+    wtx_bytes_written: int
+        the size of the WTX report written by the controller, in bytes (0 if it was unchanged, or couldn't be
+        written).
+
+    wtx_report_unchanged: bool
+        True if the WTX report already on disk was the same as the new one, so it wasn't written again.
+
+    wtx_write_error: str
+        why the WTX report couldn't be written (ex. 'PermissionError: ...'), or '' if it was written.
+
+    replacement: bool
+        if True, a replacement report is made as well, if any lines have changed since the WTX report already on disk
+        (see write_replacement_report()).
+
+    wtx_replacement_filename: str
+        the replacement report written, or '' if none was.
+
+    wtx_replacement_error: str
+        in replacement mode, why no replacement report could be made (results were taken out since the WTX report
+        already on disk), or ''. The WTX report on disk is left as it was, so the next run finds the same problem.
+
+    wtx_lines_changed: int
+        in replacement mode, the amount of lines that are new or different since the WTX report already on disk.
+
+    wtx_upload_filename: str
+        the report that should be uploaded to WaterTrax: the WTX report, or in replacement mode, the replacement
+        report (or '' if nothing changed).
+
+    metrics: EasyTraxMetrics.EasyTraxMetrics
+        the time and counters of each stage of easy_trax_convert_controller(), if a metrics object was passed.
+        Otherwise a disabled one, that records nothing.
 
-    convert_log: string
-        log of the conversion process, various errors can change string, returned after conversion is completed.
+    convert_log: EasyTraxDiagnostics.EasyTraxDiagnostics
+        log of the conversion process, various errors add messages to it, returned after conversion is completed.
+        Use str() (or render()) to get the text. An unknown analyte or unit is only written out once, with a count.
+
+    code_registry: EasyTraxCodes.EasyTraxCodeRegistry
+        the shared, read only WaterTrax code tables. The four dictionaries below come from it, and are edited in
+        EasyTraxCodes.json rather than here. A new registry is picked up automatically when the file changes.
 
     WaterTraxRequiredFileFieldDict: dict
         a dictionary containing watertrax information that won't change from day to day, such as:
@@ -86,18 +162,24 @@ class EasyTraxConvert:
     * `easy_trax_convert_controller()` -
         called by EasyTraxTK, the main function that controls the class.
 
+    * `generate_water_trax_report_lines()`
+        yields the WTX report lines for the WTX report one at a time. Gets the hard-set values from
+        WaterTraxRequiredFileFieldDict, gets the client ID using get_water_trax_client_id(), and then iterates through
+        the samples dictionary, turning each triplet list of data into WTX line.
+
     * `populate_water_trax_report_list()`
-        creates the WTX report lines for the WTX report. Gets the hard-set values from WaterTraxRequiredFileFieldDict,
-        gets the client ID using get_water_trax_client_id(), and then iterates through the samples dictionary,
-        turning each triplet list of data into WTX line.
+        collects the lines from generate_water_trax_report_lines() into a list.
 
         * `get_water_trax_client_id()`
-            matches the passed 'job identifier' key in job_dictionary to a corresponding client id in
-            WaterTraxRequiredFileFieldDict[6].
+            looks up the passed 'job identifier' key in job_dictionary in the client ids of code_registry
+            (built from WaterTraxRequiredFileFieldDict[6]).
+
+        * `get_result_codes(result)`
+            returns the analyte code and unit code of a result, looking them up in the code tables the first time
+            the analyte and unit are seen.
 
-        * `convert_triplet_list(triplet_list)`
-            swaps out the mb labs analyte name for an analyte code, the mb labs unit name for a unit code. value isn't
-            changed or looked at at this point.
+        * `log_unknown_analyte_or_unit(result, sample_name)`
+            writes the error message for an analyte or unit that isn't in the code dictionaries to the log.
 
         * `format_watertrax_date()`
             formats the MB labs date format to the WTX format (02-Jan-21 to 01022021)
@@ -113,166 +195,101 @@ class EasyTraxConvert:
         generates the report directories and files. Reports are added to a folder called WTX_reports, and contained
         in this directory in a folder of the same name.
 
+        * `get_wtx_report_filename()`
+            builds the full path of the WTX report for the job, under wtx_reports_directory.
+
+        * `write_wtx_report_lines(report_file, report_lines)`
+            streams the report lines into a temporary file, hashing them as they are written.
+
+        * `wtx_report_is_unchanged(filename, report_size, report_digest)`
+            checks if the WTX report already on disk is the same as the new one.
+
+        * `write_replacement_report(filename, temporary_filename)`
+            in replacement mode, writes the report flagged 'R', if any lines changed since the WTX report at filename.
+
+            * `read_previous_wtx_report(filename)`
+                reads the lines of the WTX report already on disk, by sample ID and analyte code.
+
+            * `compare_wtx_report_lines(report_lines, previous_lines)`
+                counts the new and changed lines, and the lines taken out.
+
+            * `generate_replacement_report_lines(report_lines)`
+                yields the report lines with the transaction purpose 'R'.
+
+            * `get_replacement_report_filename(filename)`
+                returns the name of the replacement report, W161000_R.txt for W161000.txt.
+
         * `mkdir_p()`
             tries to make the desired directory.
 
-        * `safe_open_w()`
-            safely opens the file in order to write to it.
-
     """
 
-    def __init__(self, samples_dictionary, job_dictionary):
+    def __init__(self, samples_dictionary, job_dictionary, wtx_reports_directory=None, metrics=None,
+                 replacement=False):
         self.samples_dictionary = samples_dictionary
         self.job_dictionary = job_dictionary
+        self.wtx_reports_directory = wtx_reports_directory
+        self.replacement = replacement
+        self.wtx_replacement_filename = ''
+        self.wtx_replacement_error = ''
+        self.wtx_lines_changed = 0
+        self.wtx_upload_filename = ''
+        self.result_codes = {}
         self.wtx_format_report = []
-        self.convert_log = ""
-        #WaterTrax File Fields
-        self.WaterTraxRequiredFileFieldDict = {
-                                               # 1) Version No.
-                                               1: "WTX_2.0",
-                                               # 2) Transactional Purpose (Original or Replacement report?)
-                                               2: ["O", "R"],
-                                               # 4) WTX Lab ID
-                                               4: 3393,
-                                               # 6) WTX Client ID
-                                               6: [["BC Ferries", "BC Ferry", 11273],
-                                                   ["City of Cranbrook", "Cranbrook, City", 17573],
-                                                   ["City of Comox", "", 16581],
-                                                   ["City of Campbell River", "", 10625],
-                                                   ["North Salt Spring Waterworks District", "N. Saltspring", 16672]]
-                                               }
-        self.WaterTraxAnalyteCodeDict = {
-                                         # MISCELLANEOUS
-                                         'Alkalinity': [458, 'Alkalinity (total, as CaC03)'],
-                                         'Colour': [225, 'Color'],
-                                         'NH3-N': [175, 'Ammonia (total, as N)'],
-                                         'NO3-N': [361, 'Nitrate (as N)'],
-                                         'NO2-N': [199, 'Nitrite (as N)'],
-                                         'Cl-': [184, 'Chloride'],
-                                         'F-': [188, 'Fluoride'],
-                                         'E.C.': [8, 'Conductivity'],
-                                         'TKN': [689, 'Total Kjeldahl Nitrogen / TKN'],
-                                         'Ortho-PO43--': [748, 'o-Phosphate (as P)'],
-                                         'Ortho-PO43--P': [748, 'o-Phosphate (as P)'],
-                                         'TPO43--P': [3507, 'Phosphate (total, as P)'],
-                                         'D.TPO43--P': [3508, 'Phosphate (dissolved, as P)'],
-                                         'SO42-': [205, 'Sulphate'],
-                                         'S2-': [320, 'Sulphide (total, as H2S)'],
-                                         'T.O.C.': [387, 'Total Organic Carbon / TOC'],
-                                         'T&L': [1220, 'Tannins and Lignins'],
-                                         'TDS': [207, 'Total Dissolved Solids / TDS'],
-                                         'TSS': [15, 'Total Suspended Solids / TSS'],
-                                         'Turbidity': [219, 'Turbidity'],
-                                         'UVT': [1009, 'UV Transmittance'],
-                                         'pH': [228, 'pH'],
-                                         'Hardness (mg/L CaCO3)': [360, 'Hardness (Total, as CaCO3)'],
-                                         'TN': [744, 'Nitrogen (Total)'],
-                                         'Bromate': [181, 'Bromate'],
-                                         # METALS
-                                         'Al': [174, 'Aluminum (Total)'],
-                                         'Al-': [174, 'Aluminum (Total)'],
-                                         'Sb': [176, 'Antimony (Total)'],
-                                         'As': [26, 'Arsenic (Total)'],
-                                         'T.As': [26, 'Arsenic (Total)'],
-                                         'Ba': [178, 'Barium (Total)'],
-                                         'Be': [179, 'Beryllium (Total)'],
-                                         'B': [180, 'Boron (Total)'],
-                                         'Ca': [150, 'Calcium (Total)'],
-                                         'Cd': [182, 'Cadmium (Total)'],
-                                         'Cr': [186, 'Chromium (Total)'],
-                                         'Co': [542, 'Cobalt (Total)'],
-                                         'Cu': [187, 'Copper (Total)'],
-                                         'Au': [1399, 'Gold (Total)'],
-                                         'Fe': [189, 'Iron (Total)'],
-                                         'La': [1400, 'Lanthanum (total)'],
-                                         'Pb': [191, 'Lead (Total)'],
-                                         'Mg': [327, 'Magnesium (Total)'],
-                                         'Mn': [192, 'Manganese (Total)'],
-                                         'Hg': [193, 'Mercury (Total)'],
-                                         'Mo': [194, 'Molybdenum (Total)'],
-                                         'Ni': [195, 'Nickel (Total)'],
-                                         'P': [640, 'Phosphorus (Total)'],
-                                         'K': [514, 'Potassium (Total)'],
-                                         'Sc': [1401, 'Scandium (Total)'],
-                                         'Se': [201, 'Selenium (Total)'],
-                                         'Si': [737, 'Silicon (Total, as Si)'],
-                                         'Ag': [202, 'Silver (Total)'],
-                                         'Na': [203, 'Sodium (Total)'],
-                                         'Sr': [697, 'Strontium (Total)'],
-                                         'Sn': [703, 'Tin (Total)'],
-                                         'Ti': [705, 'Titanium (Total)'],
-                                         'W': [1010, 'Tungsten (Total)'],
-                                         'V': [414, 'Vanadium (Total)'],
-                                         'Zn': [210, 'Zinc (Total)'],
-                                         'U': [526, 'Uranium (Total)'],
-                                         # Microcystins
-                                         'MC-LR': [1235, 'Microcystin-LR'],
-                                         'MC-YR': [4156, 'Microcystin-YR'],
-                                         'MC-RR': [3928, 'Microcystin-RR'],
-                                         'MC-LA': [3965, 'Microcystin-LA'],
-                                         'MC-LF': [4053, 'Microcystin-LF'],
-                                         'MC-LW': [4506, 'Microcystin-LW'],
-                                         'T.MC': [3902, 'Microcystins (total)'],
-                                         'Anatoxin': [4086, 'Anatoxin-a'],
-                                         'Nodularin': [4160, 'Nodularin'],
-                                         'Cylindrospermopsin': [4075, 'Cylindrospermopsin'],
-                                         'Saxitoxins': [4509, 'Saxitoxin'],
-                                         'Domoic_Acid': [4508, 'Domoic Acid']
-                                         }
-        self.WaterTraxUnitsCodeDict = {
-                                       # UNITS
-                                       '(uS/cm)': 369,
-                                       '(mg/L)': 111,
-                                       '(ug/L)': 390,
-                                       '(ug/g)': 449,
-                                       '(%)': 374,
-                                       'pH': 115,
-                                       '(TCU)': 116,
-                                       '(NTU)': 114
-                                       }
-        self.date_dict = {'Jan': '01',
-                          'Feb': '02',
-                          'Mar': '03',
-                          'Apr': '04',
-                          'May': '05',
-                          'Jun': '06',
-                          'Jul': '07',
-                          'Aug': '08',
-                          'Sep': '09',
-                          'Oct': '10',
-                          'Nov': '11',
-                          'Dec': '12'}
+        self.wtx_lines_written = 0
+        self.wtx_bytes_written = 0
+        self.wtx_report_unchanged = False
+        self.wtx_write_error = ''
+        self.metrics = metrics if metrics is not None else Metrics.EasyTraxMetrics.disabled()
+        self.convert_log = Diagnostics.EasyTraxDiagnostics()
+        # WaterTrax code tables, shared by every conversion in the process (see EasyTraxCodes.json)
+        self.code_registry = Codes.get_registry()
+        self.WaterTraxRequiredFileFieldDict = self.code_registry.required_file_fields
+        self.WaterTraxAnalyteCodeDict = self.code_registry.analyte_codes
+        self.WaterTraxUnitsCodeDict = self.code_registry.unit_codes
+        self.date_dict = self.code_registry.month_codes
 
     def easy_trax_convert_controller(self):
         """executes the various methods/functions in the script in the right order.
 
-        is called in EasyTraxTK. Doesn't return anything, output is written to files
-        which are saved onto the computer.
+        is called in EasyTraxTK. The report is only kept if it is different from the one already on disk. Returns
+        the conversion log (an EasyTraxDiagnostics).
+
+        the lines are made as they are streamed into the report file, so making and writing them are one stage
+        ('write') in metrics.
         """
 
-        self.wtx_format_report = self.populate_water_trax_report_list()
-        self.qc_final_wtx_report_error_check()
-        self.generate_report_directories_and_files()
+        with self.metrics.stage('write') as stage:
+            self.generate_report_directories_and_files()
+            stage.count('samples', len(self.samples_dictionary))
+            stage.count('lines emitted', self.wtx_lines_written)
+            stage.count('bytes written', self.wtx_bytes_written)
+            stage.count('reports unchanged', int(self.wtx_report_unchanged))
+            if self.replacement:
+                stage.count('lines changed', self.wtx_lines_changed)
+        with self.metrics.stage('convert checks'):
+            self.qc_final_wtx_report_error_check()
         return self.convert_log
 
-    def populate_water_trax_report_list(self):
-        """writes the lines of watertrax code.
+    def generate_water_trax_report_lines(self):
+        """yields the lines of watertrax code, one at a time, each ending in a newline.
 
         the 5 variables consistent in the report (version_no, transaction_purpose, mb_labs_id, client_id,
-        report_id) are going to be the same for every line. We then iterate through the samples in the samples
-        dictionary. There are 5 variables consistent in the sample (sample_name, sample_id, sample_location,
-        sample_date, sample_time). These will be the same in every line for a particular sample.
-        Finally, for each sample, we go through the triplet list [analyte, unit, value] and create a line for
-        each triplet. Finally, we check for two conditions, and don't add the list if either condition is true:
-        first, that the value is not '---', which indicates that there is no value for the analyte, and that this
-        triplet pair is just a placeholder. The second condition checks to see if the analyte has already been
+        report_id) are going to be the same for every line, so they are joined into job_prefix once. We then iterate
+        through the samples in the samples dictionary. There are 5 variables consistent in the sample (sample_name,
+        sample_id, sample_location, sample_date, sample_time). These are joined onto job_prefix once per sample,
+        making sample_prefix. Finally, for each sample, we go through its results (analyte, unit, value) and
+        create a line for each result. Results whose analyte or unit has no code are logged and skipped (see
+        get_result_codes). We then check for two conditions, and don't yield the line if either condition is
+        true: first, that the value is not '---', which indicates that there is no value for the analyte, and that
+        this result is just a placeholder. The second condition checks to see if the analyte has already been
         included in the report for the sample, which can happen if analytes are included in more than one place
         on the report.
 
-        Returns
-        -------
-        report_lines : list
-            the sample dictionary for a given report converted into WTX format. """
+        Yields
+        ------
+        wtx_format_line : string
+            one line of the report in WTX format, newline included. """
 
         # below variables are the same in every line in the report
         version_no = self.WaterTraxRequiredFileFieldDict[1]
@@ -280,41 +297,48 @@ class EasyTraxConvert:
         mb_labs_id = self.WaterTraxRequiredFileFieldDict[4]
         client_id = self.get_water_trax_client_id()
         report_id = self.job_dictionary['job number']
-        report_lines = []
-        for key, value in self.samples_dictionary.items():
+        job_prefix = '%s|%s|F|%s||%s|' % (version_no, transaction_purpose, mb_labs_id, client_id)
+        result_codes = self.result_codes
+        for key, sample in self.samples_dictionary.items():
             # aka for each sample
-            analytes_reported = []
+            if key == 'Lab Blank':
+                continue
+            analytes_reported = set()
             # below variables are the same in every line for a given sample
-            sample_name = key
-            sample_id = sample_name.split(" ")[0]
-            if sample_name == 'Lab Blank':
-                pass
-            else:
-                sample_location = value[0]
-                sample_date = self.format_watertrax_date(value[1])
-                sample_time = self.format_watertrax_time(value[2])
-                triplet_list = self.convert_triplet_list(value[3:])
-                for value_triplet in triplet_list:
-                    # for each test in the sample
-                    analyte_code = value_triplet[0]
-                    unit_code = value_triplet[1]
-                    value = value_triplet[2]
-                    wtx_format_line = str(version_no) + '|' + str(transaction_purpose) + '|F|' + str(mb_labs_id) +\
-                        '||' + str(client_id) + '|' + str(sample_location) + '|' + str(report_id) + '||' +\
-                        self.job_dictionary['job number'] + '-' + str(sample_id) +\
-                        '||' + str(sample_date) + '|' + str(sample_time) + '|||' + str(analyte_code) +\
-                        '|' + str(value) + '|' + str(unit_code)
-                    if value == '---':
-                        pass
-                    elif analyte_code in analytes_reported:
-                        pass
-                    else:
-                        report_lines.append(wtx_format_line)
-                        analytes_reported.append(analyte_code)
-        return report_lines
+            sample_date = self.format_watertrax_date(sample.date)
+            sample_time = self.format_watertrax_time(sample.time)
+            sample_prefix = '%s%s|%s||%s-%s||%s|%s|||' % (job_prefix, sample.location, report_id, report_id,
+                                                          sample.sample_id, sample_date, sample_time)
+            for result in sample.results:
+                # for each test in the sample
+                try:
+                    codes = result_codes[result.analyte, result.unit]
+                except KeyError:
+                    codes = self.get_result_codes(result)
+                if codes is None:
+                    self.log_unknown_analyte_or_unit(result, key)
+                    continue
+                result_value = result.value
+                if result_value == '---':
+                    continue
+                analyte_code = codes[0]
+                if analyte_code in analytes_reported:
+                    continue
+                analytes_reported.add(analyte_code)
+                yield '%s%s|%s|%s\n' % (sample_prefix, analyte_code, result_value, codes[1])
+
+    def populate_water_trax_report_list(self):
+        """collects the lines made by generate_water_trax_report_lines() into a list.
+
+        Returns
+        -------
+        report_lines : list
+            the sample dictionary for a given report converted into WTX format, one line per item (no newlines). """
+
+        return [wtx_format_line[:-1] for wtx_format_line in self.generate_water_trax_report_lines()]
 
     def get_water_trax_client_id(self):
-        """matches a client identifier token to a client id in WaterTraxRequiredFileFieldDict.
+        """matches a client identifier token to a client id in WaterTraxRequiredFileFieldDict, via code_registry.
 
          if no client ID is found, an error message is returned. Otherwise, returns a 5 digit code
          representing the client the report belongs to from the value corresponding to key : 6.
@@ -325,55 +349,59 @@ class EasyTraxConvert:
             either a 5 digit client identifier (`value_to_return`), or the string 'No client ID'
         """
 
-        client_identifier = self.job_dictionary['client identifier']
-        value_to_return = ""
-        for item in self.WaterTraxRequiredFileFieldDict[6]:
-            if item[1] == client_identifier:
-                value_to_return = item[2]
-        if value_to_return == "":
+        value_to_return = self.code_registry.get_client_id(self.job_dictionary['client identifier'])
+        if value_to_return is None:
             return "No client ID"
         else:
             return value_to_return
 
-    def convert_triplet_list(self, triplet_list):
-        """swaps out the analyte and the unit for an analyte and unit code.
+    def get_result_codes(self, result):
+        """swaps out the analyte and the unit of a result for an analyte and unit code.
 
-        Found in WaterTraxAnalyteCodeDict and WaterTraxUnitsCodeDict respectively. Does not alter the actual value.
-        Might be a good place to check the value isn't '---' in the future.
+        Found in WaterTraxAnalyteCodeDict and WaterTraxUnitsCodeDict respectively, and kept in result_codes, so
+        every other result with the same analyte and unit uses the codes without looking them up again. Does not
+        look at the value.
 
         Parameters
         ----------
-        triplet_list : list
-            a list consisting of [analyte, unit, value]
-
+        result : EasyTraxModel.EasyTraxResult
+            the result, (analyte, unit, value).
 
         Returns
         -------
-        converted_list : list
-            a list consisting of [analyte code, unit code, value]
+        codes : tuple or None
+            (analyte code, unit code), or None if either isn't in the code dictionaries.
+        """
 
-        Raises
-        ------
-        KeyError
-            if an analyte or unit code is not in the required dictionary. Error messaged will be printed to log.
+        try:
+            codes = (self.WaterTraxAnalyteCodeDict[result.analyte][0], self.WaterTraxUnitsCodeDict[result.unit])
+        except KeyError:
+            codes = None
+        self.result_codes[result.analyte, result.unit] = codes
+        return codes
+
+    def log_unknown_analyte_or_unit(self, result, sample_name):
+        """writes the error message for a result whose analyte or unit isn't in the code dictionaries to the log.
+
+        the message is the same for every result with the same analyte and unit, so the log keeps it once, and counts
+        the samples it happened in.
 
+        Parameters
+        ----------
+        result : EasyTraxModel.EasyTraxResult
+            the result, (analyte, unit, value).
+        sample_name : str
+            the name of the sample the result belongs to.
         """
-        converted_list = []
-        # Eventually an error will be thrown here when the analyte or unit is not in the dictionary,
-        # can then handle. 18May21
-        for item in triplet_list:
-            try:
-                converted_list.append([self.WaterTraxAnalyteCodeDict[item[0]][0],
-                                       self.WaterTraxUnitsCodeDict[item[1]],
-                                       item[2]])
-            except KeyError:
-                self.convert_log += "\nEither the analyte code '" + item[0] + "' or the \n" +\
-                                   "unit code '" + item[1] + "' has not been entered into\n" +\
-                                   "the EasyTrax system. If this is a new analyte or unit,\n" +\
-                                   "it will have to be entered. If this is a typo, correct and\n" +\
-                                   "try again. Any lines containing the problematic analyte\n" +\
-                                   "or unit will not be included in the report.\n"
-        return converted_list
+
+        self.convert_log.add('unknown-code', Diagnostics.EasyTraxDiagnostics.WARNING,
+                             "\nEither the analyte code '" + result.analyte + "' or the \n" +
+                             "unit code '" + result.unit + "' has not been entered into\n" +
+                             "the EasyTrax system. If this is a new analyte or unit,\n" +
+                             "it will have to be entered. If this is a typo, correct and\n" +
+                             "try again. Any lines containing the problematic analyte\n" +
+                             "or unit will not be included in the report.\n",
+                             sample=sample_name, analyte=result.analyte)
 
     def format_watertrax_date(self, date_value):
         """formats our date into the correct WTX format (mmddyyy).
@@ -415,25 +443,270 @@ class EasyTraxConvert:
 
     def print_sample_dictionary_to_console(self):
         """prints the sample dictionary to the console. """
-        for key, value in self.samples_dictionary.items():
+        for key, sample in self.samples_dictionary.items():
             print(key)
-            print(value)
+            print(sample.as_list())
 
     def generate_report_directories_and_files(self):
         """creates a file at a given target and names it based on the jobnumber of the report. The directory is
-        always named using the 6 digit job number. """
+        always named using the 6 digit job number.
+
+        the lines from generate_water_trax_report_lines() are streamed into a temporary file next to the report as
+        they are made, so the report is never held in memory, and are counted in wtx_lines_written. Reports are rerun
+        a lot (and backfilled in batches), so if the report on disk is already the same as the new one (compared by
+        size and SHA-256), the temporary file is dropped, the report is left alone, and wtx_report_unchanged is set.
+        This keeps the modified time of the file meaning something.
+
+        otherwise the temporary file is renamed over the old report, so a crash part way through never leaves a half
+        written WTX report behind, and its size is kept in wtx_bytes_written.
+
+        if the report can't be written, the reason is kept in wtx_write_error and added to the conversion log as an
+        error, so it shows up against the job.
+
+        in replacement mode, the replacement report is written first (see write_replacement_report()), and the WTX
+        report is only replaced once it has been, so the WTX report on disk always matches what has been made for
+        upload. If no replacement report could be made (wtx_replacement_error is set), the WTX report on disk is left
+        as it was, as it still matches what WaterTrax holds. """
+
+        self.wtx_lines_written = 0
+        self.wtx_bytes_written = 0
+        self.wtx_report_unchanged = False
+        self.wtx_write_error = ''
+        self.wtx_replacement_filename = ''
+        self.wtx_replacement_error = ''
+        self.wtx_lines_changed = 0
+        filename = self.get_wtx_report_filename()
+        self.wtx_upload_filename = filename
+        temporary_filename = Share.get_temporary_path(filename)
+        try:
+            self.mkdir_p(os.path.dirname(filename))
+            try:
+                with open(temporary_filename, 'wb') as report_file:
+                    self.wtx_lines_written, report_size, report_digest = self.write_wtx_report_lines(
+                        report_file, self.generate_water_trax_report_lines())
+                if self.replacement:
+                    self.write_replacement_report(filename, temporary_filename)
+                if self.wtx_replacement_error:
+                    Share.remove_temporary_file(temporary_filename)
+                elif self.wtx_report_is_unchanged(filename, report_size, report_digest):
+                    self.wtx_report_unchanged = True
+                    Share.remove_temporary_file(temporary_filename)
+                else:
+                    os.replace(temporary_filename, filename)
+                    self.wtx_bytes_written = report_size
+            except BaseException:
+                Share.remove_temporary_file(temporary_filename)
+                raise
+        except OSError as exc:
+            self.wtx_write_error = type(exc).__name__ + ': ' + str(exc)
+            self.convert_log.add('wtx-write-failed', Diagnostics.EasyTraxDiagnostics.ERROR,
+                                 "\nThe WTX report couldn't be written to\n" + filename + "\n" +
+                                 self.wtx_write_error + "\n")
+
+    def write_wtx_report_lines(self, report_file, report_lines):
+        """writes the report lines to report_file one at a time, encoded as in WTX_ENCODING, and hashes them as they
+        go, so the report can be compared to the one on disk without being read back or held in memory.
+
+        Parameters
+        ----------
+        report_file : file
+            the (temporary) file to write, opened in binary mode.
+        report_lines : iterable(str)
+            the WTX report lines, each ending in a newline.
+
+        Returns
+        -------
+        line_count, report_size, report_digest : int, int, bytes
+            the amount of lines written, the size of the file in bytes, and its SHA-256 digest.
+
+        Raises
+        ------
+        OSError
+            if the file can't be written.
+        """
+
+        report_hash = hashlib.sha256()
+        line_count = 0
+        report_size = 0
+        for line in report_lines:
+            line_data = line.replace('\n', os.linesep).encode(WTX_ENCODING)
+            report_file.write(line_data)
+            report_hash.update(line_data)
+            line_count += 1
+            report_size += len(line_data)
+        return line_count, report_size, report_hash.digest()
+
+    def wtx_report_is_unchanged(self, filename, report_size, report_digest):
+        """checks if the WTX report already at filename is report_size bytes long, with the SHA-256 digest
+        report_digest. The sizes are compared first, so the old report is only read (and hashed) if it could be the
+        same.
+
+        Returns
+        -------
+        bool
+            True if the file exists and holds the same report.
+        """
 
-        target = r'T:\ANALYST WORK FILES\Peter\EasyTrax\WTX_reports\ '
         try:
-            jobnumber = str(self.job_dictionary['job number'])
-            filename = target[:-1] + jobnumber[0:7] + '\\' + jobnumber + '.txt'
-            filename = filename.replace('/', '-')
-            with self.safe_open_w(filename) as f:
-                for item in self.wtx_format_report:
-                    f.write(item)
-                    f.write('\n')
+            if os.path.getsize(filename) != report_size:
+                return False
+            file_hash = hashlib.sha256()
+            with open(filename, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 16), b''):
+                    file_hash.update(block)
         except OSError:
-            pass
+            return False
+        return file_hash.digest() == report_digest
+
+    def write_replacement_report(self, filename, temporary_filename):
+        """writes a replacement report for a corrected job, if any of its results have changed since the WTX report at
+        filename (the one made last time). The new report lines are read back from temporary_filename, where they
+        have just been written, and are matched up with the old ones by sample ID and analyte code.
+
+        WaterTrax replaces everything it holds for a report with the contents of a replacement report, and rejects one
+        with fewer lines than the report it replaces (see 'Updating Report Data' in WTX_Report_Format_Doc.pdf), so a
+        replacement report holds every line of the job, with the transaction purpose 'R' (replacement, from
+        WaterTraxRequiredFileFieldDict[2]) instead of 'O' (original). It goes next to the WTX report, as
+        W161000_R.txt, and becomes wtx_upload_filename. wtx_lines_changed is the amount of lines that are new or
+        different.
+
+        if there is no WTX report for the job yet, there is nothing to replace, so the WTX report itself is left to
+        be uploaded. If nothing has changed, nothing needs uploading, and wtx_upload_filename is ''. If results have
+        been taken out, WaterTrax wouldn't take the replacement, so none is made (and one left from an earlier
+        correction is removed, as it is out of date), and the reason is kept in wtx_replacement_error and logged as an
+        error instead.
+
+        Raises
+        ------
+        OSError
+            if the replacement report can't be written.
+        """
+
+        previous_lines = self.read_previous_wtx_report(filename)
+        if previous_lines is None:
+            self.convert_log.add('no-previous-wtx', Diagnostics.EasyTraxDiagnostics.WARNING,
+                                 "\nThere is no earlier WTX report for this job, so there is nothing to replace.\n" +
+                                 "Upload the WTX report as an original.\n")
+            return
+        self.wtx_upload_filename = ''
+        with open(temporary_filename, 'r', encoding=WTX_ENCODING) as f:
+            lines_changed, lines_removed = self.compare_wtx_report_lines(f, previous_lines)
+        self.wtx_lines_changed = lines_changed
+        if lines_removed:
+            self.wtx_replacement_error = (str(lines_removed) + ' results in the last WTX report are not in this one, ' +
+                                          'so no replacement report was made')
+            self.convert_log.add('wtx-results-removed', Diagnostics.EasyTraxDiagnostics.ERROR,
+                                 "\n" + str(lines_removed) + " results in the last WTX report are not in this " +
+                                 "one.\nWaterTrax won't take a replacement report with fewer results, so none " +
+                                 "was made, and the last WTX report was kept.\nDelete the report in WaterTrax, " +
+                                 "convert the job again without replacement, and upload the new WTX report as " +
+                                 "an original.\n")
+            try:
+                os.remove(self.get_replacement_report_filename(filename))
+            except FileNotFoundError:
+                pass
+            return
+        if not lines_changed:
+            self.convert_log.add('no-replacements', Diagnostics.EasyTraxDiagnostics.INFO,
+                                 "\nNothing has changed since the last WTX report, there is nothing to upload.\n")
+            return
+        replacement_filename = self.get_replacement_report_filename(filename)
+        with open(temporary_filename, 'r', encoding=WTX_ENCODING) as f, \
+                Share.replacing_file(replacement_filename) as replacement_file:
+            self.write_wtx_report_lines(replacement_file, self.generate_replacement_report_lines(f))
+        self.wtx_replacement_filename = replacement_filename
+        self.wtx_upload_filename = replacement_filename
+
+    def generate_replacement_report_lines(self, report_lines):
+        """yields the report lines with the transaction purpose 'R' (replacement, from
+        WaterTraxRequiredFileFieldDict[2]) instead of 'O' (original)."""
+
+        replacement_purpose = self.WaterTraxRequiredFileFieldDict[2][1]
+        for line in report_lines:
+            fields = line.split('|')
+            fields[PURPOSE_FIELD] = replacement_purpose
+            yield '|'.join(fields)
+
+    def read_previous_wtx_report(self, filename):
+        """reads the WTX report already at filename.
+
+        Returns
+        -------
+        previous_lines : dict or None
+            (sample ID, analyte code) : the fields of the line. None if there is no report.
+        """
+
+        try:
+            with open(filename, 'r', encoding=WTX_ENCODING) as f:
+                previous_lines = {}
+                for line in f:
+                    fields = line.rstrip('\n').split('|')
+                    if len(fields) > ANALYTE_CODE_FIELD:
+                        previous_lines[fields[SAMPLE_ID_FIELD], fields[ANALYTE_CODE_FIELD]] = fields
+        except FileNotFoundError:
+            return None
+        return previous_lines
+
+    def compare_wtx_report_lines(self, report_lines, previous_lines):
+        """compares the new report lines to the old ones, by sample ID and analyte code. The transaction purpose
+        isn't compared.
+
+        Parameters
+        ----------
+        report_lines : iterable(str)
+            the new WTX report lines, each ending in a newline.
+        previous_lines : dict
+            as returned by read_previous_wtx_report().
+
+        Returns
+        -------
+        lines_changed, lines_removed : int, int
+            the amount of new lines that are new or different, and of old lines that aren't in the new report.
+        """
+
+        lines_changed = 0
+        lines_matched = 0
+        for line in report_lines:
+            fields = line[:-1].split('|')
+            previous_fields = previous_lines.get((fields[SAMPLE_ID_FIELD], fields[ANALYTE_CODE_FIELD]))
+            if previous_fields is None:
+                lines_changed += 1
+                continue
+            lines_matched += 1
+            if previous_fields[:PURPOSE_FIELD] != fields[:PURPOSE_FIELD] or \
+                    previous_fields[PURPOSE_FIELD + 1:] != fields[PURPOSE_FIELD + 1:]:
+                lines_changed += 1
+        return lines_changed, len(previous_lines) - lines_matched
+
+    def get_replacement_report_filename(self, filename):
+        """returns the name of the replacement report for the WTX report at filename (W161000.txt : W161000_R.txt)."""
+
+        report_root, extension = os.path.splitext(filename)
+        return report_root + '_R' + extension
+
+    def get_wtx_report_filename(self):
+        """builds the full path of the WTX report for the job.
+
+        if no wtx_reports_directory was passed, the report goes under EASYTRAX_OUTPUT_ROOT if it is set (see
+        EasyTraxShare.get_output_root()), otherwise in WTX_reports on the T: drive, as it always has. Any '/' in the
+        job number is swapped for '-', so it can be used as a file name.
+
+        Returns
+        -------
+        filename : string
+            the full path of the WTX report.
+        """
+
+        jobnumber = str(self.job_dictionary['job number'])
+        wtx_reports_directory = self.wtx_reports_directory
+        if wtx_reports_directory is None:
+            wtx_reports_directory = Share.get_output_root()
+            if wtx_reports_directory == Share.DEFAULT_OUTPUT_ROOT:
+                filename = wtx_reports_directory + '\\' + jobnumber[0:7] + '\\' + jobnumber + '.txt'
+                return filename.replace('/', '-')
+        return os.path.join(wtx_reports_directory,
+                            jobnumber[0:7].replace('/', '-'),
+                            jobnumber.replace('/', '-') + '.txt')
 
     def mkdir_p(self, path):
         """tries to make the directory."""
@@ -446,24 +719,22 @@ class EasyTraxConvert:
             else:
                 raise
 
-    def safe_open_w(self, path):
-        """ Open "path" for writing, creating any parent directories as needed. """
-
-        self.mkdir_p(os.path.dirname(path))
-        return open(path, 'w')
-
     def qc_final_wtx_report_error_check(self):
-        """ Checks to see if the final list of report lines is empty. If so, logs event. """
-
-        if not self.wtx_format_report:
-            self.convert_log += "\nNo WTX report lines have been written.\n" +\
-                               "Check file, and try again. View the Documentation\n" +\
-                               "To see how these files are parsed, and look for any\n" +\
-                               "Inconsistencies in the data table."
+        """ Checks to see if any report lines were written. If not, logs event. """
+
+        if not self.wtx_lines_written:
+            self.convert_log.add('no-lines-written', Diagnostics.EasyTraxDiagnostics.ERROR,
+                                 "\nNo WTX report lines have been written.\n" +
+                                 "Check file, and try again. View the Documentation\n" +
+                                 "To see how these files are parsed, and look for any\n" +
+                                 "Inconsistencies in the data table.")
         else:
-            if len(self.convert_log) == 0:
-                self.convert_log += "\nConverted Successfully! WTX file will be in WTX_reports.\n"
+            if self.convert_log.count() == self.convert_log.count(Diagnostics.EasyTraxDiagnostics.INFO):
+                # nothing but notes (ex. 'no-replacements') so far
+                self.convert_log.add('converted', Diagnostics.EasyTraxDiagnostics.INFO,
+                                     "\nConverted Successfully! WTX file will be in WTX_reports.\n")
             else:
-                self.convert_log += "\nWTX file produced in WTX_reports, may be conversion errors.\n"
+                self.convert_log.add('converted-with-errors', Diagnostics.EasyTraxDiagnostics.WARNING,
+                                     "\nWTX file produced in WTX_reports, may be conversion errors.\n")
 
 
@@ -0,0 +1,202 @@
+# the most distinct messages a log keeps. Anything after that is only counted.
+MAX_EVENTS = 200
+# the most sample names kept for one message, to show where a repeated message came from.
+MAX_SAMPLES_PER_EVENT = 5
+
+
+class EasyTraxDiagnostics:
+    """Collects the messages made while parsing or converting a report (parse_log and convert_log).
+
+    The logs used to be strings that every message was added onto, so a report with one unknown analyte in 200
+    samples made the same six line message 200 times. Messages are now kept as EasyTraxDiagnostic records: each
+    message is kept once, with a count of how many times it happened, and the first few samples it happened in. The
+    text for the Tk window or the command line is only made when it is asked for (render(), or str()).
+
+    Messages are identical if they have the same code and text. At most MAX_EVENTS different messages are kept;
+    past that, messages are counted but not kept, and render() says how many were left out.
+
+    Attributes
+    ----------
+    events : dict
+        (code, message) : EasyTraxDiagnostic, in the order the messages first happened.
+
+    dropped : int
+        the amount of messages that weren't kept because the log was full.
+
+    Methods
+    -------
+    * `add(code, severity, message, line=None, table=None, sample=None, analyte=None)` -
+        records a message.
+
+    * `count(severity=None)` -
+        returns how many messages have been recorded, repeats included.
+
+    * `render()` -
+        returns the log as text, each message once.
+
+    * `as_dicts()` -
+        returns the messages as plain dictionaries (ex. for writing to JSON).
+    """
+
+    INFO = 'info'
+    WARNING = 'warning'
+    ERROR = 'error'
+
+    def __init__(self, max_events=MAX_EVENTS):
+        """
+        Parameters
+        ----------
+        max_events : int
+            the most distinct messages to keep.
+        """
+
+        self.max_events = max_events
+        self.events = {}
+        self.dropped = 0
+
+    def __str__(self):
+        return self.render()
+
+    def __repr__(self):
+        return 'EasyTraxDiagnostics(%d messages, %d dropped)' % (len(self.events), self.dropped)
+
+    def add(self, code, severity, message, line=None, table=None, sample=None, analyte=None):
+        """records a message. If the same message has already been recorded, its count goes up instead.
+
+        Parameters
+        ----------
+        code : str
+            short name for the kind of message (ex. 'unknown-code').
+        severity : str
+            INFO, WARNING, or ERROR.
+        message : str
+            the text shown to the user, as it has always been written to the log.
+        line : int
+            the line of the report the message is about (1 is the first line), if known.
+        table : int
+            the line the table the message is about starts on, if the message is about a data table.
+        sample : str
+            the name of the sample the message is about, if any.
+        analyte : str
+            the analyte the message is about, if any.
+
+        Returns
+        -------
+        EasyTraxDiagnostic or None
+            the record for the message, or None if the log is full.
+        """
+
+        event = self.events.get((code, message))
+        if event is None:
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return None
+            event = EasyTraxDiagnostic(code, severity, message, line, table, analyte)
+            self.events[code, message] = event
+        event.count += 1
+        if sample is not None and len(event.samples) < MAX_SAMPLES_PER_EVENT and sample not in event.samples:
+            event.samples.append(sample)
+        return event
+
+    def count(self, severity=None):
+        """returns how many messages have been recorded (of one severity, if given), repeats included.
+
+        Messages that weren't kept because the log was full are only included when severity is None.
+        """
+
+        if severity is None:
+            return sum(event.count for event in self.events.values()) + self.dropped
+        return sum(event.count for event in self.events.values() if event.severity == severity)
+
+    def render(self):
+        """returns the log as text, each message once, in the order they first happened.
+
+        A message that happened more than once is followed by how many times, and the first samples it happened in.
+
+        Returns
+        -------
+        log : str
+            the log, ready for the Tk text box or the command line.
+        """
+
+        log_lines = []
+        for event in self.events.values():
+            log_lines.append(event.message)
+            if event.count > 1:
+                log_lines.append(event.render_repeats())
+        if self.dropped:
+            log_lines.append('\n' + str(self.dropped) + ' more messages were left out of this log.\n')
+        return ''.join(log_lines)
+
+    def as_dicts(self):
+        """returns the messages as a list of dictionaries, one per distinct message."""
+
+        return [event.as_dict() for event in self.events.values()]
+
+
+class EasyTraxDiagnostic:
+    """One distinct message in an EasyTraxDiagnostics log, with how often it happened.
+
+    Attributes
+    ----------
+    code : str
+        short name for the kind of message.
+
+    severity : str
+        'info', 'warning', or 'error'.
+
+    message : str
+        the text shown to the user.
+
+    line : int or None
+        the line of the report the message is about, the first time it happened.
+
+    table : int or None
+        the line the table the message is about starts on, the first time it happened.
+
+    analyte : str or None
+        the analyte the message is about.
+
+    samples : list(str)
+        the first MAX_SAMPLES_PER_EVENT samples the message happened in.
+
+    count : int
+        how many times the message happened.
+    """
+
+    __slots__ = ('code', 'severity', 'message', 'line', 'table', 'analyte', 'samples', 'count')
+
+    def __init__(self, code, severity, message, line=None, table=None, analyte=None):
+        self.code = code
+        self.severity = severity
+        self.message = message
+        self.line = line
+        self.table = table
+        self.analyte = analyte
+        self.samples = []
+        self.count = 0
+
+    def __repr__(self):
+        return 'EasyTraxDiagnostic(%r, %r, count=%d)' % (self.code, self.severity, self.count)
+
+    def render_repeats(self):
+        """returns the line saying how many times the message happened, and in which samples."""
+
+        repeats = '(happened ' + str(self.count) + ' times'
+        if self.samples:
+            repeats += ', in ' + ', '.join(self.samples)
+            if self.count > len(self.samples):
+                repeats += ', ...'
+        return repeats + ')\n'
+
+    def as_dict(self):
+        """returns the message as a plain dictionary."""
+
+        return {'code': self.code,
+                'severity': self.severity,
+                'message': self.message,
+                'line': self.line,
+                'table': self.table,
+                'analyte': self.analyte,
+                'samples': list(self.samples),
+                'count': self.count}
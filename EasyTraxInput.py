@@ -0,0 +1,228 @@
+import mmap
+
+
+# FirstChoice is a DOS program, and writes its reports in the DOS code page, whatever the computer reading them uses.
+FIRSTCHOICE_ENCODING = 'cp437'
+# DOS programs sometimes end a text file with Ctrl+Z.
+DOS_END_OF_FILE = b'\x1a'
+# how much of the file is decoded at once.
+READ_BLOCK_SIZE = 1 << 16
+# bytes that str.splitlines() treats as line breaks once decoded, but reading a file in text mode doesn't. (cp437
+# decodes them to the same characters, and the other characters splitlines() breaks on can't come out of cp437.)
+OTHER_LINE_BREAKS = (b'\x0b', b'\x0c', b'\x1c', b'\x1d', b'\x1e')
+
+
+class EasyTraxReportFile:
+    """Reads a FirstChoice report from disk, one line at a time, for EasyTraxParse.
+
+    Reports used to be read with open(path, 'r').readlines(), which decodes the file with whatever encoding the
+    computer defaults to (so a degree sign or accented name came out differently on different computers), and reads
+    the whole file into memory before splitting it into lines. Year end exports can be several MB.
+
+    This class memory maps the file instead, so the operating system pages it in as it is read. The lines are found
+    and decoded (with FIRSTCHOICE_ENCODING, cp437) a block of READ_BLOCK_SIZE at a time, as they are asked for, so
+    apart from one block, the only copy of the report the program holds is the list of lines EasyTraxParse keeps.
+
+    Line endings are handled the same way as reading in text mode: '\\r\\n' and a lone '\\r' both become '\\n'. A
+    Ctrl+Z at the very end of the file (a DOS end of file marker) is dropped.
+
+    Use it as a with statement, so the file is closed as soon as the lines have been read, even if parsing fails:
+
+        with EasyTraxReportFile(report_path) as report_file:
+            samples_dictionary, job_dictionary, parse_log = EasyTraxParse(job_number, report_file.lines())...
+
+    Attributes
+    ----------
+    report_path : str
+        the full path of the report.
+
+    encoding : str
+        the encoding the report is decoded with.
+
+    report_file : file or None
+        the open file, while inside the with statement.
+
+    report_map : mmap.mmap or None
+        the memory map of the file, while inside the with statement. None for an empty file, which can't be mapped.
+
+    Methods
+    -------
+    * `open()` / `close()` -
+        open and memory map the file, and close it again. Called by the with statement.
+
+    * `lines()` -
+        yields the lines of the report, decoded, each ending in '\\n' (except maybe the last).
+
+    * `readlines()` -
+        returns every line in a list, like the file method of the same name.
+
+    * `line_blocks()` -
+        yields the lines a block at a time, used by lines() and readlines().
+    """
+
+    def __init__(self, report_path, encoding=FIRSTCHOICE_ENCODING):
+        """
+        Parameters
+        ----------
+        report_path : str
+            the full path of the report.
+        encoding : str
+            the encoding to decode the report with.
+        """
+
+        self.report_path = report_path
+        self.encoding = encoding
+        self.report_file = None
+        self.report_map = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        return self.lines()
+
+    def open(self):
+        """opens the file, and memory maps it (unless it is empty).
+
+        Raises
+        ------
+        OSError
+            if the file can't be opened (ex. FileNotFoundError).
+        """
+
+        self.report_file = open(self.report_path, 'rb')
+        try:
+            if self.report_file.seek(0, 2):
+                self.report_map = mmap.mmap(self.report_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self.report_file.close()
+            self.report_file = None
+            raise
+
+    def close(self):
+        """closes the memory map and the file. Safe to call more than once."""
+
+        if self.report_map is not None:
+            self.report_map.close()
+            self.report_map = None
+        if self.report_file is not None:
+            self.report_file.close()
+            self.report_file = None
+
+    def lines(self):
+        """yields the lines of the report, one at a time, decoded.
+
+        Yields
+        ------
+        line : str
+            one line of the report, with its line ending turned into '\\n'.
+        """
+
+        for block_lines in self.line_blocks():
+            yield from block_lines
+
+    def readlines(self):
+        """returns every line of the report in a list, like file.readlines()."""
+
+        mb_file_contents = []
+        for block_lines in self.line_blocks():
+            mb_file_contents += block_lines
+        return mb_file_contents
+
+    def line_blocks(self):
+        """yields the lines of the report a block at a time, decoded.
+
+        the file is decoded READ_BLOCK_SIZE at a time (each block ending on a line break), which is much quicker than
+        decoding it a line at a time.
+
+        Yields
+        ------
+        block_lines : list(str)
+            the lines in one block, with their line endings turned into '\\n'.
+        """
+
+        report_map = self.report_map
+        if report_map is None:
+            return
+        encoding = self.encoding
+        size = len(report_map)
+        if report_map[size - 1:size] == DOS_END_OF_FILE:
+            size -= 1
+        block_start = 0
+        while block_start < size:
+            block_end = min(block_start + READ_BLOCK_SIZE, size)
+            if block_end < size:
+                last_line_break = report_map.rfind(b'\n', block_start, block_end)
+                if last_line_break != -1:
+                    block_end = last_line_break + 1
+                else:
+                    # a line longer than the block, read to the end of it
+                    block_end = report_map.find(b'\n', block_end, size) + 1 or size
+            block = report_map[block_start:block_end]
+            block_start = block_end
+            text = block.decode(encoding)
+            if '\r' in text:
+                # '\r\n' and lone '\r' line endings, as text mode would read them
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            if not [line_break for line_break in OTHER_LINE_BREAKS if line_break in block]:
+                yield text.splitlines(True)
+            else:
+                # splitlines() would also split on these (FirstChoice puts form feeds between pages), which text mode
+                # doesn't, so the block is split on '\n' only
+                block_lines = [line + '\n' for line in text.split('\n')]
+                last_line = block_lines.pop()
+                if last_line != '\n':
+                    block_lines.append(last_line[:-1])
+                yield block_lines
+
+
+def read_report_lines(report_path, encoding=FIRSTCHOICE_ENCODING):
+    """opens a report, reads every line, and closes it again.
+
+    Parameters
+    ----------
+    report_path : str
+        the full path of the report.
+    encoding : str
+        the encoding to decode the report with.
+
+    Returns
+    -------
+    mb_file_contents : list(str)
+        the lines of the report.
+    """
+
+    with EasyTraxReportFile(report_path, encoding) as report_file:
+        return report_file.readlines()
+
+
+def split_report_text(report_text):
+    """splits the text of a report that didn't come from a file (ex. sent to EasyTraxServer) into lines, the same way
+    EasyTraxReportFile reads a file: '\\r\\n' and lone '\\r' line endings become '\\n', only line breaks split lines,
+    and a Ctrl+Z at the very end is dropped.
+
+    Parameters
+    ----------
+    report_text : str
+        the text of the report.
+
+    Returns
+    -------
+    mb_file_contents : list(str)
+        the lines of the report.
+    """
+
+    if report_text.endswith('\x1a'):
+        report_text = report_text[:-1]
+    if '\r' in report_text:
+        report_text = report_text.replace('\r\n', '\n').replace('\r', '\n')
+    mb_file_contents = [line + '\n' for line in report_text.split('\n')]
+    last_line = mb_file_contents.pop()
+    if last_line != '\n':
+        mb_file_contents.append(last_line[:-1])
+    return mb_file_contents
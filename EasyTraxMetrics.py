@@ -0,0 +1,232 @@
+import cProfile
+import json
+import time
+
+
+class EasyTraxMetrics:
+    """Records how long each stage of a conversion takes, and how much work it did, for finding where the time goes
+    on slow jobs.
+
+    EasyTraxParse and EasyTraxConvert each run about ten stages in a row (finding the tables, parsing the horizontal
+    tables, the ICP tables, merging them, writing the WTX file, ...). Both take an optional metrics object. Each stage
+    is wrapped in stage(), which times it, and the stage can add counters to its record (ex. lines scanned, tables
+    found, triplets produced, bytes written). Pass the same EasyTraxMetrics to both to get the whole conversion.
+
+    Metrics are opt-in. When no metrics object is passed, the classes use a disabled one (see disabled()), where
+    stage() does nothing, so normal conversions aren't slowed down.
+
+    If profile is True, profiling() also runs cProfile, and write_profile() saves the result in the format read by
+    pstats (and snakeviz, etc.).
+
+    Attributes
+    ----------
+    enabled : bool
+        whether anything is recorded.
+
+    stages : dict
+        stage name : EasyTraxStageMetrics, in the order the stages first ran.
+
+    profiler : cProfile.Profile or None
+        the profiler, if profile was True.
+
+    Methods
+    -------
+    * `stage(name)` -
+        times a stage. Used as a with statement, gives the stage record to add counters to.
+
+    * `profiling()` -
+        runs cProfile while inside the with statement, if profile was True.
+
+    * `total_seconds()` -
+        returns the time of every stage added up.
+
+    * `as_dict()` -
+        returns the metrics as plain dictionaries (ex. for JSON).
+
+    * `render()` -
+        returns the metrics as a table, one line per stage.
+
+    * `write_json(metrics_path)` / `write_profile(profile_path)` -
+        save the metrics as JSON, or the profile as a cProfile stats file.
+    """
+
+    def __init__(self, profile=False, enabled=True):
+        """
+        Parameters
+        ----------
+        profile : bool
+            whether profiling() runs cProfile.
+        enabled : bool
+            whether anything is recorded. Use disabled() rather than passing False.
+        """
+
+        self.enabled = enabled
+        self.stages = {}
+        self.profiler = cProfile.Profile() if profile and enabled else None
+
+    def __repr__(self):
+        return 'EasyTraxMetrics(%d stages, %.6f seconds)' % (len(self.stages), self.total_seconds())
+
+    def __str__(self):
+        return self.render()
+
+    @classmethod
+    def disabled(cls):
+        """returns a metrics object that records nothing, used when no metrics object is passed."""
+
+        return cls(enabled=False)
+
+    def stage(self, name):
+        """times a stage. Use as a with statement:
+
+            with self.metrics.stage('anchor scan') as stage:
+                ...
+                stage.count('tables found', len(self.table_index))
+
+        a stage that runs more than once (ex. once per table) adds to the same record.
+
+        Parameters
+        ----------
+        name : str
+            the name of the stage.
+
+        Returns
+        -------
+        stage : EasyTraxStageMetrics
+            the record of the stage, or a record that ignores everything if metrics are disabled.
+        """
+
+        if not self.enabled:
+            return NO_STAGE
+        if name not in self.stages:
+            self.stages[name] = EasyTraxStageMetrics(name)
+        return self.stages[name]
+
+    def profiling(self):
+        """returns a context manager that runs cProfile while inside it, if profile was True (otherwise it does
+        nothing)."""
+
+        if self.profiler is None:
+            return NO_STAGE
+        return self.profiler
+
+    def total_seconds(self):
+        """returns the time of every stage added up."""
+
+        return sum(stage.seconds for stage in self.stages.values())
+
+    def as_dict(self):
+        """returns the metrics as a dictionary: the total time, and a list of stages, each with its time, the amount of
+        times it ran, and its counters."""
+
+        return {'total seconds': self.total_seconds(),
+                'stages': [stage.as_dict() for stage in self.stages.values()]}
+
+    def render(self):
+        """returns the metrics as a table, one line per stage, with its time and counters.
+
+        Returns
+        -------
+        table : str
+            the table.
+        """
+
+        table_lines = ['%-20s %10s  %s' % ('Stage', 'Time (ms)', 'Counters')]
+        for stage in self.stages.values():
+            table_lines.append('%-20s %10.3f  %s' % (stage.name, stage.seconds * 1000,
+                                                     ', '.join('%s %d' % (counter, amount)
+                                                               for counter, amount in stage.counters.items())))
+        table_lines.append('%-20s %10.3f' % ('total', self.total_seconds() * 1000))
+        return '\n'.join(table_lines)
+
+    def write_json(self, metrics_path, **extra):
+        """saves as_dict() to metrics_path as JSON, along with any extra keys passed (ex. the job number)."""
+
+        metrics = dict(extra)
+        metrics.update(self.as_dict())
+        with open(metrics_path, 'w') as metrics_file:
+            json.dump(metrics, metrics_file, indent=2)
+
+    def write_profile(self, profile_path):
+        """saves the cProfile stats to profile_path, if profile was True. Read it with pstats.Stats(profile_path).
+
+        Returns
+        -------
+        bool
+            True if a profile was written.
+        """
+
+        if self.profiler is None:
+            return False
+        self.profiler.dump_stats(profile_path)
+        return True
+
+
+class EasyTraxStageMetrics:
+    """The record of one stage in EasyTraxMetrics. Used as a with statement, it adds the time spent inside to seconds.
+
+    Attributes
+    ----------
+    name : str
+        the name of the stage.
+
+    seconds : float
+        the time spent in the stage.
+
+    calls : int
+        the amount of times the stage ran.
+
+    counters : dict
+        counter name : amount (ex. 'lines scanned' : 1200).
+    """
+
+    __slots__ = ('name', 'seconds', 'calls', 'counters', 'started')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.calls = 0
+        self.counters = {}
+        self.started = None
+
+    def __repr__(self):
+        return 'EasyTraxStageMetrics(%r, %.6f seconds)' % (self.name, self.seconds)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds += time.perf_counter() - self.started
+        self.calls += 1
+        return False
+
+    def count(self, counter, amount=1):
+        """adds amount to a counter of the stage."""
+
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def as_dict(self):
+        """returns the stage as a plain dictionary."""
+
+        stage = {'name': self.name, 'seconds': self.seconds, 'calls': self.calls}
+        stage.update(self.counters)
+        return stage
+
+
+class EasyTraxNoStage:
+    """Stands in for a stage record when metrics are disabled: does nothing as a with statement, and ignores counts."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def count(self, counter, amount=1):
+        pass
+
+
+NO_STAGE = EasyTraxNoStage()
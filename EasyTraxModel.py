@@ -0,0 +1,136 @@
+import sys
+
+
+class EasyTraxSample:
+    """One sample in a report, with its metadata and results. The intermediate format shared by EasyTraxParse and
+    EasyTraxConvert.
+
+    EasyTraxParse fills a samples_dictionary of sample name : EasyTraxSample, in the order the samples are found.
+    EasyTraxConvert turns each sample into one WTX line per result.
+
+    Sample metadata and results used to share one list ([location, date, time, [analyte, unit, value], ...]), so the
+    results had to be sliced off the metadata every time they were read. They are now kept apart, and each result is
+    an EasyTraxResult rather than a list.
+
+    Attributes
+    ----------
+    name : str
+        the sample name, which is also the samples_dictionary key (ex. '12 Site 12 Tap').
+
+    sample_id : str
+        the first word of the name, used as the WTX sample ID (ex. '12').
+
+    location : str
+        the sample location code (ex. 'A012B'), or 'no location' for the lab blank.
+
+    date : str
+        the sample date, MB Labs format (ex. '02Jan21'), or 'no date' for the lab blank.
+
+    time : str
+        the sample time, MB Labs format (ex. '11:31p'), or 'no time' for the lab blank.
+
+    results : list(EasyTraxResult)
+        the results of the sample, in the order they were found in the report. The same analyte can appear more than
+        once (EasyTraxConvert only writes the first).
+
+    Methods
+    -------
+    * `add_results(triplets)` -
+        adds [analyte, unit, value] triplets to results.
+
+    * `as_list()` -
+        returns the sample in the old list format.
+    """
+
+    __slots__ = ('name', 'sample_id', 'location', 'date', 'time', 'results')
+
+    def __init__(self, name, location, date, time):
+        """
+        Parameters
+        ----------
+        name : str
+            the sample name.
+        location : str
+            the sample location code.
+        date : str
+            the sample date.
+        time : str
+            the sample time.
+        """
+
+        self.name = name
+        self.sample_id = name.split(" ")[0]
+        self.location = location
+        self.date = date
+        self.time = time
+        self.results = []
+
+    def __eq__(self, other):
+        if not isinstance(other, EasyTraxSample):
+            return NotImplemented
+        return (self.name, self.location, self.date, self.time, self.results) ==\
+            (other.name, other.location, other.date, other.time, other.results)
+
+    def __repr__(self):
+        return 'EasyTraxSample(%r, %r, %r, %r, %d results)' % (self.name, self.location, self.date, self.time,
+                                                                len(self.results))
+
+    def add_results(self, triplets):
+        """adds data triplets to results, as EasyTraxResults.
+
+        Parameters
+        ----------
+        triplets : list
+            data triplets, [[analyte, unit, value], ...], as made by EasyTraxTable.
+        """
+
+        self.results.extend([EasyTraxResult(triplet[0], triplet[1], triplet[2]) for triplet in triplets])
+
+    def as_list(self):
+        """returns the sample in the old list format, [location, date, time, [analyte, unit, value], ...]."""
+
+        return [self.location, self.date, self.time] + [result.as_triplet() for result in self.results]
+
+
+class EasyTraxResult:
+    """One result of one sample: an analyte, its unit, and the value.
+
+    Analyte names and units repeat in every sample of a report, so they are interned - every result for 'Al' in
+    '(mg/L)' shares the same two strings, and comparing them is an identity check. This also lets EasyTraxConvert
+    look the codes up once per (analyte, unit), rather than once per result.
+
+    Attributes
+    ----------
+    analyte : str
+        the MB Labs analyte name (ex. 'Alkalinity', 'Al').
+
+    unit : str
+        the unit, in brackets (ex. '(mg/L)').
+
+    value : str
+        the value as written on the report (ex. '0.655', 'ND', '---' for no value).
+    """
+
+    __slots__ = ('analyte', 'unit', 'value')
+
+    def __init__(self, analyte, unit, value):
+        self.analyte = sys.intern(analyte)
+        self.unit = sys.intern(unit)
+        self.value = value
+
+    def __eq__(self, other):
+        if not isinstance(other, EasyTraxResult):
+            return NotImplemented
+        return self.analyte == other.analyte and self.unit == other.unit and self.value == other.value
+
+    def __repr__(self):
+        return 'EasyTraxResult(%r, %r, %r)' % (self.analyte, self.unit, self.value)
+
+    def __reduce__(self):
+        # pickled as its three strings, rather than a dictionary of slots, which is much smaller and quicker to load
+        return EasyTraxResult, (self.analyte, self.unit, self.value)
+
+    def as_triplet(self):
+        """returns the result as a data triplet, [analyte, unit, value]."""
+
+        return [self.analyte, self.unit, self.value]
@@ -1,3 +1,11 @@
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import EasyTraxDiagnostics as Diagnostics
+import EasyTraxMetrics as Metrics
+import EasyTraxModel as Model
+
+
 class EasyTraxParse:
     """Parses text files generated by the DOS program FirstChoice, prepares data for conversion to WTX format.
 
@@ -12,6 +20,14 @@ class EasyTraxParse:
     This file parses reports, extracts sample metadata and data from report headers and data tables, and combines
     them all together in one universal data format that is handled by EasyTraxConvert.
 
+    The file is scanned once to build table_index, which records where every table starts and ends. Each data table
+    is then parsed on its own from its slice of the file (see EasyTraxTable), optionally in a pool of worker
+    processes, and the results are merged back in file order. Only the lines inside tables are ever split up.
+
+    Tables can be read two ways, picked with column_mode. 'split' (the default) splits each line on spaces and works
+    out which piece is which from the amount of pieces. 'fixed-width' uses the fact that FirstChoice lines its
+    columns up: the columns of each table are found once, and every line is sliced by column.
+
     Last Updated: 09June2021, P.L.
 
     Attributes
@@ -22,20 +38,37 @@ class EasyTraxParse:
     mb_file : list(str)
         the contents of the text file being converted, line by line, in a list.
 
-    mb_file_split_lines : list(list(str))
-        each line split based on spaces (ex. ['hello          world I           am',] -> [['hello','world','I','am'],]
+    table_workers : int
+        the amount of worker processes to parse data tables with. If None (or 1), tables are parsed in this process.
+
+    column_mode : str
+        how the data tables are read, EasyTraxTable.SPLIT_COLUMNS ('split') or EasyTraxTable.FIXED_WIDTH_COLUMNS
+        ('fixed-width').
+
+    table_cache : EasyTraxCache.EasyTraxTableCache
+        where parsed data tables are kept between runs. If None, every table is parsed every time.
+
+    tables_from_cache : int
+        the amount of data tables read from table_cache, rather than parsed.
+
+    report_from_cache : bool
+        True if the whole report was unchanged since it was last parsed, and was read from table_cache.
+
+    table_index : list(EasyTraxTable)
+        every table in the file, in the order they appear. Built in one pass by
+        look_for_anchor_indexes_in_split_lines().
 
     sample_list_indexes : list(int)
-        the indexes of each sub list in fc_file_split_lines that have the string 'SAMPLE' at the beginning of the list.
+        the indexes of each line in mb_file that starts with the word 'SAMPLE'.
         these are the start points of the horizontal data tables.
 
     analyte_list_indexes : list(int)
-        the indexes of each sub list in fc_file_split_lines that have the string 'ELEMENTS' at the beginning of the
-        list. These are the start points of the vertical data tables.
+        the indexes of each line in mb_file that starts with the word 'ELEMENTS'. These are the start points of the
+        vertical data tables.
 
     backup_sample_list_indexes : list(int)
-        the indexes of each sub list in fc_file_split_lines that have the string 'Samples:' at the beginning of the
-        list. These are the start points of the header sample metadata.
+        the indexes of each line in mb_file that starts with the word 'Samples:'. These are the start points of the
+        header sample metadata.
 
     backup_line_split_by_sample : list(list)
         the individual samples in the header sample metadata, in a list of lists.
@@ -46,7 +79,8 @@ class EasyTraxParse:
     samples_dictionary : dict{}
         contains information pertaining to the samples. Format in this dict is:
         key: sample name (str)
-        value: sample locator code, date, time, list of lists (each sub list is a triplet, [analyte, unit, value])
+        value: EasyTraxModel.EasyTraxSample (sample locator code, date, time, and a list of results, each one an
+        EasyTraxResult of analyte, unit, value)
 
     metal_triplets_dictionary : dict{}
         contains information pertaining to the vertically formatted (analytes down, samples across) samples.
@@ -54,17 +88,27 @@ class EasyTraxParse:
         key: sample ID (str)
         value: list of data triplets [[analyte, unit, value],[analyte, unit, value],...]
 
-    parse_log : string
-        log of the conversion process, various errors can change string, returned after conversion is completed.
+    icp_matrices : list(EasyTraxICPMatrix)
+        the data of each vertically formatted table, as an analytes x samples matrix, in the order they appear.
+
+    sample_number_index : dict{}
+        the sample number (int) of each key in samples_dictionary : the key. Built once the horizontal tables are
+        parsed, and kept up to date as backup entries are made. Used to find the samples_dictionary key of a header
+        sample or an ICP sample number without searching every key.
+
+    parse_log : EasyTraxDiagnostics.EasyTraxDiagnostics
+        log of the conversion process, various errors add messages to it, returned after conversion is completed.
+        Use str() (or render()) to get the text.
+
+    metrics : EasyTraxMetrics.EasyTraxMetrics
+        the time and counters of each stage of easy_trax_parse_controller(), if a metrics object was passed.
+        Otherwise a disabled one, that records nothing.
 
     Methods
     -------
     * `easy_trax_parse_controller()` -
         executes the various methods/functions in the script in the right order.
 
-    * `split_lines_by_spacing()` -
-        converts each line in self.fc_file into a list, split by spaces.
-
     * `get_client_name_and_jobnumber()` -
         gets the client name and the job number from the first line of the text file. Jobnumber is also passed to class
         as a parameter (forgot, wrote this unnecessary bit of code, too lazy to delete).
@@ -73,43 +117,31 @@ class EasyTraxParse:
             finds the job number in the first line.
 
     * `look_for_anchor_indexes_in_split_lines()` -
-        looks for the string 'SAMPLE' in the list of lines, adds those indices to self.sample_list_indices.
-        looks for the string 'Samples:' in the list of lines, adds those indices to self.backup_sample_list_indices.
-        looks for the string 'ELEMENTS' in the list of lines, adds those indices to self.analyte_list_indexes.
+        scans the file once, building table_index. Each 'SAMPLE' line starts a horizontal table, each 'Samples:' line
+        starts the sample header, and each 'ELEMENTS' line starts a vertical ICP table. A table ends at the first blank
+        line after its data starts. The start indexes are also added to sample_list_indexes,
+        backup_sample_list_indexes, and analyte_list_indexes.
+
+    * `parse_data_tables(kind)` -
+        parses every table of the given kind in table_index, in this process or in a worker pool. Tables found in
+        table_cache aren't parsed again.
 
     * `pre_generate_backup_samples_dictionary_entries()` -
         if there are any indexes in self.backup_sample_list_indexes, then this method will take them and parse
         the sample header metadata into trimmed lists, consisting of [sample id, name1, ... namex, code, date, time]
 
     * `use_sample_indexes_to_get_sample_data()` -
-        iterates through the indexes in sample_list_indexes, and uses them to fill samples_dictionary with data.
-
-        * `get_analye_information(item)` -
-            access the line above the sample index passed, which has the analyte information. Occasionally there
-            is a 0 at the start of this line (for whatever reason). If this 0 is found, it's removed.
-
-        * `get_units_information(item)` -
-            accesses the line corresponding to the sample index passed. This line has the unit information. Removes
-            the first three items in the line, which are the strings 'SAMPLE', 'DATE', and 'TIME'.
-
-        * `get_samples_data(item)` -
-            starts at the line at index + 2. This is the first sample line. Grabs each sample line until the sample
-            name is "Lab Blank" (note, this wouldn't work if "Lab Blank" wasn't the last sample in the data table,
-            and may need to be changed in the future for large jobs that might not necessarily have "Lab Blank" as the
-            last sample for a given data table).
-
-        * `split_samples_into_name_and_information(samples, analyte_information)` -
-            takes list of samples created by get_samples_data, and, using the analyte_information, splits the sample
-            lines into the two lists - one has the name, date, and time for the sample, and the other list has analyte
-            values.
+        parses the horizontal tables, and uses the results to fill samples_dictionary with data.
 
         * `generate_samples_dictionary_entries(samples_binary_list)` -
             goes through the various sample names in the samples_binary_list and uses them to make keys in the
             samples_dictionary.
 
-        * `generate_data_triplets(analyte_information, units, samples_binary_list)` -
-            matches analye names, units, and values for each analyte, for each sample, and adds data triplets to
-            the samples_dictionary under the correct sample name.
+        * `add_data_triplets_to_samples_dictionary(table, table_data)` -
+            adds the data triplets of one horizontal table to the samples_dictionary under the correct sample name.
+
+    * `index_sample_numbers()` -
+        builds sample_number_index from the keys in samples_dictionary.
 
     * `generate_backup_samples_dictionary_entries()` -
         takes the lists generated by pre_generate_backup_samples_dictionary_entries and converts them into appropriate
@@ -119,29 +151,53 @@ class EasyTraxParse:
         checks to see if there are any sample dictionary keys after the backups are made
 
     * `use_analyte_indexes_to_get_sample_data()`
-        iterates through the indexes in analyte_list_indexes, and uses them to fill metal_triplets_dictionary with data.
+        parses the vertical ICP tables into icp_matrices, and uses them to fill metal_triplets_dictionary with data.
 
     * `qc_check_for_metal_triplets_dictionary_keys_after_analyte_indexes()` -
         checks to see if there are analyte indexes available but no metal triplet dictionary keys.
 
     * `combine_metal_triplet_dictionary_with_samples_dictionary()`
-        matches the sample ID keys in metal_triplets_dictionary to sample ID + name keys in samples_dictionary. Once
-        matched, adds data in metal_triplets_dictionary to samples_dictionary.
+        matches the sample ID keys in metal_triplets_dictionary to sample ID + name keys in samples_dictionary, using
+        sample_number_index. Once matched, adds data in metal_triplets_dictionary to samples_dictionary.
+
+    * `get_report_from_table_cache()`
+        if the whole report is in table_cache, uses the cached samples_dictionary, job_dictionary, and parse_log.
+
+    * `log_table_cache_use()`
+        logs how many tables were read from table_cache, and keeps the cache within its size.
         """
 
-    def __init__(self, job_number, fc_file):
+    def __init__(self, job_number, fc_file, table_workers=None, column_mode='split', table_cache=None,
+                 metrics=None):
         """
         Parameters
         ----------
         job_number: str
             the job number for the job being converted
-        fc_file: str
-            the FirstChoice text file being parsed, in string format.
+        fc_file: list(str)
+            the FirstChoice text file being parsed, line by line. Any iterable of lines can be passed (ex.
+            EasyTraxInput.EasyTraxReportFile.lines()), it is read into mb_file once.
+        table_workers: int
+            the amount of worker processes to parse data tables with. Only worth it for very large reports, as
+            starting the pool costs more than parsing a normal report.
+        column_mode: str
+            'split' or 'fixed-width', see EasyTraxTable.
+        table_cache: EasyTraxCache.EasyTraxTableCache
+            where to keep parsed data tables between runs, or None to parse every table every time.
+        metrics: EasyTraxMetrics.EasyTraxMetrics
+            where to record the time and counters of each stage, or None to record nothing.
         """
 
         self.job_number = job_number
-        self.mb_file = fc_file
-        self.mb_file_split_lines = []
+        self.mb_file = fc_file if isinstance(fc_file, list) else list(fc_file)
+        self.table_workers = table_workers
+        if column_mode not in (EasyTraxTable.SPLIT_COLUMNS, EasyTraxTable.FIXED_WIDTH_COLUMNS):
+            raise ValueError("column_mode must be 'split' or 'fixed-width', not " + repr(column_mode))
+        self.column_mode = column_mode
+        self.table_cache = table_cache
+        self.tables_from_cache = 0
+        self.report_from_cache = False
+        self.table_index = []
         self.sample_list_indexes = []
         self.backup_sample_list_indexes = []
         self.backup_line_split_by_sample = []
@@ -149,7 +205,10 @@ class EasyTraxParse:
         self.job_dictionary = {}
         self.samples_dictionary = {}
         self.metal_triplets_dictionary = {}
-        self.parse_log = ""
+        self.icp_matrices = []
+        self.sample_number_index = {}
+        self.parse_log = Diagnostics.EasyTraxDiagnostics()
+        self.metrics = metrics if metrics is not None else Metrics.EasyTraxMetrics.disabled()
 
     def easy_trax_parse_controller(self):
         """executes the various methods/functions in the script in the right order.
@@ -164,49 +223,76 @@ class EasyTraxParse:
 
         job_dictionary : dict
             dictionary where all job level information is held.
+
+        parse_log : EasyTraxDiagnostics.EasyTraxDiagnostics
+            the messages made while parsing.
         """
 
-        # split up the whole file line by line
-        self.split_lines_by_spacing()
+        # an unchanged report is read straight from the cache
+        if self.table_cache is not None:
+            with self.metrics.stage('report cache') as stage:
+                from_cache = self.get_report_from_table_cache()
+                stage.count('reports from cache', int(from_cache))
+            if from_cache:
+                return self.samples_dictionary, self.job_dictionary, self.parse_log
         # extract the client name and job number
-        self.get_client_name_and_jobnumber()
-        # collect anchor indexes
-        self.look_for_anchor_indexes_in_split_lines()
+        with self.metrics.stage('client line'):
+            self.get_client_name_and_jobnumber()
+        # find where every table starts and ends
+        with self.metrics.stage('anchor scan') as stage:
+            self.look_for_anchor_indexes_in_split_lines()
+            stage.count('lines scanned', len(self.mb_file))
+            stage.count('tables found', len(self.table_index))
         # pre-generate backup sample metadata if there is sample header info
-        if self.backup_sample_list_indexes:
-            self.pre_generate_backup_samples_dictionary_entries()
+        with self.metrics.stage('backup headers') as stage:
+            if self.backup_sample_list_indexes:
+                self.pre_generate_backup_samples_dictionary_entries()
+            stage.count('header samples', len(self.backup_line_split_by_sample))
         # process the horizontal data tables
-        self.use_sample_indexes_to_get_sample_data()
-        # create entries of any samples not covered in the horizontal data tables
-        self.generate_backup_samples_dictionary_entries()
-        # checks for empty samples_dictionary keys, if it is still empty, nothing is going to be written to file.
-        self.qc_check_for_samples_dictionary_keys_after_backups_made()
+        with self.metrics.stage('horizontal tables') as stage:
+            self.use_sample_indexes_to_get_sample_data()
+            stage.count('tables', len(self.sample_list_indexes))
+            stage.count('triplets produced', sum(len(sample.results) for sample in self.samples_dictionary.values()))
+        with self.metrics.stage('backup samples') as stage:
+            samples_before_backups = len(self.samples_dictionary)
+            # index the samples by sample number, so header samples and ICP data can find their entry
+            self.index_sample_numbers()
+            # create entries of any samples not covered in the horizontal data tables
+            self.generate_backup_samples_dictionary_entries()
+            # checks for empty samples_dictionary keys, if it is still empty, nothing is going to be written to file.
+            self.qc_check_for_samples_dictionary_keys_after_backups_made()
+            stage.count('samples added', len(self.samples_dictionary) - samples_before_backups)
         # finally, process the ICP data files, having dealt with the sample metadata
-        self.use_analyte_indexes_to_get_sample_data()
-        # checks to see if the metal triplets dictionary has keys, if there are none, ICP data won't be written.
-        self.qc_check_for_metal_triplets_dictionary_keys_after_analyte_indexes()
+        with self.metrics.stage('icp tables') as stage:
+            self.use_analyte_indexes_to_get_sample_data()
+            # checks to see if the metal triplets dictionary has keys, if there are none, ICP data won't be written.
+            self.qc_check_for_metal_triplets_dictionary_keys_after_analyte_indexes()
+            stage.count('tables', len(self.analyte_list_indexes))
+            stage.count('triplets produced', sum(len(triplets) for triplets in self.metal_triplets_dictionary.values()))
         # combine the metal triplets with the rest of the data triplets
-        self.combine_metal_triplet_dictionary_with_samples_dictionary()
+        with self.metrics.stage('merge') as stage:
+            self.combine_metal_triplet_dictionary_with_samples_dictionary()
+            stage.count('samples', len(self.samples_dictionary))
+        if self.table_cache is not None:
+            with self.metrics.stage('table cache') as stage:
+                self.table_cache.put_report(self.mb_file, self.column_mode,
+                                            (self.samples_dictionary, self.job_dictionary, self.parse_log))
+                self.log_table_cache_use()
+                stage.count('tables from cache', self.tables_from_cache)
         # return the properly formatted intermediate data, ready for conversion
         return self.samples_dictionary, self.job_dictionary, self.parse_log
 
-    def split_lines_by_spacing(self):
-        """ converts each line in self.mb_file into a list, split by spaces.
-        """
-
-        for item in self.mb_file:
-            self.mb_file_split_lines.append(item.split())
-
     def get_client_name_and_jobnumber(self):
         """gets the client name and the job number from the first line of the text file.
 
         Jobnumber is also passed to class as a parameter
         (forgot, wrote this unnecessary bit of code, too lazy to delete). """
 
-        # if you leave a blank line before the start of the header, will need to access self.fc_file_split_lines[1][0:2]
+        # if you leave a blank line before the start of the header, will need to access self.mb_file[1]
         # otherwise, you want to access the first line.
-        self.job_dictionary['client identifier'] = " ".join(self.mb_file_split_lines[0][0:2])
-        self.job_dictionary['job number'] = self.get_job_number_from_first_line(self.mb_file_split_lines[0])
+        first_line = self.mb_file[0].split()
+        self.job_dictionary['client identifier'] = " ".join(first_line[0:2])
+        self.job_dictionary['job number'] = self.get_job_number_from_first_line(first_line)
 
     def get_job_number_from_first_line(self, list_to_check):
         """finds the job number in the first line.
@@ -231,61 +317,114 @@ class EasyTraxParse:
             return list_to_check[-2]
 
     def look_for_anchor_indexes_in_split_lines(self):
-        """ looks for anchor indices in the split lines. Adds them to the relevant list. 3 types of anchors.
-
-        first filters out empty lines.
-
-        If a line has something in it, checks to see if the first index is 'SAMPLE'.
+        """ looks for anchor indices in the lines of the file, and works out where each table ends, in one pass.
 
-        If it is, adds the index of the line to sample_list_indexes. These indexes are used to parse
-        horizontal data tables. Uses counter, otherwise will get first instance of list in mb_file_split_lines,
-        which can be an issue with tables of the same size, same units, same samples.
+        3 types of anchors. Each anchor found is added to table_index as an EasyTraxTable, and the index of its line is
+        added to the relevant list. Lines are only checked for their first word here, they aren't split up.
 
-        Then checks if the first index is 'Samples:'. If it is, adds the index to backup_sample_list_indexes.
+        If the first index of a line is 'SAMPLE', the line starts a horizontal data table. The index is added to
+        sample_list_indexes. The analyte names are on the line above, and the sample lines start two lines below.
 
-        These indexes are used to parse sample metadata from the header part of the report (name, date, location, etc).
+        If the first index is 'Samples:', the line starts the sample metadata in the header part of the report (name,
+        date, location, etc). The index is added to backup_sample_list_indexes.
         This information is generally taken from horizontal data tables, and then the ICP data tables piggyback.
         If there are no horizontal data tables, or if there are samples in vertical data tables that aren't present
         in horizontal data tables, we need a second way to get sample metadata. That's what the backup is for.
 
-        Finally checks if the first index is 'ELEMENTS'.
+        If the first index is 'ELEMENTS', the line starts a vertical ICP style data table. The index is added to
+        analyte_list_indexes. The sample numbers are on the line above, and the analyte rows start two lines below.
 
-        If it is, adds the index to analyte_list_indexes. These indexes are used to parse vertical ICP style
-        data tables.
+        Every table ends at the first blank line at or after the line its data starts on (or the end of the file).
+        ICP tables are also capped at EasyTraxTable.ICP_ANALYTE_ROWS analyte rows.
 
         At the end of the method, there is functionality to report to the log the amount of data tables picked up,
         and a warning message that fires if you have ICP tables and no backup sample metadata. """
 
-        counter = 0
-        for item in self.mb_file_split_lines:
-            if len(item) > 0:
-                if item[0] == 'SAMPLE':
-                    self.sample_list_indexes.append(counter)
-                elif item[0] == 'Samples:':
-                    self.backup_sample_list_indexes.append(counter)
-                elif item[0] == 'ELEMENTS':
-                    self.analyte_list_indexes.append(counter)
-                else:
-                    pass
-            counter += 1
+        anchors = {'SAMPLE': (EasyTraxTable.HORIZONTAL, self.sample_list_indexes, 1, 2),
+                   'Samples:': (EasyTraxTable.HEADER, self.backup_sample_list_indexes, 0, 0),
+                   'ELEMENTS': (EasyTraxTable.ICP, self.analyte_list_indexes, 1, 2)}
+        # tables that haven't hit their closing blank line yet, as [table, index the data starts at]
+        open_tables = []
+        for counter, line in enumerate(self.mb_file):
+            item = line.lstrip()
+            if not item:
+                if open_tables:
+                    still_open = []
+                    for table_and_data_start in open_tables:
+                        if counter >= table_and_data_start[1]:
+                            table_and_data_start[0].end = counter
+                        else:
+                            still_open.append(table_and_data_start)
+                    open_tables = still_open
+            elif item[0] in 'SE' and item.split(None, 1)[0] in anchors:
+                # only lines starting with S or E can be anchors, so most lines are never split
+                kind, anchor_list, lines_above, lines_to_data = anchors[item.split(None, 1)[0]]
+                anchor_list.append(counter)
+                table = EasyTraxTable(kind, counter, max(counter - lines_above, 0), self.column_mode)
+                self.table_index.append(table)
+                open_tables.append([table, counter + lines_to_data])
+        for table, data_start in open_tables:
+            table.end = len(self.mb_file)
+        for table in self.table_index:
+            if table.kind == EasyTraxTable.ICP:
+                table.end = min(table.end, table.start + 2 + EasyTraxTable.ICP_ANALYTE_ROWS)
+            table.raw_lines = self.mb_file[table.header_line:table.end]
         # Error handling
-        self.parse_log += '\nThere are ' + str(len(self.sample_list_indexes)) + ' horizontal data tables, \n' +\
-            'and ' + str(len(self.analyte_list_indexes)) + ' vertical ICP data tables in this file.\n'
+        self.parse_log.add('table-count', Diagnostics.EasyTraxDiagnostics.INFO,
+                           '\nThere are ' + str(len(self.sample_list_indexes)) + ' horizontal data tables, \n' +
+                           'and ' + str(len(self.analyte_list_indexes)) + ' vertical ICP data tables in this file.\n')
         if len(self.sample_list_indexes) == 0:
             if len(self.backup_sample_list_indexes) == 0:
-                self.parse_log += '\nThere is no backup sample data to accompany the ICP data. This build will fail.\n'
+                self.parse_log.add('no-backup-samples', Diagnostics.EasyTraxDiagnostics.ERROR,
+                                   '\nThere is no backup sample data to accompany the ICP data. ' +
+                                   'This build will fail.\n')
+
+    def parse_data_tables(self, kind):
+        """parses every table of the given kind in table_index.
+
+        if there is a table_cache, each table is looked up in it first, and only the tables that aren't there are
+        parsed (and then added to it). tables don't depend on each other, so if table_workers is more than 1 (and
+        there is more than one table to parse), they are parsed in a pool of worker processes. Results always come
+        back in the order the tables appear in the file, so merging them gives the same result either way.
+
+        Parameters
+        ----------
+        kind : str
+            EasyTraxTable.HORIZONTAL or EasyTraxTable.ICP
+
+        Returns
+        -------
+        tables_and_data : list
+            [table, the parsed data of the table, as returned by EasyTraxTable.parse()] for each table.
+        """
+
+        tables = [table for table in self.table_index if table.kind == kind]
+        table_data = [None] * len(tables)
+        if self.table_cache is not None:
+            table_data = [self.table_cache.get(table) for table in tables]
+        tables_to_parse = [table for table, data in zip(tables, table_data) if data is None]
+        self.tables_from_cache += len(tables) - len(tables_to_parse)
+        if self.table_workers and self.table_workers > 1 and len(tables_to_parse) > 1:
+            with ProcessPoolExecutor(max_workers=min(self.table_workers, len(tables_to_parse))) as executor:
+                parsed_data = list(executor.map(parse_table, tables_to_parse))
+        else:
+            parsed_data = [table.parse() for table in tables_to_parse]
+        parsed_data = iter(parsed_data)
+        for counter, table in enumerate(tables):
+            if table_data[counter] is None:
+                table_data[counter] = next(parsed_data)
+                if self.table_cache is not None:
+                    self.table_cache.put(table, table_data[counter])
+        return list(zip(tables, table_data))
 
     def pre_generate_backup_samples_dictionary_entries(self):
         """generates backup samples dictionary metadata entries, so that ICP formatted data can be properly assigned.
 
-        there may be many indexes, we only need one as all the sample lists should be the same. Will have to deal with
-        this if this is not the case in the future (09June21).
-
-        empty_list is used to determine when we've come to a gap in the page, which means we are no longer reading in
-        our sample information.
+        there may be many header tables, we only need one as all the sample lists should be the same. Will have to deal
+        with this if this is not the case in the future (09June21).
 
-        Once a gap is hit, it's assumed that we've reached the end of the header. We then collapse all the lists of
-        lines into one long list. We iterate through this list.
+        The header table ends at the first gap in the page, which means we are no longer reading in our sample
+        information. We collapse all the lines of the table into one long list. We iterate through this list.
 
         The first time we hit a parenthesis ')', we know were at the start of a sample. Once we hit another parenthesis,
         we know we are at the start of the next sample.
@@ -294,21 +433,9 @@ class EasyTraxParse:
         date, and time, the first item will be the sample number, and the remaining indexes when combined in order
         are the sample name. """
 
-        # once we hit a gap in the file, empty_list will be set to true, and we will know we are at the end of the
-        # sample information.
-        empty_list = False
-        # the line that 'Samples: ' is on.
-        backup_sample_list_index = self.backup_sample_list_indexes[0]
-        backup_sample_lines = []
-        while not empty_list:
-            backup_samples_line = self.mb_file_split_lines[backup_sample_list_index]
-            if len(backup_samples_line) == 0:
-                empty_list = True
-            else:
-                backup_sample_lines.append(backup_samples_line)
-                backup_sample_list_index += 1
+        header_table = [table for table in self.table_index if table.kind == EasyTraxTable.HEADER][0]
         # collapsing the lines (which may have more than one sample, or may have one sample) into one list.
-        backup_sample_lines = [item for sublist in backup_sample_lines for item in sublist]
+        backup_sample_lines = [item for sublist in header_table.split_lines() for item in sublist]
         # if keep adding is False, we have hit the next sample, so stops adding
         # starts as false so we don't add all the extra info before the first sample
         # first parenthesis encountered then turns keep_adding to True
@@ -336,62 +463,441 @@ class EasyTraxParse:
         self.backup_line_split_by_sample.append(single_sample)
 
     def use_sample_indexes_to_get_sample_data(self):
-        """ iterates through the indexes in sample_list_indexes, and uses them to fill samples_dictionary with data.
+        """ parses the horizontal tables, and uses them to fill samples_dictionary with data.
+
+        sort of a controller function. Each horizontal table is a data table that needs to be 'harvested'. The tables
+        are parsed by parse_data_tables(), then each table's samples and data triplets are added to the
+        samples_dictionary, in the order the tables appear in the file. """
+
+        for table, table_data in self.parse_data_tables(EasyTraxTable.HORIZONTAL):
+            self.generate_samples_dictionary_entries(table_data['samples binary list'])
+            self.add_data_triplets_to_samples_dictionary(table, table_data)
+
+    def generate_samples_dictionary_entries(self, samples_binary_list):
+        """creates the keys (sample name) in sample dictionary, populates with sample metadata (location, date, time)
+
+        iterates through the items in the first list in each binary list in samples_binary_list. If the key is already
+        in the dictionary, we pass (there will n copies of each name in samples_binary_list, with n being the amount
+        of horizontal data tables existing in the parsed document).
+
+        if the length of the item is 1, it's a blank, because a sample has a name, location, date, and time. Otherwise,
+        the item is assumed to be a sample, and handled accordingly. """
+
+        for item in samples_binary_list[0]:
+            if len(item) == 1:
+                # is assumed to be a lab blank
+                if item[0] in self.samples_dictionary:
+                    pass
+                else:
+                    self.samples_dictionary[item[0]] = Model.EasyTraxSample(item[0], "no location", "no date",
+                                                                            "no time")
+            else:
+                # is assumed to be a sample
+                if item[0] in self.samples_dictionary:
+                    pass
+                else:
+                    self.samples_dictionary[item[0]] = Model.EasyTraxSample(item[0], item[1], item[2], item[3])
 
-        sort of a controller function, mostly calls other functions in the correct order. Each sample index represents
-        a data table that needs to be 'harvested'. for data table, the analyte names, units, and values are isolated,
-        and then re-assembled in an intermediate format that we use to make the WTX files. """
+    def add_data_triplets_to_samples_dictionary(self, table, table_data):
+        """ adds the data triplets of one horizontal table to the samples dictionary, via the sample name key.
 
-        for item in self.sample_list_indexes:
-            # each item is an index.
-            analyte_information = self.get_analyte_information(item)
-            units = self.get_units_information(item)
-            samples = self.get_samples_data(item)
-            samples_binary_list = self.split_samples_into_name_and_information(samples,
-                                                                               analyte_information)
-            self.generate_samples_dictionary_entries(samples_binary_list)
-            self.generate_data_triplets(analyte_information, units, samples_binary_list)
+        each sample line that couldn't be fully parsed (see EasyTraxTable.generate_data_triplets) is logged, with the
+        line the table starts on and the sample name.
 
-    def get_analyte_information(self, sample_index):
-        """gets analyte information from line above sample index.
+        Parameters
+        ----------
+        table : EasyTraxTable
+            the horizontal table.
+        table_data : dict
+            the parsed data of the table, as returned by EasyTraxTable.parse(). """
+
+        for sample_name_and_dict_key, triplets in table_data['data triplets']:
+            self.samples_dictionary[sample_name_and_dict_key].add_results(triplets)
+        for sample_name in table_data['bad sample lines']:
+            self.parse_log.add('bad-sample-line', Diagnostics.EasyTraxDiagnostics.WARNING,
+                               "\nAt least one horizontal data table has issues preventing\n" +
+                               "it from being parsed properly.\n\n" +
+                               "Potential Issues:\n" +
+                               "1) There is a space in an analyte name, like 'Domoic Acid'.\n" +
+                               "turn the spaces into underscores, and try again.\n",
+                               table=table.start + 1, sample=sample_name)
+
+    def index_sample_numbers(self):
+        """builds sample_number_index from the keys in samples_dictionary.
+
+        every sample name starts with its sample number ('12 Site 12 Tap'). Keys that don't (like 'Lab Blank') aren't
+        indexed. If two keys have the same sample number, the first one in samples_dictionary is kept. """
+
+        self.sample_number_index = {}
+        for key in self.samples_dictionary:
+            sample_number = get_sample_number(key)
+            if sample_number is not None and sample_number not in self.sample_number_index:
+                self.sample_number_index[sample_number] = key
+
+    def generate_backup_samples_dictionary_entries(self):
+        """generates the backup sample dictionary metadata if no horizontal tables are in the report.
+
+        There are two options that require backup metadata - either there are no horizontal tables,
+        or there are samples that exist in vertical data tables that don't exist in subsequent horizontal
+        data tables in the file.
+
+        Checks to see if there are any backup sample indices to work on - sometimes, when there is only
+        horizontal data in the report, the admin staff don't add in the samples line.
+
+        Each sublist corresponds to a sample. The first item in the sublist is the sample number followed by a
+        parenthesis ('12)'), any amount of digits long.
+
+        We then look the sample number up in sample_number_index. If we don't already have information on the
+        particular sample, we make a new samples dictionary entry (and index it), and now the ICP data has somewhere
+        to go. """
+
+        if self.backup_line_split_by_sample:
+            # there will be a list of lists, so the first if statement will always fire
+            # if we went straight to the second statement, we'd get an index not found error if there was nothing
+            # doing the above if statement first avoids that
+            if self.backup_line_split_by_sample[0]:
+                for sublist in self.backup_line_split_by_sample:
+                    sample_number = get_sample_number(sublist[0])
+                    # if we already have the sample, no need to re-create the entry
+                    if sample_number not in self.sample_number_index:
+                        # making the entry
+                        time = sublist.pop()
+                        date = sublist.pop()
+                        location_code = sublist.pop()
+                        sublist[0] = sublist[0].split(')', 1)[0]
+                        new_key = ' '.join(sublist)
+                        location_code_check = check_to_see_if_bad_location_code(location_code)
+                        if not location_code_check:
+                            self.parse_log.add('bad-location-code', Diagnostics.EasyTraxDiagnostics.WARNING,
+                                               '\nBad location code identifier. Code is either longer than\n' +
+                                               '5 letters, or doesnt contain a number. WTX file will likely contain '
+                                               'errors.\n', line=self.backup_sample_list_indexes[0] + 1,
+                                               sample=new_key)
+                        self.samples_dictionary[new_key] = Model.EasyTraxSample(new_key, location_code, date, time)
+                        if sample_number is not None:
+                            self.sample_number_index[sample_number] = new_key
+
+    def use_analyte_indexes_to_get_sample_data(self):
+        """ parses the ICP tables, and uses them to fill metal_triplets_dictionary with data.
+
+         The ICP tables are parsed by parse_data_tables() (see EasyTraxTable.parse_icp_table for how). Each table gives
+         back an EasyTraxICPMatrix, which is kept in icp_matrices. The matrix is turned into the data triplets of every
+         sample number in the table, which are added to metal_triplets_dictionary in the order the tables appear in
+         the file. A sample number that appears in more than one ICP table keeps the triplets of the last table it
+         appears in.
+
+         Once metal_triplets_dictionary is populated, it is combined with sample_dictionary using
+         self.combine_metal_triplet_dictionary_with_samples_dictionary. """
+
+        for table, icp_matrix in self.parse_data_tables(EasyTraxTable.ICP):
+            self.icp_matrices.append(icp_matrix)
+            self.metal_triplets_dictionary.update(icp_matrix.to_triplets_dictionary())
+
+    def combine_metal_triplet_dictionary_with_samples_dictionary(self):
+        """assimilates metals_triplet_dictionary with samples_dictionary.
+
+        Iterates through metal_triplets_dictionary items, and looks the sample number of each up in
+        sample_number_index. If it is there, the value from metal_triplets_dictionary is added to the results of the
+        appropriate sample in samples_dictionary. This works because the keys (sample names) in samples_dictionary
+        start with the sample number, and the keys for metals_triplet_dictionary are the sample numbers.
+
+        ICP columns that aren't a sample number are matched to the first samples_dictionary key starting with them. """
+
+        for key, value in self.metal_triplets_dictionary.items():
+            sample_number = get_sample_number(key)
+            if sample_number is not None:
+                if sample_number in self.sample_number_index:
+                    self.samples_dictionary[self.sample_number_index[sample_number]].add_results(value)
+            else:
+                for item in self.samples_dictionary:
+                    if item.startswith(key):
+                        self.samples_dictionary[item].add_results(value)
+                        break
+
+    def get_report_from_table_cache(self):
+        """if the whole report is in table_cache (nothing in it has changed since it was last parsed), uses the cached
+        samples_dictionary, job_dictionary, and parse_log, rather than parsing the report again.
+
+        Returns
+        -------
+        bool
+            True if the report was found in the cache.
+        """
+
+        report_data = self.table_cache.get_report(self.mb_file, self.column_mode)
+        if report_data is None:
+            return False
+        self.samples_dictionary, self.job_dictionary, self.parse_log = report_data
+        self.report_from_cache = True
+        self.parse_log.add('report-cache', Diagnostics.EasyTraxDiagnostics.INFO,
+                           '\nThis report is unchanged since the last run,\n' +
+                           'and was read from the cache.\n')
+        return True
+
+    def log_table_cache_use(self):
+        """logs how many data tables were read from table_cache rather than parsed, then trims the cache, so it
+        doesn't grow past its size limit. """
+
+        data_tables = len([table for table in self.table_index if table.kind != EasyTraxTable.HEADER])
+        self.parse_log.add('table-cache', Diagnostics.EasyTraxDiagnostics.INFO,
+                           '\n' + str(self.tables_from_cache) + ' of ' + str(data_tables) + ' data tables were\n' +
+                           'unchanged since the last run, and were read from the cache.\n')
+        self.table_cache.trim()
+
+    def qc_check_for_samples_dictionary_keys_after_backups_made(self):
+        """checks to see if there are any sample dictionary keys after the backups are made.
+
+        If there aren't, it means that no sample metadata has been gathered, and the overall file conversion will
+        certainly fail.
+        """
+
+        if len(self.samples_dictionary.keys()) == 0:
+            self.parse_log.add('no-samples', Diagnostics.EasyTraxDiagnostics.ERROR,
+                               '\nno samples dictionary keys have been created.\n' +
+                               'script was unable to pull sample information\n' +
+                               'from either horizontal data tables, or\n' +
+                               'header information.\n\n')
+
+    def qc_check_for_metal_triplets_dictionary_keys_after_analyte_indexes(self):
+        """checks to see if there are analyte indexes available but no metal triplet dictionary keys.
+
+        This means that at least 1 ICP table has not been parsed properly. """
+
+        if len(self.metal_triplets_dictionary.keys()) == 0:
+            if len(self.analyte_list_indexes) > 0:
+                self.parse_log.add('no-icp-data', Diagnostics.EasyTraxDiagnostics.ERROR,
+                                   '\nno ICP keys have been created.\n' +
+                                   'an issue with the vertical ICP tables\n' +
+                                   'has prevented the script from reading data.\n\n' +
+                                   'Possible errors:\n\n' +
+                                   "1) 'Maximum Limits Permissable in Drinking Water'\n" +
+                                   'has been shortened or abbreviated somehow.\n\n' +
+                                   "2) Sample numbers are not on the line above the\n" +
+                                   "'ELEMENTS' tag.\n\n")
+
+
+class EasyTraxTable:
+    """One table in a FirstChoice report, found by EasyTraxParse.look_for_anchor_indexes_in_split_lines().
+
+    A table only holds its own slice of the file, so it can be parsed on its own, or sent to a worker process to be
+    parsed. parse() returns plain lists and dictionaries (or an EasyTraxICPMatrix for ICP tables), which
+    EasyTraxParse merges into the samples_dictionary and metal_triplets_dictionary.
+
+    There are 3 kinds of table:
+
+    * HORIZONTAL - analytes going across the page, samples going down. raw_lines[0] is the analyte names,
+      raw_lines[1] is the 'SAMPLE DATE TIME (units)' line, raw_lines[2] is skipped, and the sample lines start at
+      raw_lines[3].
+
+    * HEADER - the 'Samples:' sample metadata at the top of the report. Every line is sample metadata.
+
+    * ICP - analytes going down the page, samples across. raw_lines[0] is the sample numbers, raw_lines[1] is the
+      'ELEMENTS' line, raw_lines[2] is skipped, and the analyte rows start at raw_lines[3].
+
+    Data tables can be read in one of two column modes:
+
+    * SPLIT_COLUMNS - every line is split on spaces, and the pieces are put back together based on how many there
+      are (ex. the last x pieces of a sample line are the x values, the piece before them is the time, etc.).
+
+    * FIXED_WIDTH_COLUMNS - FirstChoice lines up its columns, so the columns that are blank on every data line of the
+      table separate one field from the next. These are found once per table (find_column_runs), matched to the
+      analyte names (or sample numbers) in the header line, and every line is then sliced by column. If the table
+      doesn't line up (a value is missing, a column can't be matched to its header, there are tabs), the table is
+      read in SPLIT_COLUMNS mode instead, so both modes always give the same result for a table that lines up.
+
+    Attributes
+    ----------
+    kind : str
+        HORIZONTAL, HEADER, or ICP.
+
+    start : int
+        the index (in the file) of the anchor line ('SAMPLE', 'Samples:', or 'ELEMENTS').
+
+    end : int
+        the index (in the file) of the line after the last line of the table.
+
+    header_line : int
+        the index (in the file) of the first line of the table - the analyte names of a horizontal table, the sample
+        numbers of an ICP table, or the 'Samples:' line.
+
+    units_line : int
+        the index (in the file) of the line holding the units (the anchor line), or None for HEADER tables.
+
+    column_mode : str
+        SPLIT_COLUMNS or FIXED_WIDTH_COLUMNS.
+
+    raw_lines : list(str)
+        the lines of the file from header_line up to end, as they are in the file.
+
+    Methods
+    -------
+    * `parse()` -
+        parses the table, based on its kind.
+
+    * `split_lines()` -
+        returns raw_lines, each split by spaces.
+
+    * `parse_horizontal_table()` -
+        parses a horizontal table into its samples and data triplets.
+
+        * `get_analyte_information(analyte_line)` -
+            gets the analyte names from the first line. Occasionally there is a 0 at the start of this line (for
+            whatever reason). If this 0 is found, it's removed.
+
+        * `get_units_information(units_line)` -
+            gets the units from the 'SAMPLE' line. Removes the first three items in the line, which are the strings
+            'SAMPLE', 'DATE', and 'TIME'.
+
+        * `get_samples_data()` -
+            gets the sample lines of the table, split by spaces.
+
+        * `split_samples_into_name_and_information(samples, analyte_information)` -
+            takes list of samples created by get_samples_data, and, using the analyte_information, splits the sample
+            lines into the two lists - one has the name, date, and time for the sample, and the other list has analyte
+            values.
+
+        * `slice_samples_into_name_and_information(analyte_information)` -
+            the FIXED_WIDTH_COLUMNS version of split_samples_into_name_and_information.
+
+        * `generate_data_triplets(analyte_information, units, samples_binary_list)` -
+            matches analyte names, units, and values for each analyte, for each sample.
+
+    * `parse_icp_table()` -
+        parses an ICP table into an EasyTraxICPMatrix.
+
+        * `slice_icp_table()` -
+            the FIXED_WIDTH_COLUMNS version of parse_icp_table.
+
+    * `get_value_columns(header_spans)` -
+        finds the column (start, end) of each value, by matching the header spans to the runs of the table.
+    """
+
+    HORIZONTAL = 'horizontal'
+    HEADER = 'header'
+    ICP = 'icp'
+    SPLIT_COLUMNS = 'split'
+    FIXED_WIDTH_COLUMNS = 'fixed-width'
+    # actually are 34 analytes, I think - will need to check this. Pretty sure we are currently cutting off
+    # pH 02June21. (rows 0 to 33, so 34 rows are read)
+    ICP_ANALYTE_ROWS = 34
+
+    __slots__ = ('kind', 'start', 'end', 'header_line', 'units_line', 'column_mode', 'raw_lines')
+
+    def __init__(self, kind, start, header_line, column_mode=SPLIT_COLUMNS):
+        """
+        Parameters
+        ----------
+        kind : str
+            HORIZONTAL, HEADER, or ICP.
+        start : int
+            the index of the anchor line.
+        header_line : int
+            the index of the first line of the table.
+        column_mode : str
+            SPLIT_COLUMNS or FIXED_WIDTH_COLUMNS.
+        """
+
+        self.kind = kind
+        self.start = start
+        self.end = start
+        self.header_line = header_line
+        self.units_line = None if kind == self.HEADER else start
+        self.column_mode = column_mode
+        self.raw_lines = []
+
+    def __repr__(self):
+        return 'EasyTraxTable(' + self.kind + ', lines ' + str(self.header_line) + '-' + str(self.end) + ')'
+
+    def parse(self):
+        """parses the table, based on its kind.
+
+        Returns
+        -------
+        dict or EasyTraxICPMatrix
+            for HORIZONTAL tables, see parse_horizontal_table(). For ICP tables, see parse_icp_table().
+        """
+
+        if self.kind == self.HORIZONTAL:
+            return self.parse_horizontal_table()
+        if self.kind == self.ICP:
+            return self.parse_icp_table()
+        raise ValueError('only horizontal and ICP tables can be parsed on their own, not ' + self.kind + ' tables')
+
+    def split_lines(self):
+        """returns raw_lines, each split by spaces (ex. 'hello     world I am' -> ['hello','world','I','am'])."""
+
+        return [line.split() for line in self.raw_lines]
+
+    def parse_horizontal_table(self):
+        """ parses a horizontal table into its samples and data triplets.
+
+        the analyte names, units, and values are isolated, and then re-assembled in an intermediate format that we
+        use to make the WTX files.
+
+        Returns
+        -------
+        table_data : dict
+            'samples binary list' - see split_samples_into_name_and_information().
+            'data triplets' - list of [sample name, list of data triplets], one per sample line.
+            'bad sample lines' - the names of the samples whose lines couldn't be fully parsed.
+        """
+
+        analyte_information = self.get_analyte_information(self.raw_lines[0].split())
+        units = self.get_units_information(self.raw_lines[1].split())
+        samples_binary_list = None
+        if self.column_mode == self.FIXED_WIDTH_COLUMNS:
+            samples_binary_list = self.slice_samples_into_name_and_information(analyte_information)
+        if samples_binary_list is None:
+            samples = self.get_samples_data()
+            samples_binary_list = self.split_samples_into_name_and_information(samples, analyte_information)
+        data_triplets, bad_sample_lines = self.generate_data_triplets(analyte_information, units, samples_binary_list)
+        return {'samples binary list': samples_binary_list,
+                'data triplets': data_triplets,
+                'bad sample lines': bad_sample_lines}
+
+    def get_analyte_information(self, analyte_line):
+        """gets analyte information from line above the 'SAMPLE' line.
 
         sometimes there is a 0 at the start of this line, not sure why. If so, this method removes this character.
 
+        Parameters
+        ----------
+        analyte_line : list
+            the line above the 'SAMPLE' line, split by spaces.
+
         Returns
         -------
         analyte_information : list
             list containing analyte information."""
 
-        analyte_information = self.mb_file_split_lines[sample_index - 1]
+        analyte_information = analyte_line
         if analyte_information[0] == '0':
             analyte_information = analyte_information[1:]
         return analyte_information
 
-    def get_units_information(self, sample_index):
-        """gets units information from line of the sample index.
+    def get_units_information(self, units_line):
+        """gets units information from the 'SAMPLE' line.
 
         removes the first three elements of the list, which are the strings 'sample', 'date', and 'time'.
 
+        Parameters
+        ----------
+        units_line : list
+            the 'SAMPLE' line, split by spaces.
+
         Returns
         -------
         units : list
             list containing units information."""
 
-        units = self.mb_file_split_lines[sample_index]
-        units = units[3:]
+        units = units_line[3:]
         return units
 
-    def get_samples_data(self, sample_index):
-        """returns the lines of data in the horizontal sample tables.
+    def get_samples_data(self):
+        """returns the lines of data in the horizontal sample tables, split by spaces.
 
-        first line is two indexes ahead of the sample index. While there is information on subsequent lines, lines
-        are added to the samples variable (a list). if a line is blank, it signifies the end of the data table, at
-        which point the while loop is exited and the sample lines are returned.
-
-        Parameters
-        ----------
-        sample_index : int
-            index in the list of lists representing the mb labs file corresponding to a horizontal data table
+        first line is two lines below the 'SAMPLE' line. The table ends at the first blank line, which was found when
+        the table was indexed, so every line from there to the end of the table is a sample line.
 
         Returns
         -------
@@ -399,17 +905,7 @@ class EasyTraxParse:
             list of list containing lines of the horizontal data table in question
         """
 
-        samples = []
-        item_index = sample_index + 2
-        blank_counter = 0
-        while blank_counter == 0:
-            sample = self.mb_file_split_lines[item_index]
-            if len(sample) > 0:
-                samples.append(sample)
-                item_index += 1
-            else:
-                blank_counter += 1
-        return samples
+        return [line.split() for line in self.raw_lines[3:]]
 
     def split_samples_into_name_and_information(self, samples, analyte_information):
         """splits raw sample lines into two lists - one containing sample name info, and one containing analyte info.
@@ -445,7 +941,7 @@ class EasyTraxParse:
                 sample_date = sample_name_date_time_list.pop()
                 # sample_name_date_time_list = [name, sampling location (hopefully)]
                 sampling_information = sample_name_date_time_list[-1]
-                sampling_information_check = self.check_to_see_if_bad_location_code(sampling_information)
+                sampling_information_check = check_to_see_if_bad_location_code(sampling_information)
                 if sampling_information_check is True:
                     # i.e. if the last item in the sample_name_date_time_list has a length of 5 with at least one int
                     sampling_information = sample_name_date_time_list.pop()
@@ -460,53 +956,81 @@ class EasyTraxParse:
                 sample_information.append(item[index_samples_start_at:])
         return [sample_name_date_time, sample_information]
 
-    def check_to_see_if_bad_location_code(self, sampling_information):
-        # checks for sampling information. All i can do is look for 5 character sequences with at least 1 number
-        # and assume that's the sampling location.
-        check_for_digits = False
-        if len(sampling_information) == 5:
-            for sub_item in sampling_information:
-                if sub_item.isdigit():
-                    check_for_digits = True
-        return check_for_digits
+    def slice_samples_into_name_and_information(self, analyte_information):
+        """the FIXED_WIDTH_COLUMNS version of split_samples_into_name_and_information.
 
-    def generate_samples_dictionary_entries(self, samples_binary_list):
-        """creates the keys (sample name) in sample dictionary, populates with sample metadata (location, date, time)
+        the value columns are found once for the table (see get_value_columns), using the analyte names on the first
+        line. Each sample line is then cut into the part before the first value column (name, location, date, time)
+        and one value per column. The date and time are the last two words of the first part, and the location is the
+        word before them, if it looks like a location code.
 
-        iterates through the items in the first list in each binary list in samples_binary_list. If the key is already
-        in the dictionary, we pass (there will n copies of each name in samples_binary_list, with n being the amount
-        of horizontal data tables existing in the parsed document).
+        Parameters
+        ----------
+        analyte_information : list
+            the analyte names, as returned by get_analyte_information.
 
-        if the length of the item is 1, it's a blank, because a sample has a name, location, date, and time. Otherwise,
-        the item is assumed to be a sample, and handled accordingly. """
+        Returns
+        -------
+        sample_name_date_time, sample_information : [list, list]
+            the same as split_samples_into_name_and_information, or None if the table doesn't line up.
+        """
 
-        for item in samples_binary_list[0]:
-            if len(item) == 1:
-                # is assumed to be a lab blank
-                if item[0] in self.samples_dictionary:
-                    pass
-                else:
-                    self.samples_dictionary[item[0]] = ["no location", "no date", "no time"]
+        header_spans = [(match.start(), match.end()) for match in re.finditer(r'\S+', self.raw_lines[0])]
+        if len(header_spans) < len(analyte_information) or not analyte_information:
+            return None
+        value_columns = self.get_value_columns(header_spans[len(header_spans) - len(analyte_information):])
+        if value_columns is None:
+            return None
+        values_start = value_columns[0][0]
+        values_end = value_columns[-1][1]
+        value_count = len(value_columns)
+        sample_name_date_time = []
+        sample_information = []
+        for line in self.raw_lines[3:]:
+            # the value columns are separated by columns that are blank on every line, so if every column has a
+            # value in it, splitting just the values part of the line gives exactly one value per column.
+            values = line[values_start:values_end].split()
+            if len(values) != value_count:
+                return None
+            name_date_time = line[:values_start].strip()
+            if name_date_time == 'Lab Blank':
+                sample_name_date_time.append([name_date_time])
+                sample_information.append(values)
+                continue
+            name_date_time = name_date_time.rsplit(None, 2)
+            if len(name_date_time) < 3 or name_date_time[0].startswith('Lab Blank'):
+                return None
+            sample_name, sample_date, sample_time = name_date_time
+            name_and_location = sample_name.rsplit(None, 1)
+            if check_to_see_if_bad_location_code(name_and_location[-1]):
+                sampling_information = name_and_location[-1]
+                sample_name = name_and_location[0] if len(name_and_location) == 2 else ''
             else:
-                # is assumed to be a sample
-                if item[0] in self.samples_dictionary:
-                    pass
-                else:
-                    self.samples_dictionary[item[0]] = [item[1], item[2], item[3]]
+                sampling_information = 'no location'
+            if '  ' in sample_name:
+                sample_name = ' '.join(sample_name.split())
+            sample_name_date_time.append([sample_name, sampling_information, sample_date, sample_time])
+            sample_information.append(values)
+        return [sample_name_date_time, sample_information]
 
     def generate_data_triplets(self, analyte_information, units, samples_binary_list):
-        """ generates data triplets [analyte, unit, value] and adds via the sample name key to the samples dictionary
+        """ generates data triplets [analyte, unit, value] for each sample name in the table.
 
         iterates through the samples_binary_list[0]. Keeps track of the index using sample_number_index so it can access
         the right list in samples_binary_list[1]. Needs to be a separate unit index and item index because some analytes
         (so far all I've found is pH, but I believe there are others) don't have units. Assembles data triplets, and
-        appends them to the list values in samples dictionary.
+        collects them under the sample name.
 
-        Raises
-        ------
-        IndexError
-            issue with a horizontal data table is causing an index mismatch. """
+        If a sample line runs out of values (IndexError), the triplets made before that point are kept, and the line
+        is added to the bad sample lines, which EasyTraxParse logs.
 
+        Returns
+        -------
+        data_triplets, bad_sample_lines : list, list
+            list of [sample name, list of data triplets], and the names of the samples with bad sample lines. """
+
+        data_triplets = []
+        bad_sample_lines = []
         sample_number_index = 0
         # so we can access the right spot in samples_binary_list[1].
         for item in samples_binary_list[0]:
@@ -515,8 +1039,9 @@ class EasyTraxParse:
             item_index = 0
             # will be the same as the unit index, except where there are no units for a given analyte. In which case,
             # there will be a mismatch (x units will not equal n values), and we need two counters to account for that.
-            sample_name_and_dict_key = item[0]
-            # this will be the same as the keys now in samples dictionary
+            sample_triplets = []
+            data_triplets.append([item[0], sample_triplets])
+            # item[0] will be the same as the keys in samples dictionary
             try:
                 for subitem in analyte_information:
                     analyte_name = subitem
@@ -528,204 +1053,348 @@ class EasyTraxParse:
                         # all other analytes other than pH (so far, 28May21) will have a unit
                         unit_index += 1
                     value = samples_binary_list[1][sample_number_index][item_index]
-                    self.samples_dictionary[sample_name_and_dict_key].append([analyte_name, analyte_unit, value])
-                    # appending, value is a list.
+                    sample_triplets.append([analyte_name, analyte_unit, value])
                     item_index += 1
                 sample_number_index += 1
             except IndexError:
-                self.parse_log += "\nAt least one horizontal data table has issues preventing\n" +\
-                                  "it from being parsed properly.\n\n" +\
-                                  "Potential Issues:\n" +\
-                                  "1) There is a space in an analyte name, like 'Domoic Acid'.\n" +\
-                                  "turn the spaces into underscores, and try again.\n"
+                bad_sample_lines.append(item[0])
+        return data_triplets, bad_sample_lines
 
-    def generate_backup_samples_dictionary_entries(self):
-        """generates the backup sample dictionary metadata if no horizontal tables are in the report.
+    def parse_icp_table(self):
+        """ reads an ICP table into an EasyTraxICPMatrix (analytes down, sample numbers across).
 
-        first looks at whether we have any samples dictionary keys already.
+         Trims off parts of the data table we don't need (mainly regulatory limit information, which
+         WaterTrax doesn't require).
 
-        There are two options that require backup metadata - either there are no horizontal tables,
-        or there are samples that exist in vertical data tables that don't exist in subsequent horizontal
-        data tables in the file.
+         Analyte rows are read up to the end of the table (at most ICP_ANALYTE_ROWS rows). Each row adds its analyte
+         identifier and unit to the matrix, and its values (one per sample number) to the end of the matrix values.
 
-        Checks to see if there are any backup sample indices to work on - sometimes, when there is only
-        horizontal data in the report, the admin staff don't add in the samples line.
+         If the value is below the LOQ (or LOD, not entirely sure how the lab does it), then we will write "<(x)",
+         where x is the LOD. We switch these for 'ND', which is what WaterTrax requires (aka non-detect). This is done
+         once for the whole matrix, after every row is read.
+
+        Returns
+        -------
+        icp_matrix : EasyTraxICPMatrix
+            the analyte identifiers, units, sample numbers, and values of the table.
+        """
 
-        Each sublist corresponds to a sample. The first two characters of the first item in the sublist
-        will be the sample number if the sample is between 10-99. Otherwise, the sample will fail an int
-        check because the second character will be a parenthesis, at which point we take just the first character.
+        if self.column_mode == self.FIXED_WIDTH_COLUMNS:
+            icp_matrix = self.slice_icp_table()
+            if icp_matrix is not None:
+                return icp_matrix
+        lines = self.split_lines()
+        # last 3 items in the samples list are ('Maximum','Limits','Permissable'), below line removes
+        sample_line = lines[0][:len(lines[0]) - 3]
+        sample_count = len(sample_line)
+        icp_matrix = EasyTraxICPMatrix(sample_line)
+        for subitem in lines[3:]:
+            # below removes the drinking water limit information from the analyte rows
+            if subitem[-1] == 'listed':
+                subitem = subitem[:len(subitem)-3]
+            elif subitem[-1] == 'AO':
+                subitem = subitem[:len(subitem)-4]
+            elif subitem[-1] == 'hard':
+                subitem = subitem[:len(subitem)-4]
+            else:
+                subitem = subitem[:len(subitem)-2]
+            try:
+                int(subitem[0][0])
+                # indicates a regular metal analyte line '1) Aluminum Al'
+                # in which case, we want 'Al' to be our analyte identifier
+                analyte_identifier = subitem[2]
+            except ValueError:
+                analyte_identifier = subitem[0] + ' ' + subitem[1] + ' ' + subitem[2]
+                # indicates a non-metal line with more info than just a two letter metal, like 'Hardness (as CaCO3)'
+                # in which case, we want the whole line to be our analyte identifier.
+            # the values start after the 3 words of the analyte name, one per sample number
+            row_values = subitem[3:3 + sample_count]
+            if len(row_values) < sample_count:
+                raise IndexError('ICP row ' + repr(' '.join(subitem)) + ' has fewer values than sample numbers')
+            icp_matrix.add_analyte_row(analyte_identifier, '(' + subitem[-1] + ')', row_values)
+        icp_matrix.replace_below_detection_limit_values()
+        return icp_matrix
+
+    def slice_icp_table(self):
+        """ the FIXED_WIDTH_COLUMNS version of parse_icp_table.
+
+        the value columns are found once for the table (see get_value_columns), using the sample numbers on the first
+        line. Each analyte row is then cut into the analyte name (everything before the first value column), one value
+        per sample number, and everything after the last value column, which starts with the unit. The drinking water
+        limits after the unit are never looked at, so they don't need to be trimmed off.
+
+        Rows starting with a number are metals ('1) Aluminum Al'), and the last word of the name is the analyte
+        identifier ('Al'). Any other row (like 'Hardness (mg/L CaCO3)') uses the whole name as the identifier.
 
-        We then check if we already have information on the particular sample. If we don't, we make a new
-        samples dictionary entry, and now the ICP data has somewhere to go. """
+        Returns
+        -------
+        icp_matrix : EasyTraxICPMatrix
+            the same as parse_icp_table, or None if the table doesn't line up.
+        """
 
-        # has default because if there are no keys at all, we won't be able to iterate through anything
-        # at "for item in samples_dictionary_keys":, and because we're just using this list for matching
-        # purposes, 'default' won't get used for anything.
-        samples_dictionary_keys = ['default']
-        for key in self.samples_dictionary.keys():
-            samples_dictionary_keys.append(key)
-        if self.backup_line_split_by_sample:
-            # there will be a list of lists, so the first if statement will always fire
-            # if we went straight to the second statement, we'd get an index not found error if there was nothing
-            # doing the above if statement first avoids that
-            if self.backup_line_split_by_sample[0]:
-                for sublist in self.backup_line_split_by_sample:
-                    # below deals with the sample number being either one or two digits
-                    sample_number = sublist[0][0:2]
-                    try:
-                        if int(sample_number):
-                            pass
-                    except ValueError:
-                        sample_number = sublist[0][0:1]
-                    sample_already_present = False
-                    # if we already have the sample, no need to re-create the entry
-                    for item in samples_dictionary_keys:
-                        if sample_number in item:
-                            sample_already_present = True
-                        else:
-                            pass
-                    # will still be false if we haven't found the sample
-                    if not sample_already_present:
-                        # making the entry
-                        time = sublist.pop()
-                        date = sublist.pop()
-                        location_code = sublist.pop()
-                        location_code_check = self.check_to_see_if_bad_location_code(location_code)
-                        if not location_code_check:
-                            self.parse_log += '\nBad location code identifier. Code is either longer than\n' +\
-                                '5 letters, or doesnt contain a number. WTX file will likely contain errors.\n'
-                        sublist[0] = sample_number
-                        new_key = ' '.join(sublist)
-                        self.samples_dictionary[new_key] = [location_code, date, time]
+        # last 3 items in the samples list are ('Maximum','Limits','Permissable'), below line removes
+        header_spans = [(match.start(), match.end()) for match in re.finditer(r'\S+', self.raw_lines[0])][:-3]
+        if not header_spans:
+            return None
+        value_columns = self.get_value_columns(header_spans)
+        if value_columns is None:
+            return None
+        icp_matrix = EasyTraxICPMatrix([self.raw_lines[0][span_start:span_end]
+                                        for span_start, span_end in header_spans])
+        values_start = value_columns[0][0]
+        values_end = value_columns[-1][1]
+        value_count = len(value_columns)
+        for line in self.raw_lines[3:]:
+            analyte_identifier = line[:values_start].strip()
+            unit = line[values_end:].split(None, 1)
+            # see slice_samples_into_name_and_information, one value per column if the line has them all.
+            values = line[values_start:values_end].split()
+            if not analyte_identifier or not unit or len(values) != value_count:
+                return None
+            if analyte_identifier[0].isdigit():
+                analyte_identifier = analyte_identifier.rsplit(None, 1)[-1]
+            elif '  ' in analyte_identifier:
+                analyte_identifier = ' '.join(analyte_identifier.split())
+            icp_matrix.add_analyte_row(analyte_identifier, '(' + unit[0] + ')', values)
+        icp_matrix.replace_below_detection_limit_values()
+        return icp_matrix
+
+    def get_value_columns(self, header_spans):
+        """finds the column (start, end) of each value, by matching the header spans to the runs of the table.
+
+        the runs of the table are the stretches of columns that aren't blank on every data line (see
+        find_column_runs). Each header (an analyte name, or a sample number) has to overlap exactly one run, and no
+        two headers can share a run, otherwise the table doesn't line up.
 
-    def use_analyte_indexes_to_get_sample_data(self):
-        """ generates data triplets from ICP data and appends them to the appropriate existing key in samples dict
+        Parameters
+        ----------
+        header_spans : list
+            (start, end) of each header on the first line of the table.
 
-         iterates through the analyte_list indexes, which are the starting indexes of the ICP tables contained in the
-         file being parsed.
+        Returns
+        -------
+        value_columns : list
+            (start, end) of each value column, in the same order as header_spans, or None if the table doesn't
+            line up.
+        """
 
-         Trims off parts of the data table we don't need (mainly regulatory limit information, which
-         WaterTrax doesn't require).
+        runs = find_column_runs(self.raw_lines[3:])
+        if not runs:
+            return None
+        value_columns = []
+        run_index = 0
+        for span_start, span_end in header_spans:
+            # skip the runs that end before this header starts
+            while run_index < len(runs) and runs[run_index][1] <= span_start:
+                run_index += 1
+            if run_index == len(runs) or runs[run_index][0] >= span_end:
+                return None
+            if run_index + 1 < len(runs) and runs[run_index + 1][0] < span_end:
+                return None
+            value_columns.append(runs[run_index])
+            run_index += 1
+        return value_columns
+
+
+# every byte is 1, except spaces and line endings (0), and tabs (2), which would throw the columns off.
+_COLUMN_MASK_TABLE = bytes(0 if byte in b' \r\n' else 2 if byte == ord('\t') else 1 for byte in range(256))
+_SAMPLE_NUMBER_PATTERN = re.compile(r'\d+')
+_COLUMN_RUN_PATTERN = re.compile(b'\x01+')
+
+
+def find_column_runs(lines):
+    """finds the stretches of columns that have something in them on at least one line.
+
+    the lines are padded to the same width and turned into one long row of 1s (something there) and 0s (blank).
+    That row is read as one big number, and folded in half (or-ing the two halves together) until it is one line
+    wide. The columns are worked out this way without looping over every line, or every character, in python.
+
+    Parameters
+    ----------
+    lines : list(str)
+        the lines of a table, as they are in the file.
 
-         Analyte rows are read up to a pre-determined amount (total_amount_of_analytes).
+    Returns
+    -------
+    runs : list
+        (start, end) of each run of columns, left to right. Empty if there are no lines, or a line has a tab.
+    """
+
+    if not lines:
+        return []
+    width = max(len(line) for line in lines)
+    block = ''.join([line.ljust(width) for line in lines]).encode('latin-1', 'replace')
+    mask = int.from_bytes(block.translate(_COLUMN_MASK_TABLE), 'big')
+    rows = len(lines)
+    while rows > 1:
+        # the low part keeps the bottom (rows - half) lines, the top half lines are or-ed onto them
+        half = rows // 2
+        shift = (rows - half) * width * 8
+        mask = (mask & ((1 << shift) - 1)) | (mask >> shift)
+        rows -= half
+    columns = mask.to_bytes(width, 'big')
+    if b'\x02' in columns or b'\x03' in columns:
+        return []
+    return [(match.start(), match.end()) for match in _COLUMN_RUN_PATTERN.finditer(columns)]
+
+
+class EasyTraxICPMatrix:
+    """The data of one ICP table, kept as a matrix: analytes down, sample numbers across.
+
+    Rather than a separate [analyte, unit, value] list for every cell, the table is kept as three vectors - the
+    sample numbers (the columns), and the analyte identifiers and units (the rows) - and one flat list of values, row
+    after row. The values of sample number j are every sample_count-th value starting at j, so one slice gives a
+    whole sample (transpose() does this for every sample at once), and all the values of an analyte are one
+    slice too, which makes comparing samples cheap.
 
-         For each sample in the table, a key is made in metal_triplets_dictionary. We then go through the analyte rows
-         we read off, and add data triplets from these rows to the relevant keys in metal_triplets_dictionary.
+    Attributes
+    ----------
+    sample_numbers : list(str)
+        the sample numbers along the top of the table, in order.
 
-         If the value is below the LOQ (or LOD, not entirely sure how the lab does it), then we will write "<(x)",
-         where x is the LOD. We switch these for 'ND', which is what WaterTrax requires (aka non-detect).
+    analytes : list(str)
+        the analyte identifier of each row, in order.
 
-         Once metal_triplets_dictionary is populated, it is combined with sample_dictionary using
-         self.combine_metal_triplet_dictionary_with_samples_dictionary. """
+    units : list(str)
+        the unit of each row, in brackets (ex. '(mg/L)').
 
-        for item in self.analyte_list_indexes:
-            total_amount_of_analytes = 33
-            # actually are 34 analytes, I think - will need to check this. Pretty sure we are currently cutting off
-            # pH 02June21.
-            current_analyte_index = 0
-            index_of_start_of_analyte_rows = item+2
-            analyte_rows = []
-            triplet_pairs_dictionary = {}
-            # last 3 items in the samples list are ('Maximum','Limits','Permissable'), below line removes
-            sample_line = self.mb_file_split_lines[item - 1][:len(self.mb_file_split_lines[item - 1]) - 3]
-            # last 3 items in the samples list are ('In','Drinking','Water'), below line removes
-            header_line = self.mb_file_split_lines[item][:len(self.mb_file_split_lines[item]) - 3]
-            # gets all the relevant analyte rows and adds them to analyte_rows
-            while current_analyte_index <= total_amount_of_analytes:
-                analyte_row = self.mb_file_split_lines[(index_of_start_of_analyte_rows + current_analyte_index)]
-                # below removes the drinking water limit information from the analyte rows
-                if analyte_row[-1] == 'listed':
-                    analyte_row = analyte_row[:len(analyte_row)-3]
-                elif analyte_row[-1] == 'AO':
-                    analyte_row = analyte_row[:len(analyte_row)-4]
-                elif analyte_row[-1] == 'hard':
-                    analyte_row = analyte_row[:len(analyte_row)-4]
-                else:
-                    analyte_row = analyte_row[:len(analyte_row)-2]
-                analyte_rows.append(analyte_row)
-                current_analyte_index += 1
-            for sample_number in sample_line:
-                self.metal_triplets_dictionary[sample_number] = []
-                # each sample number in the ICP table gets added as a key to metal_triplets_dictionary, and the value
-                # is an empty list (similar to how samples_dictionary works). We then start adding data triplet lists
-                # to this list.
-            for subitem in analyte_rows:
-                try:
-                    int(subitem[0][0])
-                    # indicates a regular metal analyte line '1) Aluminum Al'
-                    # in which case, we want 'Al' to be our analyte identifier
-                    analyte_identifier = subitem[2]
-                    value_counter = 3
-                    for sample_number in sample_line:
-                        value = subitem[value_counter]
-                        if value[0] == "<":
-                            # switches out <(x), where x == LOD, to ND
-                            value = 'ND'
-                        self.metal_triplets_dictionary[sample_number].append([analyte_identifier,
-                                                                              '(' + subitem[-1] + ')',
-                                                                              value])
-                        value_counter += 1
-                except ValueError:
-                    analyte_identifier = subitem[0] + ' ' + subitem[1] + ' ' + subitem[2]
-                    # indicates a non-metal line with more info than just a two letter metal, like 'Hardness (as CaCO3)'
-                    # in which case, we want the whole line to be our analyte identifier.
-                    value_counter = 3
-                    for sample_number in sample_line:
-                        value = subitem[value_counter]
-                        if value[0] == "<":
-                            # switches out <(x), where x == LOD, to ND
-                            value = 'ND'
-                        self.metal_triplets_dictionary[sample_number].append([analyte_identifier,
-                                                                              '(' + subitem[-1] + ')',
-                                                                              value])
-                        value_counter += 1
+    values : list(str)
+        every value in the table, row after row. Values below the detection limit are 'ND'.
 
-    def combine_metal_triplet_dictionary_with_samples_dictionary(self):
-        """assimilates metals_triplet_dictionary with samples_dictionary.
+    Methods
+    -------
+    * `add_analyte_row(analyte_identifier, unit, row_values)` -
+        adds one row (one analyte) to the matrix.
 
-        creates a list of samples_dictionary keys. Iterates through metal_triplets_dictionary items, and if the key
-        is in one the samples_dictionary_keys, then the value from metal_triplets_dictionary is appended to the
-        appropriate samples_dictionary list. This works because the keys (sample names) in samples_dictionary contain
-        the sample number, and the keys for metals_triplet_dictionary are the sample numbers. """
+    * `replace_below_detection_limit_values()` -
+        swaps every '<(x)' value for 'ND'.
 
-        samples_dictionary_keys = []
-        for key in self.samples_dictionary.keys():
-            samples_dictionary_keys.append(key)
-        for key, value in self.metal_triplets_dictionary.items():
-            for item in samples_dictionary_keys:
-                if key in item[:len(key)]:
-                    key = item
-                    for triplet in value:
-                        self.samples_dictionary[key].append(triplet)
+    * `get_sample_values(sample_index)` -
+        returns the values of one sample (one column).
 
-    def qc_check_for_samples_dictionary_keys_after_backups_made(self):
-        """checks to see if there are any sample dictionary keys after the backups are made.
+    * `get_analyte_values(analyte_index)` -
+        returns the values of one analyte (one row).
 
-        If there aren't, it means that no sample metadata has been gathered, and the overall file conversion will
-        certainly fail.
+    * `transpose()` -
+        returns the values of every sample, one list per sample.
+
+    * `to_triplets_dictionary()` -
+        returns the matrix as [analyte, unit, value] triplets, keyed by sample number.
+    """
+
+    __slots__ = ('sample_numbers', 'analytes', 'units', 'values')
+
+    def __init__(self, sample_numbers):
+        """
+        Parameters
+        ----------
+        sample_numbers : list(str)
+            the sample numbers along the top of the table.
         """
 
-        if len(self.samples_dictionary.keys()) == 0:
-            self.parse_log += '\nno samples dictionary keys have been created.\n' +\
-                              'script was unable to pull sample information\n' +\
-                              'from either horizontal data tables, or\n' +\
-                              'header information.\n\n'
+        self.sample_numbers = list(sample_numbers)
+        self.analytes = []
+        self.units = []
+        self.values = []
 
-    def qc_check_for_metal_triplets_dictionary_keys_after_analyte_indexes(self):
-        """checks to see if there are analyte indexes available but no metal triplet dictionary keys.
+    def add_analyte_row(self, analyte_identifier, unit, row_values):
+        """adds one row to the matrix. row_values has one value per sample number."""
 
-        This means that at least 1 ICP table has not been parsed properly. """
+        self.analytes.append(analyte_identifier)
+        self.units.append(unit)
+        self.values.extend(row_values)
 
-        if len(self.metal_triplets_dictionary.keys()) == 0:
-            if len(self.analyte_list_indexes) > 0:
-                self.parse_log += '\nno ICP keys have been created.\n' +\
-                                'an issue with the vertical ICP tables\n' +\
-                                'has prevented the script from reading data.\n\n' +\
-                                'Possible errors:\n\n' +\
-                                "1) 'Maximum Limits Permissable in Drinking Water'\n" +\
-                                'has been shortened or abbreviated somehow.\n\n' +\
-                                "2) Sample numbers are not on the line above the\n" +\
-                                "'ELEMENTS' tag.\n\n"
+    def replace_below_detection_limit_values(self):
+        """swaps out <(x), where x == LOD, for ND, for every value in the matrix."""
+
+        self.values = ['ND' if value[0] == '<' else value for value in self.values]
+
+    def get_sample_values(self, sample_index):
+        """returns the values of the sample in column sample_index, top to bottom."""
+
+        return self.values[sample_index::len(self.sample_numbers)]
+
+    def get_analyte_values(self, analyte_index):
+        """returns the values of the analyte in row analyte_index, left to right."""
+
+        sample_count = len(self.sample_numbers)
+        return self.values[analyte_index * sample_count:(analyte_index + 1) * sample_count]
 
+    def transpose(self):
+        """returns the values of every sample (every column), one list per sample, in sample number order."""
 
+        sample_count = len(self.sample_numbers)
+        return [self.values[sample_index::sample_count] for sample_index in range(sample_count)]
 
+    def to_triplets_dictionary(self):
+        """returns the matrix as data triplets, the intermediate format used by EasyTraxParse.
+
+        If a sample number appears more than once along the top of the table, its triplets are interleaved row by
+        row (row 1 column a, row 1 column b, row 2 column a...), the same as they always have been.
+
+        Returns
+        -------
+        triplets_dictionary : dict
+            key: sample number (str), value: list of data triplets [[analyte, unit, value],...]
+        """
+
+        columns = {}
+        for sample_index, sample_number in enumerate(self.sample_numbers):
+            columns.setdefault(sample_number, []).append(sample_index)
+        sample_values = self.transpose()
+        triplets_dictionary = {}
+        for sample_number, sample_indexes in columns.items():
+            if len(sample_indexes) == 1:
+                triplets_dictionary[sample_number] = list(map(list, zip(self.analytes, self.units,
+                                                                        sample_values[sample_indexes[0]])))
+            else:
+                triplets = []
+                for analyte_index in range(len(self.analytes)):
+                    for sample_index in sample_indexes:
+                        triplets.append([self.analytes[analyte_index], self.units[analyte_index],
+                                         sample_values[sample_index][analyte_index]])
+                triplets_dictionary[sample_number] = triplets
+        return triplets_dictionary
+
+
+def parse_table(table):
+    """parses one table. Module level so it can be sent to worker processes by EasyTraxParse.parse_data_tables()."""
+
+    return table.parse()
+
+
+def get_sample_number(sample_name):
+    """returns the sample number at the start of a sample name, a header sample ('12)'), or an ICP column ('12').
+
+    Parameters
+    ----------
+    sample_name : str
+        the sample name (ex. '12 Site 12 Tap').
+
+    Returns
+    -------
+    int or None
+        the sample number (ex. 12), or None if the name doesn't start with one (ex. 'Lab Blank').
+    """
+
+    sample_number = _SAMPLE_NUMBER_PATTERN.match(sample_name)
+    if sample_number is None:
+        return None
+    return int(sample_number.group())
+
+
+def check_to_see_if_bad_location_code(sampling_information):
+    """checks for sampling information. All i can do is look for 5 character sequences with at least 1 number
+    and assume that's the sampling location.
+
+    Returns
+    -------
+    check_for_digits : bool
+        True if sampling_information looks like a location code."""
+
+    check_for_digits = False
+    if len(sampling_information) == 5:
+        for sub_item in sampling_information:
+            if sub_item.isdigit():
+                check_for_digits = True
+    return check_for_digits
@@ -0,0 +1,378 @@
+import argparse
+import mmap
+import os
+import sys
+
+import EasyTraxCodes as Codes
+import EasyTraxConvert as Convert
+import EasyTraxModel as Model
+
+
+# WTX reports are written in the default encoding (see EasyTraxConvert.WTX_ENCODING), so are read in it too.
+WTX_ENCODING = Convert.WTX_ENCODING
+
+
+class EasyTraxWTXReader:
+    """Reads WTX reports back, into the intermediate format EasyTraxConvert makes them from.
+
+    EasyTraxConvert only writes WTX reports. This class opens a WTX report, or every .txt file under a directory of
+    them (WTX_reports, or the upload files made by EasyTraxBundle), and memory maps each file rather than reading it,
+    so only the parts that are used are ever read from disk.
+
+    Opening makes one pass over each file, and builds an index of where (file, and byte offsets) each job, sample, and
+    result is. After that, the results of one sample can be pulled out of a large consolidated file without reading
+    the rest of it, and a whole job can be turned back into a samples_dictionary of EasyTraxSample and a job
+    dictionary (see EasyTraxModel), ready for EasyTraxConvert, EasyTraxStore, or comparing with a new conversion.
+
+    A WTX report only holds codes, so the codes are looked up in the code tables (EasyTraxCodes.json) to get back the
+    MB Labs analyte names, units, client identifier, and date format. Where two MB Labs names share a WaterTrax code,
+    the first in the code tables is used. A code that isn't in the tables is kept as it is.
+
+    If a result is in more than one file (ex. W161000.txt and its replacement, W161000_R.txt), the one in the file
+    read last wins. Files are read in sorted order, so a replacement report wins over its original.
+
+    Can be run from the command line:
+
+        python EasyTraxReader.py WTX_reports --job W161000
+
+    Attributes
+    ----------
+    wtx_path : str
+        the WTX report, or directory of them, being read.
+
+    wtx_paths : list(str)
+        the full paths of the WTX reports read, in sorted order.
+
+    wtx_maps : list(mmap.mmap or None)
+        the memory map of each file in wtx_paths. None for an empty file, which can't be mapped.
+
+    job_index : dict
+        job number : list of the sample IDs of the job, in the order they are first found.
+
+    sample_index : dict
+        (job number, sample ID) : list of (file number, first byte, end byte) of the lines of the sample. The lines of
+        a sample are kept together in a WTX report, so there is one range per file it is in.
+
+    result_index : dict
+        (job number, sample ID, analyte code) : (file number, first byte, end byte) of the line of the result, without
+        its line ending.
+
+    line_count : int
+        the amount of WTX lines indexed.
+
+    skipped_lines : int
+        the amount of non-empty lines that had too few fields to be a result, and were left out.
+
+    Methods
+    -------
+    * `open()` -
+        finds and maps the WTX reports, and indexes them.
+
+        * `find_wtx_reports()` -
+            fills wtx_paths.
+
+        * `index_wtx_report(file_number)` -
+            adds the lines of one mapped file to the indexes.
+
+    * `get_sample_lines(job_number, sample_id)` -
+        returns the WTX lines of one sample.
+
+    * `get_result_line(job_number, sample_id, analyte_code)` -
+        returns the WTX line of one result.
+
+    * `read_sample(job_number, sample_id)` -
+        returns one sample as an EasyTraxSample.
+
+        * `get_result(fields)` -
+            turns the fields of a WTX line into an EasyTraxResult.
+
+    * `read_job(job_number)` -
+        returns a job as a samples_dictionary and a job dictionary.
+
+    * `close()` -
+        closes the memory maps.
+    """
+
+    def __init__(self, wtx_path):
+        """
+        Parameters
+        ----------
+        wtx_path : str
+            a WTX report, or a directory to read every .txt file under.
+        """
+
+        self.wtx_path = wtx_path
+        self.wtx_paths = []
+        self.wtx_maps = []
+        self.job_index = {}
+        self.sample_index = {}
+        self.result_index = {}
+        self.line_count = 0
+        self.skipped_lines = 0
+        self.code_registry = Codes.get_registry()
+        # the code tables the other way around, code : MB Labs value
+        self.analyte_names = {}
+        for analyte, codes in self.code_registry.analyte_codes.items():
+            self.analyte_names.setdefault(str(codes[0]), analyte)
+        self.unit_names = {}
+        for unit, unit_code in self.code_registry.unit_codes.items():
+            self.unit_names.setdefault(str(unit_code), unit)
+        self.month_names = {}
+        for month, month_code in self.code_registry.month_codes.items():
+            self.month_names.setdefault(month_code, month)
+        self.client_identifiers = {}
+        for client_identifier, client_id in self.code_registry.client_ids.items():
+            if client_identifier:
+                self.client_identifiers.setdefault(str(client_id), client_identifier)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        """finds the WTX reports, maps them, and indexes them.
+
+        Returns
+        -------
+        self : EasyTraxWTXReader
+            so a reader can be opened as it is made.
+        """
+
+        self.find_wtx_reports()
+        for file_number, wtx_path in enumerate(self.wtx_paths):
+            with open(wtx_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    self.wtx_maps.append(None)
+                    continue
+                # the map stays valid once the file is closed
+                self.wtx_maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self.index_wtx_report(file_number)
+        return self
+
+    def find_wtx_reports(self):
+        """fills wtx_paths with wtx_path, or if it is a directory, every .txt file under it, in sorted order."""
+
+        if not os.path.isdir(self.wtx_path):
+            self.wtx_paths = [self.wtx_path]
+            return
+        wtx_paths = []
+        for directory, directory_names, filenames in os.walk(self.wtx_path):
+            wtx_paths += [os.path.join(directory, filename) for filename in filenames if filename.endswith('.txt')]
+        self.wtx_paths = sorted(wtx_paths)
+
+    def index_wtx_report(self, file_number):
+        """adds the lines of one mapped WTX report to job_index, sample_index and result_index, in one pass.
+
+        each line is only split as far as the analyte code, and consecutive lines of the same sample are kept as one
+        byte range, so indexing a file is quick even when it holds thousands of jobs.
+
+        Parameters
+        ----------
+        file_number : int
+            the position of the file in wtx_paths and wtx_maps.
+        """
+
+        wtx_map = self.wtx_maps[file_number]
+        job_index = self.job_index
+        sample_index = self.sample_index
+        result_index = self.result_index
+        # the same job numbers, sample IDs and codes repeat on every line, so each is only decoded once
+        decoded = {}
+        report_field = Convert.REPORT_ID_FIELD
+        sample_field = Convert.SAMPLE_ID_FIELD
+        analyte_field = Convert.ANALYTE_CODE_FIELD
+        sample_key = None
+        sample_start = sample_end = 0
+        line_start = 0
+        for line in iter(wtx_map.readline, b''):
+            line_end = line_start + len(line.rstrip(b'\r\n'))
+            next_line_start = line_start + len(line)
+            fields = line.split(b'|', analyte_field + 1)
+            if len(fields) <= analyte_field:
+                if line_end > line_start:
+                    self.skipped_lines += 1
+                line_start = next_line_start
+                continue
+            key_fields = []
+            for field in (fields[report_field], fields[sample_field], fields[analyte_field]):
+                try:
+                    key_fields.append(decoded[field])
+                except KeyError:
+                    decoded[field] = field.decode(WTX_ENCODING, 'replace')
+                    key_fields.append(decoded[field])
+            job_number, sample_id, analyte_code = key_fields
+            if (job_number, sample_id) != sample_key:
+                if sample_key is not None:
+                    sample_index[sample_key].append((file_number, sample_start, sample_end))
+                sample_key = (job_number, sample_id)
+                sample_start = line_start
+                if sample_key not in sample_index:
+                    sample_index[sample_key] = []
+                    job_index.setdefault(job_number, []).append(sample_id)
+            sample_end = line_end
+            result_index[job_number, sample_id, analyte_code] = (file_number, line_start, line_end)
+            self.line_count += 1
+            line_start = next_line_start
+        if sample_key is not None:
+            sample_index[sample_key].append((file_number, sample_start, sample_end))
+
+    def get_sample_lines(self, job_number, sample_id):
+        """returns the WTX lines of one sample, without line endings. Only the bytes of the sample are read.
+
+        Parameters
+        ----------
+        job_number : str
+            the job number (the report ID of the WTX lines, ex. 'W161000').
+        sample_id : str
+            the WTX sample ID (ex. 'W161000-1').
+
+        Returns
+        -------
+        list(str)
+            the lines, in the order they are in the files. Empty if the sample isn't in the index.
+        """
+
+        sample_lines = []
+        for file_number, first_byte, end_byte in self.sample_index.get((job_number, sample_id), ()):
+            sample_data = self.wtx_maps[file_number][first_byte:end_byte].decode(WTX_ENCODING, 'replace')
+            sample_lines += [line.rstrip('\r') for line in sample_data.split('\n')]
+        return sample_lines
+
+    def get_result_line(self, job_number, sample_id, analyte_code):
+        """returns the WTX line of one result, without its line ending, or None if it isn't in the index."""
+
+        try:
+            file_number, first_byte, end_byte = self.result_index[job_number, sample_id, str(analyte_code)]
+        except KeyError:
+            return None
+        return self.wtx_maps[file_number][first_byte:end_byte].decode(WTX_ENCODING, 'replace')
+
+    def read_sample(self, job_number, sample_id):
+        """turns the lines of one sample back into an EasyTraxSample.
+
+        the sample name isn't in a WTX report, so the sample ID without the job number in front (ex. '1' for
+        'W161000-1') is used, which is also what EasyTraxConvert makes the WTX sample ID from. The date is turned back
+        into the MB Labs format (ex. '01022021' to '02Jan21'). If an analyte is in the sample more than once (ex. in a
+        report and its replacement), the last one wins, in the place of the first.
+
+        Returns
+        -------
+        sample : EasyTraxModel.EasyTraxSample or None
+            the sample, or None if it isn't in the index.
+        """
+
+        sample_lines = self.get_sample_lines(job_number, sample_id)
+        if not sample_lines:
+            return None
+        sample = None
+        results = {}
+        for line in sample_lines:
+            fields = line.split('|')
+            if sample is None:
+                sample_name = sample_id
+                if sample_id.startswith(job_number + '-'):
+                    sample_name = sample_id[len(job_number) + 1:]
+                wtx_date = fields[Convert.DATE_FIELD]
+                sample_date = wtx_date
+                if len(wtx_date) == 8 and wtx_date[0:2] in self.month_names:
+                    sample_date = wtx_date[2:4] + self.month_names[wtx_date[0:2]] + wtx_date[6:8]
+                sample = Model.EasyTraxSample(sample_name, fields[Convert.LOCATION_FIELD], sample_date,
+                                              fields[Convert.TIME_FIELD])
+            results[fields[Convert.ANALYTE_CODE_FIELD]] = self.get_result(fields)
+        sample.results = list(results.values())
+        return sample
+
+    def get_result(self, fields):
+        """turns the fields of one WTX line into an EasyTraxResult, looking the analyte and unit codes up in the code
+        tables. A code that isn't in them is used as it is."""
+
+        analyte_code = fields[Convert.ANALYTE_CODE_FIELD]
+        unit_code = fields[Convert.UNIT_CODE_FIELD] if len(fields) > Convert.UNIT_CODE_FIELD else ''
+        return Model.EasyTraxResult(self.analyte_names.get(analyte_code, analyte_code),
+                                    self.unit_names.get(unit_code, unit_code),
+                                    fields[Convert.VALUE_FIELD] if len(fields) > Convert.VALUE_FIELD else '')
+
+    def read_job(self, job_number):
+        """turns a job back into the intermediate format made by EasyTraxParse.
+
+        Returns
+        -------
+        samples_dictionary, job_dictionary : dict, dict
+            sample name : EasyTraxSample, in the order the samples are in the files, and the job number and client
+            identifier of the job. If the client ID has no identifier in the code tables, the client field is used as
+            it is (ex. 'No client ID'). Both are empty if the job isn't in the index.
+        """
+
+        samples_dictionary = {}
+        job_dictionary = {}
+        for sample_id in self.job_index.get(job_number, ()):
+            sample = self.read_sample(job_number, sample_id)
+            samples_dictionary[sample.name] = sample
+            if not job_dictionary:
+                file_number, first_byte, end_byte = self.sample_index[job_number, sample_id][0]
+                client_field = self.wtx_maps[file_number][first_byte:end_byte].split(b'|')[Convert.CLIENT_ID_FIELD]
+                client_field = client_field.decode(WTX_ENCODING, 'replace')
+                job_dictionary['job number'] = job_number
+                job_dictionary['client identifier'] = self.client_identifiers.get(client_field, client_field)
+        return samples_dictionary, job_dictionary
+
+    def close(self):
+        """closes the memory maps. The reader can't be used after this."""
+
+        for wtx_map in self.wtx_maps:
+            if wtx_map is not None:
+                wtx_map.close()
+        self.wtx_maps = []
+
+
+def main(argv=None):
+    """command line entry point. Prints what is in a WTX report (or directory of them), a job, a sample, or a result.
+
+    Returns
+    -------
+    int
+        0, or 1 if the job, sample, or result asked for isn't there.
+    """
+
+    parser = argparse.ArgumentParser(description='Read WTX reports back, and look up jobs, samples, and results.')
+    parser.add_argument('wtx_path', help='a WTX report, or a directory of them (ex. WTX_reports).')
+    parser.add_argument('--job', default=None, help="print the samples and results of a job (ex. 'W161000').")
+    parser.add_argument('--sample', default=None, help="with --job, print the WTX lines of a sample (ex. 'W161000-1' "
+                                                       "or '1').")
+    parser.add_argument('--analyte', default=None, help='with --sample, only print the line of this analyte code.')
+    args = parser.parse_args(argv)
+    with EasyTraxWTXReader(args.wtx_path) as reader:
+        if args.job is None:
+            print(str(len(reader.wtx_paths)) + ' files, ' + str(len(reader.job_index)) + ' jobs, ' +
+                  str(len(reader.sample_index)) + ' samples, ' + str(reader.line_count) + ' lines (' +
+                  str(reader.skipped_lines) + ' skipped).')
+            return 0
+        if args.sample is not None:
+            sample_id = args.sample
+            if (args.job, sample_id) not in reader.sample_index:
+                sample_id = args.job + '-' + args.sample
+            if args.analyte is not None:
+                wtx_lines = [reader.get_result_line(args.job, sample_id, args.analyte)]
+            else:
+                wtx_lines = reader.get_sample_lines(args.job, sample_id)
+            if not [line for line in wtx_lines if line]:
+                print('Not found.')
+                return 1
+            print('\n'.join(wtx_lines))
+            return 0
+        samples_dictionary, job_dictionary = reader.read_job(args.job)
+        if not samples_dictionary:
+            print(args.job + ' is not in ' + args.wtx_path)
+            return 1
+        print(job_dictionary['job number'] + ' (' + job_dictionary['client identifier'] + ')')
+        for sample_name, sample in samples_dictionary.items():
+            print('\n' + ' '.join((sample_name, sample.location, sample.date, sample.time)))
+            for result in sample.results:
+                print('    ' + ' '.join(result.as_triplet()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
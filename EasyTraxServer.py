@@ -0,0 +1,504 @@
+import argparse
+import hashlib
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import EasyTraxBatch as Batch
+import EasyTraxCache as Cache
+import EasyTraxCodes as Codes
+import EasyTraxInput as Input
+import EasyTraxShare as Share
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# where the server writes WTX reports, unless it is given a directory.
+DEFAULT_WTX_REPORTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'server')
+# the most report text a request can send, in bytes.
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+
+class EasyTraxServer:
+    """Converts reports for other programs, over HTTP on this computer, with the workers already started.
+
+    Every run of EasyTraxTK or EasyTraxBatch starts Python, imports everything, loads the code tables, and starts its
+    worker processes before it converts anything. This class does all that once, and then waits for requests, so a
+    conversion only costs the parse and convert themselves (a few milliseconds for most reports).
+
+    The server listens on localhost only (DEFAULT_HOST), and answers:
+
+        GET  /health                    - {"status": "ok", ...} and some counts, to check it is running.
+        GET  /job/<job number>          - converts W<job number>.txt from report_directory.
+        POST /convert?job=<job number>  - converts the report text sent as the body of the request (decoded with
+                                          the charset of the Content-Type, cp437 if there isn't one). job is
+                                          optional, the job number is read from the report header.
+
+    Both convert requests take an optional column_mode=fixed-width, and answer with JSON: the job result (see
+    EasyTraxBatch.convert_report_lines), with the logs as text ('parse log', 'convert log') and as lists of messages
+    ('parse messages', 'convert messages'), the WTX report itself in 'wtx', and whether the request was coalesced.
+    The HTTP status is 200 if the job converted, 422 if it failed, and 404 if there is no report for a job number.
+
+    Jobs are converted in a pool of worker processes, started (and given the code tables) before the first request.
+    If a request comes in for a job that is already being converted (the same job number, or the same report text),
+    it waits for that conversion and gets the same answer, rather than converting the job a second time.
+
+    Can be run from the command line:
+
+        python EasyTraxServer.py --port 8765
+
+    and used from other programs with request_conversion().
+
+    Attributes
+    ----------
+    report_directory : str
+        the directory /job/ requests read reports from (usually Files_To_Report).
+
+    wtx_reports_directory : str
+        the directory WTX reports are written under.
+
+    workers : int
+        the amount of worker processes.
+
+    cache_directory : str
+        the directory parsed tables are cached in (see EasyTraxCache), or None.
+
+    input_cache : EasyTraxShare.EasyTraxInputCache or None
+        if given, /job/ requests read the reports through local copies.
+
+    http_server : http.server.ThreadingHTTPServer
+        answers the requests, each in its own thread.
+
+    executor : concurrent.futures.ProcessPoolExecutor or None
+        the worker processes, once started.
+
+    in_flight : dict
+        request key : the future of the conversion, for the conversions still running.
+
+    in_flight_lock : threading.RLock
+        guards in_flight.
+
+    conversions : int
+        the amount of conversions run.
+
+    coalesced : int
+        the amount of requests answered by a conversion another request had already started.
+
+    started : float
+        when the server was made, as returned by time.time().
+
+    Methods
+    -------
+    * `easy_trax_server_controller()` -
+        starts the workers, and answers requests until stop() is called.
+
+    * `start_workers()` -
+        starts the worker processes, and waits for each to load the code tables.
+
+    * `convert_job_number(job_number, column_mode)` -
+        converts a report in report_directory.
+
+    * `convert_report_text(report_text, job_number, column_mode)` -
+        converts report text sent with a request.
+
+        * `convert(key, mb_file_contents, job_number, report_path, column_mode)` -
+            runs a conversion in a worker, or waits for the same one if it is already running.
+
+        * `forget(key, future)` -
+            removes a finished conversion from in_flight.
+
+    * `get_health()` -
+        returns the counts for /health.
+
+    * `stop()` -
+        stops answering requests, and stops the workers.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, report_directory=None, wtx_reports_directory=None,
+                 workers=2, cache_directory=Cache.DEFAULT_CACHE_DIRECTORY, input_cache=None):
+        """
+        Parameters
+        ----------
+        host : str
+            the address to listen on. Keep it on localhost, the server has no authentication.
+        port : int
+            the port to listen on. 0 picks a free one (see http_server.server_address).
+        report_directory : str
+            the directory to read reports from. If None, EasyTraxShare.get_input_root() is used.
+        wtx_reports_directory : str
+            the directory to write WTX reports under. If None, DEFAULT_WTX_REPORTS_DIRECTORY is used.
+        workers : int
+            the amount of worker processes.
+        cache_directory : str
+            the directory to cache parsed tables in, or None.
+        input_cache : EasyTraxShare.EasyTraxInputCache
+            the local cache to read report_directory through, or None.
+        """
+
+        self.report_directory = report_directory if report_directory is not None else Share.get_input_root()
+        self.wtx_reports_directory = (wtx_reports_directory if wtx_reports_directory is not None else
+                                      DEFAULT_WTX_REPORTS_DIRECTORY)
+        self.workers = max(1, workers)
+        self.cache_directory = cache_directory
+        self.input_cache = input_cache
+        self.http_server = ThreadingHTTPServer((host, port), EasyTraxRequestHandler)
+        self.http_server.daemon_threads = True
+        self.http_server.easy_trax_server = self
+        self.executor = None
+        self.in_flight = {}
+        self.in_flight_lock = threading.RLock()
+        self.conversions = 0
+        self.coalesced = 0
+        self.started = time.time()
+
+    def easy_trax_server_controller(self):
+        """starts the workers, and answers requests until stop() is called (from another thread, or a signal)."""
+
+        self.start_workers()
+        try:
+            self.http_server.serve_forever()
+        finally:
+            self.http_server.server_close()
+            if self.executor is not None:
+                self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def start_workers(self):
+        """starts the worker processes, and has each of them load the code tables, so the first request doesn't wait
+        for either."""
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+            for future in [self.executor.submit(warm_worker) for counter in range(self.workers)]:
+                future.result()
+
+    def convert_job_number(self, job_number, column_mode='split'):
+        """converts W<job number>.txt in report_directory.
+
+        Parameters
+        ----------
+        job_number : str
+            the job number, with or without the 'W'.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+
+        Returns
+        -------
+        job_response : dict or None
+            see convert(), or None if there is no report for the job number.
+        """
+
+        if job_number[:1] in ('W', 'w'):
+            job_number = job_number[1:]
+        if not job_number or os.path.basename(job_number) != job_number:
+            return None
+        filename = 'W' + job_number + '.txt'
+        if self.input_cache is not None:
+            report_path = self.input_cache.get_report(filename)
+        else:
+            report_path = os.path.join(self.report_directory, filename)
+        try:
+            mb_file_contents = Input.read_report_lines(report_path) if report_path else None
+        except FileNotFoundError:
+            mb_file_contents = None
+        if mb_file_contents is None:
+            return None
+        return self.convert(('job', job_number, column_mode), mb_file_contents, job_number, report_path,
+                            column_mode)
+
+    def convert_report_text(self, report_text, job_number='', column_mode='split'):
+        """converts the text of a report sent with a request.
+
+        Parameters
+        ----------
+        report_text : str
+            the report.
+        job_number : str
+            the job number, without the 'W', if known. Only used until the report header has been read.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+
+        Returns
+        -------
+        job_response : dict
+            see convert().
+        """
+
+        text_hash = hashlib.sha256(report_text.encode('utf-8', 'surrogatepass')).hexdigest()
+        return self.convert(('text', text_hash, job_number, column_mode), Input.split_report_text(report_text),
+                            job_number, 'request', column_mode)
+
+    def convert(self, key, mb_file_contents, job_number, report_path, column_mode):
+        """runs a conversion in a worker process, and waits for it. If a conversion with the same key is already
+        running, waits for that one instead of starting another.
+
+        Parameters
+        ----------
+        key : tuple
+            what makes two requests the same conversion.
+        mb_file_contents : list(str)
+            the lines of the report.
+        job_number, report_path, column_mode
+            passed on to EasyTraxBatch.convert_report_lines().
+
+        Returns
+        -------
+        job_response : dict
+            the job result, ready for JSON, with the WTX report in 'wtx', and 'coalesced' True if another request
+            started the conversion.
+        """
+
+        with self.in_flight_lock:
+            future = self.in_flight.get(key)
+            coalesced = future is not None
+            if coalesced:
+                self.coalesced += 1
+            else:
+                future = self.executor.submit(convert_for_server, mb_file_contents, job_number, report_path,
+                                              self.wtx_reports_directory, column_mode, self.cache_directory)
+                self.in_flight[key] = future
+                self.conversions += 1
+                future.add_done_callback(lambda finished_future: self.forget(key, finished_future))
+        job_response = dict(future.result())
+        job_response['coalesced'] = coalesced
+        return job_response
+
+    def forget(self, key, future):
+        """removes a finished conversion from in_flight, so the next request for it converts it again."""
+
+        with self.in_flight_lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    def get_health(self):
+        """returns the counts for /health: the status, workers, conversions, coalesced requests, conversions running,
+        and seconds since the server started."""
+
+        with self.in_flight_lock:
+            running = len(self.in_flight)
+        return {'status': 'ok',
+                'workers': self.workers,
+                'conversions': self.conversions,
+                'coalesced': self.coalesced,
+                'running': running,
+                'uptime seconds': time.time() - self.started}
+
+    def stop(self):
+        """stops answering requests. easy_trax_server_controller() then stops the workers and returns. Safe to call
+        from a signal handler."""
+
+        threading.Thread(target=self.http_server.shutdown, daemon=True).start()
+
+
+class EasyTraxRequestHandler(BaseHTTPRequestHandler):
+    """Answers one HTTP request for EasyTraxServer (see EasyTraxServer for the requests it understands)."""
+
+    server_version = 'EasyTrax'
+
+    def do_GET(self):
+        easy_trax_server = self.server.easy_trax_server
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path == '/health':
+            self.send_json(200, easy_trax_server.get_health())
+        elif url.path.startswith('/job/'):
+            job_number = urllib.parse.unquote(url.path[len('/job/'):])
+            job_response = easy_trax_server.convert_job_number(job_number, get_column_mode(query))
+            if job_response is None:
+                self.send_json(404, {'status': 'not found',
+                                     'error': 'No MB Labs file found with job number ' + job_number + '.'})
+            else:
+                self.send_json(200 if job_response['status'] == 'ok' else 422, job_response)
+        else:
+            self.send_json(404, {'status': 'not found', 'error': 'Unknown request ' + url.path + '.'})
+
+    def do_POST(self):
+        easy_trax_server = self.server.easy_trax_server
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        if url.path != '/convert':
+            self.send_json(404, {'status': 'not found', 'error': 'Unknown request ' + url.path + '.'})
+            return
+        try:
+            content_length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self.send_json(411, {'status': 'failed', 'error': 'Content-Length is needed.'})
+            return
+        if content_length > MAX_REQUEST_BYTES:
+            self.send_json(413, {'status': 'failed', 'error': 'The report is too big.'})
+            return
+        charset = self.headers.get_content_charset(Input.FIRSTCHOICE_ENCODING)
+        try:
+            report_text = self.rfile.read(content_length).decode(charset)
+        except (LookupError, UnicodeDecodeError) as exc:
+            self.send_json(400, {'status': 'failed', 'error': type(exc).__name__ + ': ' + str(exc)})
+            return
+        job_number = query.get('job', [''])[0]
+        if job_number[:1] in ('W', 'w'):
+            job_number = job_number[1:]
+        job_response = easy_trax_server.convert_report_text(report_text, job_number, get_column_mode(query))
+        self.send_json(200 if job_response['status'] == 'ok' else 422, job_response)
+
+    def send_json(self, status_code, body):
+        """sends body as the JSON answer to the request."""
+
+        data = json.dumps(body, indent=1).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if getattr(self.server, 'verbose', False):
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+def warm_worker():
+    """run in each worker process when it starts: loads the code tables, and ignores Ctrl+C (the server stops the
+    workers itself)."""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Codes.get_registry()
+
+
+def convert_for_server(mb_file_contents, job_number, report_path, wtx_reports_directory, column_mode,
+                       cache_directory):
+    """converts a report in a worker process (see EasyTraxBatch.convert_report_lines), and returns the result ready
+    for JSON, with the WTX report written read back into 'wtx'.
+
+    Returns
+    -------
+    job_response : dict
+        the job result, with the logs as text and as lists of messages, and the WTX report.
+    """
+
+    job_result = Batch.convert_report_lines(mb_file_contents, job_number, report_path, wtx_reports_directory,
+                                            column_mode, cache_directory)
+    job_response = {}
+    for key, value in job_result.items():
+        if key in ('parse log', 'convert log'):
+            job_response[key] = str(value)
+            job_response[key.replace('log', 'messages')] = value.as_dicts()
+        else:
+            job_response[key] = value
+    job_response['wtx'] = ''
+    if job_result['status'] == 'ok' and job_result['wtx path']:
+        try:
+            with open(job_result['wtx path'], 'r') as wtx_file:
+                job_response['wtx'] = wtx_file.read()
+        except OSError as exc:
+            job_response['status'] = 'failed'
+            job_response['error'] = type(exc).__name__ + ': ' + str(exc)
+    return job_response
+
+
+def get_column_mode(query):
+    """returns the column mode asked for in the query of a request, 'split' unless column_mode=fixed-width."""
+
+    if query.get('column_mode', [''])[0] == 'fixed-width':
+        return 'fixed-width'
+    return 'split'
+
+
+def request_conversion(report_text=None, job_number=None, column_mode='split', host=DEFAULT_HOST,
+                       port=DEFAULT_PORT, timeout=60.0):
+    """asks a running EasyTraxServer to convert a report, for other programs to use. Give either the report text, or
+    the job number of a report in the server's report_directory.
+
+    Parameters
+    ----------
+    report_text : str
+        the text of the report.
+    job_number : str
+        the job number. With report_text, only used until the report header has been read.
+    column_mode : str
+        'split' or 'fixed-width', see EasyTraxParse.
+    host, port : str, int
+        where the server is listening.
+    timeout : float
+        the longest to wait for an answer, in seconds.
+
+    Returns
+    -------
+    job_response : dict
+        the answer of the server (see EasyTraxServer).
+
+    Raises
+    ------
+    OSError
+        if the server can't be reached.
+    """
+
+    query = {}
+    if column_mode != 'split':
+        query['column_mode'] = column_mode
+    url = 'http://' + host + ':' + str(port)
+    if report_text is None:
+        request = urllib.request.Request(url + '/job/' + urllib.parse.quote(str(job_number)) + '?' +
+                                         urllib.parse.urlencode(query))
+    else:
+        if job_number:
+            query['job'] = str(job_number)
+        request = urllib.request.Request(url + '/convert?' + urllib.parse.urlencode(query),
+                                         data=report_text.encode('utf-8'),
+                                         headers={'Content-Type': 'text/plain; charset=utf-8'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as exc:
+        # a failed or missing job still answers with JSON
+        with exc:
+            return json.load(exc)
+
+
+def main(argv=None):
+    """command line entry point. Answers conversion requests until Ctrl+C is pressed (or the process is told to stop).
+
+    Returns
+    -------
+    int
+        0
+    """
+
+    parser = argparse.ArgumentParser(description='Convert reports to WTX format for other programs, over HTTP on '
+                                                 'this computer.')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='port to listen on (on localhost).')
+    parser.add_argument('-r', '--reports', default=None,
+                        help='directory /job/ requests read reports from (defaults to EASYTRAX_INPUT_ROOT, or '
+                             'Files_To_Report on the T: drive).')
+    parser.add_argument('-o', '--output', default=None,
+                        help='directory to write WTX reports under (defaults to a folder next to EasyTrax).')
+    parser.add_argument('-j', '--workers', type=int, default=2, help='amount of worker processes.')
+    parser.add_argument('--no-cache', action='store_true', help="don't cache parsed tables between requests.")
+    parser.add_argument('--input-cache', nargs='?', const=Share.DEFAULT_INPUT_CACHE_DIRECTORY, default=None,
+                        metavar='DIR', help='read reports through local copies (optionally kept in the given '
+                                            'directory).')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print each request.')
+    args = parser.parse_args(argv)
+    input_cache = None
+    if args.input_cache:
+        input_cache = Share.EasyTraxInputCache(args.reports, args.input_cache)
+    server = EasyTraxServer(DEFAULT_HOST, args.port, args.reports, args.output, args.workers,
+                            None if args.no_cache else Cache.DEFAULT_CACHE_DIRECTORY, input_cache)
+    server.http_server.verbose = args.verbose
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: server.stop())
+    print('Listening on http://' + DEFAULT_HOST + ':' + str(server.http_server.server_address[1]) +
+          ', Ctrl+C to stop.')
+    try:
+        server.easy_trax_server_controller()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
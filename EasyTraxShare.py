@@ -0,0 +1,504 @@
+import contextlib
+import fnmatch
+import os
+import queue
+import threading
+import time
+
+
+# where the reports are read from, and the WTX reports written to, unless EASYTRAX_INPUT_ROOT or EASYTRAX_OUTPUT_ROOT
+# is set. Both are on the T: drive, a network share.
+DEFAULT_INPUT_ROOT = 'T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Files_To_Report'
+DEFAULT_OUTPUT_ROOT = 'T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\WTX_reports'
+INPUT_ROOT_VARIABLE = 'EASYTRAX_INPUT_ROOT'
+OUTPUT_ROOT_VARIABLE = 'EASYTRAX_OUTPUT_ROOT'
+# local copies of the reports, and WTX reports waiting to be copied to the share, are kept next to the table cache.
+DEFAULT_INPUT_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'input')
+DEFAULT_SPOOL_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'spool')
+# a WTX report that can't be copied to the share is tried this many more times, waiting twice as long each time.
+DEFAULT_RETRIES = 5
+DEFAULT_RETRY_SECONDS = 2.0
+# the longest a batch waits, once its jobs are done, for the spooler to copy their WTX reports to the share.
+DEFAULT_FLUSH_SECONDS = 120.0
+
+
+class EasyTraxInputCache:
+    """Keeps local copies of the reports on the network share, so each one only crosses the network once.
+
+    Files_To_Report is on the T: drive. Every report EasyTraxParse reads comes over the network, and if the share
+    hiccups, the conversion fails outright. This class copies reports from input_root into cache_directory the first
+    time they are asked for, and hands out the local copy from then on.
+
+    A local copy is only used while it is still the same as the report on the share: the same size, and the same
+    modified time (the copy is given the modified time of the report when it is made). Checking this takes one stat of
+    the report on the share, rather than reading it. If the share can't be reached at all, the local copy is used
+    anyway, and counted in stale.
+
+    prefetch() lists input_root once, and copies every report that is new or has changed, which is how EasyTraxBatch
+    uses it: the whole directory is brought over in one go, then parsed from local disk.
+
+    Attributes
+    ----------
+    input_root : str
+        the directory on the share the reports are in (usually Files_To_Report).
+
+    cache_directory : str
+        the local directory the copies are kept in.
+
+    hits : int
+        the amount of times a local copy was still up to date.
+
+    fetches : int
+        the amount of reports copied from the share.
+
+    stale : int
+        the amount of times a local copy was used because the share couldn't be reached.
+
+    Methods
+    -------
+    * `get_report(filename)` -
+        returns the path of an up to date local copy of a report, or None if there isn't one.
+
+    * `prefetch(pattern)` -
+        copies every report matching pattern that is new or has changed, and returns their local paths.
+
+        * `fetch_report(filename, remote_stat)` -
+            copies one report from the share, unless the local copy already matches remote_stat.
+    """
+
+    def __init__(self, input_root=None, cache_directory=None):
+        """
+        Parameters
+        ----------
+        input_root : str
+            the directory on the share the reports are in. If None, get_input_root() is used.
+        cache_directory : str
+            the local directory to keep the copies in. If None, DEFAULT_INPUT_CACHE_DIRECTORY is used.
+        """
+
+        self.input_root = input_root if input_root is not None else get_input_root()
+        self.cache_directory = cache_directory if cache_directory is not None else DEFAULT_INPUT_CACHE_DIRECTORY
+        self.hits = 0
+        self.fetches = 0
+        self.stale = 0
+
+    def get_report(self, filename):
+        """returns the path of an up to date local copy of a report, copying it from the share if needed.
+
+        Parameters
+        ----------
+        filename : str
+            the name of the report in input_root (ex. 'W161000.txt').
+
+        Returns
+        -------
+        local_path : str or None
+            the path of the local copy, or None if the report isn't on the share (or, if the share can't be reached,
+            there is no local copy of it).
+        """
+
+        local_path = os.path.join(self.cache_directory, filename)
+        try:
+            remote_stat = os.stat(os.path.join(self.input_root, filename))
+        except FileNotFoundError:
+            # a share that isn't connected can look like a missing directory
+            if os.path.isdir(self.input_root) or not os.path.isfile(local_path):
+                return None
+            self.stale += 1
+            return local_path
+        except OSError:
+            if os.path.isfile(local_path):
+                self.stale += 1
+                return local_path
+            return None
+        try:
+            return self.fetch_report(filename, remote_stat)
+        except OSError:
+            if os.path.isfile(local_path):
+                self.stale += 1
+                return local_path
+            return None
+
+    def prefetch(self, pattern='W*.txt'):
+        """lists input_root once, and copies every report matching pattern that is new or has changed since it was
+        last copied. If the share can't be listed, the local copies already made are returned instead.
+
+        Parameters
+        ----------
+        pattern : str
+            the file names to copy, as used by fnmatch.
+
+        Returns
+        -------
+        local_paths : list(str)
+            the local copies of every report matching pattern, in sorted order.
+        """
+
+        local_paths = []
+        try:
+            with os.scandir(self.input_root) as entries:
+                remote_entries = [(entry.name, entry.stat()) for entry in entries
+                                  if fnmatch.fnmatch(entry.name, pattern) and entry.is_file()]
+        except OSError:
+            try:
+                cached_names = [name for name in os.listdir(self.cache_directory) if fnmatch.fnmatch(name, pattern)]
+            except OSError:
+                return []
+            self.stale += len(cached_names)
+            return sorted(os.path.join(self.cache_directory, name) for name in cached_names)
+        for filename, remote_stat in sorted(remote_entries):
+            try:
+                local_paths.append(self.fetch_report(filename, remote_stat))
+            except OSError:
+                local_path = os.path.join(self.cache_directory, filename)
+                if os.path.isfile(local_path):
+                    self.stale += 1
+                    local_paths.append(local_path)
+        return local_paths
+
+    def fetch_report(self, filename, remote_stat):
+        """copies one report from the share into cache_directory, unless the local copy is already the same size and
+        has the same modified time as remote_stat.
+
+        Returns
+        -------
+        local_path : str
+            the path of the local copy.
+
+        Raises
+        ------
+        OSError
+            if the report can't be copied.
+        """
+
+        local_path = os.path.join(self.cache_directory, filename)
+        if files_match(remote_stat, local_path):
+            self.hits += 1
+            return local_path
+        os.makedirs(self.cache_directory, exist_ok=True)
+        copy_file(os.path.join(self.input_root, filename), local_path, remote_stat)
+        self.fetches += 1
+        return local_path
+
+
+class EasyTraxSpooler:
+    """Writes WTX reports to the network share in the background, retrying when the share can't be reached.
+
+    EasyTraxConvert writes each WTX report straight to WTX_reports on the T: drive, so every conversion waits on the
+    network, and fails if the share hiccups. With a spooler, the WTX reports are written to spool_directory on the
+    local disk instead (pass spool_directory as the wtx_reports_directory of EasyTraxConvert), and submit() hands each
+    one to a background thread, which copies it to the same place under output_root.
+
+    A copy that fails is tried again up to retries times, waiting retry_seconds, then twice that, and so on. A report
+    that still can't be copied is kept in failed, and stays in spool_directory, so it is copied the next time a spooler
+    is started (start() queues every report in spool_directory that isn't on the share yet). A report already on the
+    share with the same size and modified time isn't copied again.
+
+    Once a report has been given up on, the share is taken to be down (share_error), and the reports after it are only
+    tried once each, rather than each waiting through every retry, until one is copied again. So a share outage
+    costs one round of retries, not one per report.
+
+    Attributes
+    ----------
+    output_root : str
+        the directory on the share the WTX reports are copied to (usually WTX_reports).
+
+    spool_directory : str
+        the local directory the WTX reports are written to first.
+
+    retries : int
+        the amount of times a failed copy is tried again.
+
+    retry_seconds : float
+        the time waited before the first retry.
+
+    on_synced : callable or None
+        called (from the background thread) with the spool path and an error ('' if it was copied) once each report
+        has been dealt with.
+
+    sync_queue : queue.Queue
+        the spool paths waiting to be copied.
+
+    synced : int
+        the amount of reports copied to the share.
+
+    failed : dict
+        spool path : the error, for each report that couldn't be copied.
+
+    share_error : str
+        the error of the last report given up on, while the share is taken to be down, or ''.
+
+    Methods
+    -------
+    * `start()` -
+        starts the background thread, and queues the reports left in spool_directory by an earlier run.
+
+    * `submit(spool_path)` -
+        queues a WTX report to be copied to the share.
+
+    * `flush(timeout)` -
+        waits for every queued report to be copied (or given up on).
+
+    * `spooler_thread()` -
+        runs in the background thread, copying the queued reports one at a time.
+
+        * `sync_report(spool_path)` -
+            copies one WTX report to the share, retrying if it fails.
+
+    * `get_share_path(spool_path)` -
+        returns where a WTX report in spool_directory goes on the share.
+    """
+
+    def __init__(self, output_root=None, spool_directory=None, retries=DEFAULT_RETRIES,
+                 retry_seconds=DEFAULT_RETRY_SECONDS, on_synced=None):
+        """
+        Parameters
+        ----------
+        output_root : str
+            the directory on the share to copy the WTX reports to. If None, get_output_root() is used.
+        spool_directory : str
+            the local directory the WTX reports are written to first. If None, DEFAULT_SPOOL_DIRECTORY is used.
+        retries : int
+            the amount of times a failed copy is tried again.
+        retry_seconds : float
+            the time waited before the first retry.
+        on_synced : callable
+            called with (spool path, error) once each report has been dealt with, or None.
+        """
+
+        self.output_root = output_root if output_root is not None else get_output_root()
+        self.spool_directory = spool_directory if spool_directory is not None else DEFAULT_SPOOL_DIRECTORY
+        self.retries = retries
+        self.retry_seconds = retry_seconds
+        self.on_synced = on_synced
+        self.sync_queue = queue.Queue()
+        self.synced = 0
+        self.failed = {}
+        self.share_error = ''
+        self.thread = None
+
+    def start(self):
+        """starts the background thread, and queues every WTX report in spool_directory that isn't on the share yet
+        (left over from an earlier run that couldn't reach the share, or was closed first).
+
+        Returns
+        -------
+        self : EasyTraxSpooler
+            so it can be started where it is made.
+        """
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.spooler_thread, daemon=True)
+            self.thread.start()
+            for directory, directory_names, filenames in os.walk(self.spool_directory):
+                for filename in sorted(filenames):
+                    spool_path = os.path.join(directory, filename)
+                    if filename.endswith('.txt') and not files_match(spool_path, self.get_share_path(spool_path)):
+                        self.submit(spool_path)
+        return self
+
+    def submit(self, spool_path):
+        """queues a WTX report in spool_directory to be copied to the share.
+
+        Parameters
+        ----------
+        spool_path : str
+            the full path of the WTX report in spool_directory.
+        """
+
+        self.sync_queue.put(spool_path)
+
+    def flush(self, timeout=None):
+        """waits for every queued WTX report to be copied to the share, or given up on.
+
+        Parameters
+        ----------
+        timeout : float
+            the longest to wait, in seconds, or None to wait for as long as it takes.
+
+        Returns
+        -------
+        bool
+            True if the queue was emptied, False if timeout ran out first.
+        """
+
+        if timeout is None:
+            self.sync_queue.join()
+            return True
+        end = time.monotonic() + timeout
+        while self.sync_queue.unfinished_tasks:
+            if time.monotonic() >= end:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def spooler_thread(self):
+        """runs in the background thread: copies the queued WTX reports to the share, one at a time, for as long as
+        the program runs."""
+
+        while True:
+            spool_path = self.sync_queue.get()
+            try:
+                error = self.sync_report(spool_path)
+                if error:
+                    self.failed[spool_path] = error
+                else:
+                    self.failed.pop(spool_path, None)
+                if self.on_synced is not None:
+                    self.on_synced(spool_path, error)
+            finally:
+                self.sync_queue.task_done()
+
+    def sync_report(self, spool_path):
+        """copies one WTX report to the share (through a temporary file, renamed into place), unless the share already
+        has the same one. A failed copy is tried again up to retries times, or not at all while the share is taken to
+        be down (see share_error).
+
+        a report missing from the spool has nothing to copy, so isn't retried. Any error on the share side is, even a
+        FileNotFoundError, which is what an unmapped or unreachable share gives on Windows.
+
+        Returns
+        -------
+        error : str
+            why the report couldn't be copied, or '' if it was (or didn't need to be).
+        """
+
+        share_path = self.get_share_path(spool_path)
+        wait_seconds = self.retry_seconds
+        retries = 0 if self.share_error else self.retries
+        for attempt in range(retries + 1):
+            try:
+                spool_stat = os.stat(spool_path)
+            except OSError as exc:
+                # the report was removed from the spool, there is nothing left to copy
+                return type(exc).__name__ + ': ' + str(exc)
+            try:
+                if not files_match(spool_stat, share_path):
+                    os.makedirs(os.path.dirname(share_path), exist_ok=True)
+                    copy_file(spool_path, share_path, spool_stat)
+                    self.synced += 1
+                self.share_error = ''
+                return ''
+            except OSError as exc:
+                error = type(exc).__name__ + ': ' + str(exc)
+            if attempt < retries:
+                time.sleep(wait_seconds)
+                wait_seconds *= 2
+        self.share_error = error
+        return error
+
+    def get_share_path(self, spool_path):
+        """returns where a WTX report in spool_directory goes under output_root (the same place, relative to it)."""
+
+        return os.path.join(self.output_root, os.path.relpath(spool_path, self.spool_directory))
+
+
+def get_input_root():
+    """returns the directory reports are read from: EASYTRAX_INPUT_ROOT if it is set, otherwise DEFAULT_INPUT_ROOT."""
+
+    return os.environ.get(INPUT_ROOT_VARIABLE) or DEFAULT_INPUT_ROOT
+
+
+def get_output_root():
+    """returns the directory WTX reports are written under: EASYTRAX_OUTPUT_ROOT if it is set, otherwise
+    DEFAULT_OUTPUT_ROOT."""
+
+    return os.environ.get(OUTPUT_ROOT_VARIABLE) or DEFAULT_OUTPUT_ROOT
+
+
+def files_match(source, destination_path):
+    """checks if the file at destination_path has the same size and modified time as source.
+
+    Parameters
+    ----------
+    source : str or os.stat_result
+        the path of the source file, or its stat.
+    destination_path : str
+        the path of the copy.
+
+    Returns
+    -------
+    bool
+        False if either file doesn't exist (or can't be reached).
+    """
+
+    try:
+        if isinstance(source, str):
+            source = os.stat(source)
+        destination_stat = os.stat(destination_path)
+    except OSError:
+        return False
+    return source.st_size == destination_stat.st_size and source.st_mtime_ns == destination_stat.st_mtime_ns
+
+
+def copy_file(source_path, destination_path, source_stat):
+    """copies a file through a temporary file next to destination_path, renamed into place once it is complete, and
+    gives the copy the modified time in source_stat, so files_match() can tell it is up to date.
+
+    Raises
+    ------
+    OSError
+        if the file can't be copied. The temporary file is removed.
+    """
+
+    temporary_path = get_temporary_path(destination_path)
+    try:
+        with open(source_path, 'rb') as source_file, open(temporary_path, 'wb') as destination_file:
+            for block in iter(lambda: source_file.read(1 << 16), b''):
+                destination_file.write(block)
+        os.utime(temporary_path, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        os.replace(temporary_path, destination_path)
+    except OSError:
+        remove_temporary_file(temporary_path)
+        raise
+
+
+@contextlib.contextmanager
+def replacing_file(path, mode='wb', encoding=None):
+    """opens a temporary file next to path for the with block to write, and renames it over path in one step once
+    the block is done, so nothing (another process, or a copy to the share) ever sees a half written file.
+
+    if the block raises, the temporary file is removed, path is left as it was, and the exception carries on.
+
+        with EasyTraxShare.replacing_file(filename) as f:
+            f.write(data)
+
+    Parameters
+    ----------
+    path : str
+        the file to write. Its directory has to exist.
+    mode : str
+        'wb' or 'w'.
+    encoding : str
+        the encoding, in text mode.
+
+    Raises
+    ------
+    OSError
+        if the file can't be written, or renamed over path.
+    """
+
+    temporary_path = get_temporary_path(path)
+    try:
+        with open(temporary_path, mode, encoding=encoding) as temporary_file:
+            yield temporary_file
+        os.replace(temporary_path, path)
+    except BaseException:
+        remove_temporary_file(temporary_path)
+        raise
+
+
+def get_temporary_path(path):
+    """returns the name of a temporary file next to path, to write before renaming it over path. It is unique to the
+    process and thread, so two of them writing the same file don't write into each other's temporary file."""
+
+    return path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+
+
+def remove_temporary_file(temporary_path):
+    """removes a temporary file left by a write that didn't finish, if it is there."""
+
+    try:
+        os.remove(temporary_path)
+    except OSError:
+        pass
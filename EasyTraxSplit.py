@@ -0,0 +1,336 @@
+import argparse
+import functools
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import EasyTraxBatch as Batch
+import EasyTraxBundle as Bundle
+import EasyTraxCache as Cache
+import EasyTraxInput as Input
+import EasyTraxStore as Store
+
+
+# a report header line: the client (after a form feed, on a new page), 'Final Report', then the job number, sometimes
+# followed by a page number.
+HEADER_PATTERN = re.compile(r'\f?\S.*\sFinal Report((?:\s.*)?)$')
+
+# a job number that can be read (ex. 'W161000').
+JOB_NUMBER_PATTERN = re.compile(r'W\d{6}$')
+
+
+class EasyTraxSplit:
+    """Converts a text dump holding many final reports, one after the other, to one WTX file per job.
+
+    EasyTraxParse expects one job per file: it reads the client and job number from the first line, and every table
+    in the file is taken to belong to that job. The LIMS can also print many final reports into one text file. This
+    class finds the report header line of each job in one pass over the file, by its shape (see
+    get_header_job_number()), and slices the file into one segment per job, each starting with its header line, so it
+    looks exactly like a report on its own.
+
+    The segments are then run through the normal parse and convert pipeline (EasyTraxBatch.convert_report_lines),
+    spread over a pool of worker processes, and a summary table of every job is made, the same as EasyTraxBatch's.
+
+    A report that runs over more than one page repeats its header line on each page. Header lines with the same job
+    number as the segment they are in just carry on that segment. If a job is printed again further down the dump
+    (ex. a corrected reprint), the later copy is the one converted. A header whose job number can't be read (ex.
+    'W170009A') still starts a segment of its own, so the job isn't folded into the one before it, but isn't
+    converted: it is listed as a failed job, with an error saying why.
+
+    Can be run from the command line:
+
+        python EasyTraxSplit.py "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Files_To_Report\\Export.txt"
+
+    Attributes
+    ----------
+    export_path : str
+        the file holding the reports.
+
+    wtx_reports_directory : str
+        the directory WTX reports are written under. If None, EasyTraxConvert's default (WTX_reports) is used.
+
+    workers : int
+        the amount of worker processes to convert jobs with. If None, one per CPU.
+
+    column_mode : str
+        how EasyTraxParse reads the data tables, 'split' or 'fixed-width'.
+
+    cache_directory : str
+        the directory parsed tables are cached in between runs (see EasyTraxCache). If None, nothing is cached.
+
+    results_database : str
+        the SQLite database parsed results are stored in (see EasyTraxStore). If None, they aren't stored.
+
+    replacement : bool
+        if True, each job whose results changed since its last WTX report also gets a replacement report, to upload
+        instead (see EasyTraxConvert.write_replacement_report()).
+
+    export_lines : list(str)
+        the lines of the file.
+
+    job_segments : list(tuple)
+        (job number, first line, end line) of each job found, in the order they first appear. The lines of a job are
+        export_lines[first line:end line].
+
+    replaced_segments : int
+        the amount of jobs printed more than once, where only the last copy is converted.
+
+    skipped_lines : int
+        the amount of lines before the first report header, which don't belong to any job.
+
+    job_results : list(dict)
+        one dictionary per job, as returned by EasyTraxBatch.convert_report_lines().
+
+    Methods
+    -------
+    * `easy_trax_split_controller()` -
+        reads the file, finds the jobs, converts them, and returns the summary table.
+
+    * `find_job_segments()` -
+        fills job_segments, in one pass over export_lines.
+
+    * `convert_job_segments()` -
+        converts every job in job_segments, in parallel if more than one worker is being used.
+
+        * `get_unreadable_job_result(job_number, first_line)`
+            returns the failed result of a job whose job number can't be read.
+
+    * `format_summary_table()` -
+        formats job_results into a table, one row per job.
+    """
+
+    def __init__(self, export_path, wtx_reports_directory=None, workers=None, column_mode='split',
+                 cache_directory=None, results_database=None, replacement=False):
+        """
+        Parameters
+        ----------
+        export_path : str
+            the file holding the reports.
+        wtx_reports_directory : str
+            the directory WTX reports are written under.
+        workers : int
+            the amount of worker processes to use.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+        cache_directory : str
+            the directory to cache parsed tables in, or None.
+        results_database : str
+            the SQLite database to store parsed results in, or None.
+        replacement : bool
+            whether to make replacement reports.
+        """
+
+        self.export_path = export_path
+        self.wtx_reports_directory = wtx_reports_directory
+        self.workers = workers
+        self.column_mode = column_mode
+        self.cache_directory = cache_directory
+        self.results_database = results_database
+        self.replacement = replacement
+        self.export_lines = []
+        self.job_segments = []
+        self.replaced_segments = 0
+        self.skipped_lines = 0
+        self.job_results = []
+
+    def easy_trax_split_controller(self):
+        """executes the various methods in the right order.
+
+        Returns
+        -------
+        summary_table : str
+            the summary table of the conversion, ready to print.
+        """
+
+        self.export_lines = Input.read_report_lines(self.export_path)
+        self.find_job_segments()
+        self.convert_job_segments()
+        return self.format_summary_table()
+
+    def find_job_segments(self):
+        """finds the report header line of every job, and fills job_segments, in one pass over export_lines.
+
+        a segment runs from a header line to the next header line with a different job number (or the end of the
+        file), even if the job number can't be read. Lines before the first header line are counted in skipped_lines.
+        A job number that was already found further up replaces its earlier segment, and is counted in
+        replaced_segments.
+        """
+
+        segments = {}
+        job_number = None
+        segment_start = 0
+        for counter, line in enumerate(self.export_lines):
+            # only lines starting with something other than a space (a form feed is allowed) can be header lines
+            if not line or line[0] in ' \n' or 'Final Report' not in line:
+                continue
+            header_job_number = get_header_job_number(line)
+            if header_job_number is None or header_job_number == job_number:
+                continue
+            if job_number is None:
+                self.skipped_lines = counter
+            else:
+                segments[job_number] = (job_number, segment_start, counter)
+            if header_job_number in segments:
+                del segments[header_job_number]
+                self.replaced_segments += 1
+            job_number = header_job_number
+            segment_start = counter
+        if job_number is not None:
+            segments[job_number] = (job_number, segment_start, len(self.export_lines))
+        else:
+            self.skipped_lines = len(self.export_lines)
+        self.job_segments = list(segments.values())
+
+    def convert_job_segments(self):
+        """converts every job in job_segments, filling job_results.
+
+        with one worker (or one job) the jobs are converted in this process, otherwise they are spread over a process
+        pool. Jobs whose job number can't be read aren't converted, and get a failed result instead. Results are kept
+        in the same order as job_segments either way.
+        """
+
+        job_segments = [segment for segment in self.job_segments if JOB_NUMBER_PATTERN.match(segment[0])]
+        workers = self.workers or os.cpu_count() or 1
+        workers = min(workers, len(job_segments))
+        convert_job = functools.partial(Batch.convert_report_lines,
+                                        wtx_reports_directory=self.wtx_reports_directory,
+                                        column_mode=self.column_mode,
+                                        cache_directory=self.cache_directory,
+                                        results_database=self.results_database,
+                                        replacement=self.replacement)
+        segment_lines = [self.export_lines[first_line:end_line] for job_number, first_line, end_line in
+                         job_segments]
+        # the job number is passed on without the 'W', as EasyTraxTK does
+        job_numbers = [job_number[1:] for job_number, first_line, end_line in job_segments]
+        segment_paths = [self.export_path + ':' + str(first_line + 1) for job_number, first_line, end_line in
+                         job_segments]
+        if workers <= 1:
+            job_results = list(map(convert_job, segment_lines, job_numbers, segment_paths))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                job_results = list(executor.map(convert_job, segment_lines, job_numbers, segment_paths))
+        job_results = iter(job_results)
+        self.job_results = [next(job_results) if JOB_NUMBER_PATTERN.match(job_number) else
+                            self.get_unreadable_job_result(job_number, first_line)
+                            for job_number, first_line, end_line in self.job_segments]
+
+    def get_unreadable_job_result(self, job_number, first_line):
+        """returns the result of a job whose job number can't be read, as a failed job (see
+        EasyTraxBatch.get_empty_job_result()).
+
+        Parameters
+        ----------
+        job_number : str
+            the job number as printed on the report header ('' if there isn't one).
+        first_line : int
+            the index of the report header line in export_lines.
+        """
+
+        job_result = Batch.get_empty_job_result(job_number or '?', self.export_path + ':' + str(first_line + 1))
+        job_result['status'] = 'failed'
+        job_result['error'] = ("can't read the job number " + repr(job_number) + ' on the report header on line ' +
+                               str(first_line + 1) + ', so the job was not converted.')
+        return job_result
+
+    def format_summary_table(self):
+        """formats job_results into a table, one row per job (see EasyTraxBatch.format_summary_table()), with a note
+        of any lines that didn't belong to a job, and any jobs printed more than once."""
+
+        summary_table = Batch.format_summary_table(self.job_results)
+        if self.skipped_lines:
+            summary_table += ('\n' + str(self.skipped_lines) + ' lines before the first report header were skipped.')
+        if self.replaced_segments:
+            summary_table += ('\n' + str(self.replaced_segments) +
+                              ' jobs were printed more than once, only the last copy of each was converted.')
+        return summary_table
+
+
+def get_header_job_number(line):
+    """returns the job number on a report header line, or None if the line isn't a report header.
+
+    a header line is told apart from the data lines by its shape (see HEADER_PATTERN): the client name, then
+    'Final Report', then the job number, or the job number and a page number ('W161000 pg 2'), the same as
+    EasyTraxParse.get_job_number_from_first_line expects. The job number is returned as printed, even if it doesn't
+    look like one (a 'W' and six digits, see JOB_NUMBER_PATTERN), so a job with a misprinted job number isn't taken
+    to be part of the job before it.
+
+    Parameters
+    ----------
+    line : str
+        a line of the file.
+
+    Returns
+    -------
+    job_number : str or None
+        the job number (ex. 'W161000'), or everything after 'Final Report' if it isn't a job number and a page number
+        ('' if there is nothing).
+    """
+
+    header_match = HEADER_PATTERN.match(line)
+    if header_match is None:
+        return None
+    items = header_match.group(1).split()
+    if len(items) == 3 and items[1].lower() in ('pg', 'page'):
+        return items[0]
+    return ' '.join(items)
+
+
+def main(argv=None):
+    """command line entry point. Converts every job in a multi-job export, prints the summary table.
+
+    Returns
+    -------
+    int
+        0 if every job converted, 1 if any failed (or none were found).
+    """
+
+    parser = argparse.ArgumentParser(description='Convert every report in a multi-job text export to WTX format.')
+    parser.add_argument('export', help='the text file holding the reports.')
+    parser.add_argument('-o', '--output', default=None,
+                        help='directory to write WTX reports under (defaults to WTX_reports on the T: drive).')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='amount of worker processes (defaults to one per CPU).')
+    parser.add_argument('--fixed-width', action='store_true',
+                        help='read data tables by column position rather than by splitting on spaces.')
+    parser.add_argument('--cache', nargs='?', const=Cache.DEFAULT_CACHE_DIRECTORY, default=None,
+                        help='cache parsed tables between runs (optionally in the given directory).')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='also print the parse and convert logs of each job.')
+    parser.add_argument('--bundle', default=None, metavar='DIR',
+                        help='also merge the WTX reports into upload files per WaterTrax client, in DIR.')
+    parser.add_argument('--bundle-lines', type=int, default=Bundle.DEFAULT_MAX_LINES,
+                        help='with --bundle, the most lines in one upload file.')
+    parser.add_argument('--bundle-bytes', type=int, default=Bundle.DEFAULT_MAX_BYTES,
+                        help='with --bundle, the most bytes in one upload file.')
+    parser.add_argument('--store', nargs='?', const=Store.DEFAULT_DATABASE, default=None, metavar='DATABASE',
+                        help='also store the parsed results in a SQLite database (optionally the given file).')
+    parser.add_argument('--replacement', action='store_true',
+                        help='also write a replacement report for each job whose results changed since its last '
+                             'WTX report.')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    split = EasyTraxSplit(args.export, args.output, args.workers, 'fixed-width' if args.fixed_width else 'split',
+                          args.cache, args.store, args.replacement)
+    summary_table = split.easy_trax_split_controller()
+    if not split.job_segments:
+        print('No report headers found in ' + args.export)
+        return 1
+    for result in split.job_results:
+        if result['error']:
+            print(result['job number'] + ': ' + result['error'])
+        if args.verbose:
+            print('\n' + result['job number'] + str(result['parse log']) + str(result['convert log']))
+    print(summary_table)
+    if args.bundle:
+        bundle = Bundle.bundle_job_results(split.job_results, args.bundle, args.bundle_lines, args.bundle_bytes)
+        print(bundle.format_bundle_table())
+    print('%.3f s wall time.' % (time.perf_counter() - start))
+    if [result for result in split.job_results if result['status'] != 'ok']:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,421 @@
+import argparse
+import datetime
+import glob
+import os
+import sqlite3
+import sys
+import time
+
+import EasyTraxCodes as Codes
+import EasyTraxInput as Input
+import EasyTraxParse as Parse
+
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'EasyTraxResults.sqlite3')
+# bump, and add to SCHEMA, if the tables change. Kept in the database as PRAGMA user_version.
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_number TEXT PRIMARY KEY,
+    client_identifier TEXT,
+    client_id TEXT,
+    report_path TEXT,
+    samples INTEGER,
+    results INTEGER,
+    stored TEXT
+);
+CREATE TABLE IF NOT EXISTS samples (
+    job_number TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    name TEXT,
+    location TEXT,
+    date TEXT,
+    time TEXT,
+    PRIMARY KEY (job_number, sample_id)
+);
+CREATE TABLE IF NOT EXISTS results (
+    job_number TEXT NOT NULL,
+    sample_id TEXT NOT NULL,
+    client_id TEXT,
+    client_identifier TEXT,
+    location TEXT,
+    date TEXT,
+    time TEXT,
+    analyte TEXT,
+    analyte_code TEXT,
+    unit TEXT,
+    unit_code TEXT,
+    value_text TEXT,
+    value REAL,
+    nd INTEGER
+);
+CREATE INDEX IF NOT EXISTS results_by_client ON results (client_id, location, analyte_code, date);
+CREATE INDEX IF NOT EXISTS results_by_analyte ON results (analyte_code, date);
+CREATE INDEX IF NOT EXISTS results_by_location ON results (location, analyte_code, date);
+CREATE INDEX IF NOT EXISTS results_by_job ON results (job_number);
+CREATE INDEX IF NOT EXISTS samples_by_location ON samples (location, date);
+"""
+# the columns query_time_series() returns, in order.
+SERIES_COLUMNS = ('date', 'time', 'job_number', 'sample_id', 'client_id', 'location', 'analyte', 'analyte_code',
+                  'unit', 'unit_code', 'value_text', 'value', 'nd')
+# how long a write waits for another process (ex. another batch worker) to finish its transaction.
+LOCK_TIMEOUT_SECONDS = 30.0
+
+
+class EasyTraxResultsStore:
+    """Keeps every parsed result in a local SQLite database, so old results can be looked up without the reports.
+
+    Once a report has been converted, its results only exist in the WTX text file (and the FirstChoice report). This
+    class takes the samples dictionary and job dictionary made by EasyTraxParse, and stores the job, its samples, and
+    their results (analyte and unit, with their WaterTrax codes, the value, whether it was a non-detect, and the
+    sample's location, date and time) in database_path.
+
+    Each job is stored in one transaction: a job stored again (ex. a corrected report) replaces what was there, and
+    a job is never half stored. Results are stored the same way EasyTraxConvert writes them: Lab Blanks and
+    placeholder values ('---') are left out, and an analyte is only kept the first time it appears in a sample with
+    both of its codes. Results whose analyte or unit has no code are still stored, with an empty code, but (as they
+    aren't in the WTX report) don't stop a later result for the same analyte from being kept.
+
+    The results table carries the client, location, and date of each result, and is indexed on them, so
+    query_time_series() (ex. lead at one location over the last two years) is answered from the indexes in a few
+    milliseconds. Dates are stored as 'yyyy-mm-dd', so they sort and compare in order.
+
+    Use it as a with statement, or call close():
+
+        with EasyTraxResultsStore() as results_store:
+            results_store.store_job(samples_dictionary, job_dictionary, report_path)
+
+    Can be run from the command line, to store reports that were converted before the store existed, and to query it:
+
+        python EasyTraxStore.py ingest "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Files_To_Report"
+        python EasyTraxStore.py query Lead --client "BC Ferry" --location A001B --years 2
+
+    Attributes
+    ----------
+    database_path : str
+        the SQLite database file.
+
+    connection : sqlite3.Connection
+        the open database.
+
+    code_registry : EasyTraxCodes.EasyTraxCodeRegistry
+        the WaterTrax code tables, to find the codes of each result.
+
+    Methods
+    -------
+    * `store_job(samples_dictionary, job_dictionary, report_path)` -
+        stores one job, replacing it if it was already stored.
+
+        * `get_rows(samples_dictionary, job_dictionary)` -
+            returns the sample and result rows of a job.
+
+    * `query_time_series(analyte, client, location, date_from, date_to)` -
+        returns the results for an analyte, oldest first.
+
+        * `get_analyte_codes(analyte)` -
+            returns the analyte codes an analyte name, description (or code) stands for.
+
+        * `get_client_filter(client)` -
+            returns the column and value to find a client by.
+
+    * `close()` -
+        closes the database.
+    """
+
+    def __init__(self, database_path=DEFAULT_DATABASE):
+        """
+        Parameters
+        ----------
+        database_path : str
+            the SQLite database file. Made, with its tables, if it doesn't exist.
+        """
+
+        self.database_path = database_path
+        self.code_registry = Codes.get_registry()
+        directory = os.path.dirname(os.path.abspath(database_path))
+        os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(database_path, timeout=LOCK_TIMEOUT_SECONDS)
+        # write ahead logging lets the batch workers store jobs while queries are running
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+            with self.connection:
+                self.connection.executescript(SCHEMA)
+                self.connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def close(self):
+        """closes the database. Safe to call more than once."""
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def store_job(self, samples_dictionary, job_dictionary, report_path=''):
+        """stores one job, its samples, and their results, in one transaction. A job that was already stored is
+        replaced.
+
+        Parameters
+        ----------
+        samples_dictionary : dict
+            sample name : EasyTraxModel.EasyTraxSample, as made by EasyTraxParse.
+        job_dictionary : dict
+            the job number and client identifier, as made by EasyTraxParse.
+        report_path : str
+            where the report came from.
+
+        Returns
+        -------
+        results_stored : int
+            the amount of results stored.
+        """
+
+        job_number = job_dictionary['job number']
+        client_identifier = job_dictionary['client identifier']
+        client_id = self.code_registry.get_client_id(client_identifier)
+        sample_rows, result_rows = self.get_rows(samples_dictionary, job_dictionary)
+        with self.connection:
+            self.connection.execute('DELETE FROM results WHERE job_number = ?', (job_number,))
+            self.connection.execute('DELETE FROM samples WHERE job_number = ?', (job_number,))
+            self.connection.execute('INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (job_number, client_identifier, None if client_id is None else str(client_id),
+                                     report_path, len(sample_rows), len(result_rows),
+                                     time.strftime('%Y-%m-%d %H:%M:%S')))
+            self.connection.executemany('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)', sample_rows)
+            self.connection.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        result_rows)
+        return len(result_rows)
+
+    def get_rows(self, samples_dictionary, job_dictionary):
+        """returns the rows to store for a job.
+
+        Returns
+        -------
+        sample_rows, result_rows : list(tuple), list(tuple)
+            one row per sample, and one per result, in the column order of the samples and results tables.
+        """
+
+        job_number = job_dictionary['job number']
+        client_identifier = job_dictionary['client identifier']
+        client_id = self.code_registry.get_client_id(client_identifier)
+        client_id = None if client_id is None else str(client_id)
+        analyte_codes = self.code_registry.analyte_codes
+        unit_codes = self.code_registry.unit_codes
+        sample_rows = []
+        result_rows = []
+        for key, sample in samples_dictionary.items():
+            if key == 'Lab Blank':
+                continue
+            sample_date = get_iso_date(sample.date, self.code_registry.month_codes)
+            sample_time = sample.time[0:5]
+            sample_rows.append((job_number, sample.sample_id, sample.name, sample.location, sample_date,
+                                sample_time))
+            analytes_stored = set()
+            for result in sample.results:
+                if result.value == '---':
+                    continue
+                analyte_code = str(analyte_codes[result.analyte][0]) if result.analyte in analyte_codes else None
+                unit_code = str(unit_codes[result.unit]) if result.unit in unit_codes else None
+                # a result EasyTraxConvert skips, for a missing code, is kept apart from the ones it reports
+                if analyte_code is None or unit_code is None:
+                    analyte_stored = (result.analyte, result.unit)
+                else:
+                    analyte_stored = analyte_code
+                if analyte_stored in analytes_stored:
+                    continue
+                analytes_stored.add(analyte_stored)
+                try:
+                    value = float(result.value)
+                except ValueError:
+                    value = None
+                result_rows.append((job_number, sample.sample_id, client_id, client_identifier, sample.location,
+                                    sample_date, sample_time, result.analyte, analyte_code, result.unit, unit_code,
+                                    result.value, value, int(result.value == 'ND')))
+        return sample_rows, result_rows
+
+    def query_time_series(self, analyte, client=None, location=None, date_from=None, date_to=None):
+        """returns the results for an analyte, oldest first.
+
+        Parameters
+        ----------
+        analyte : str
+            the MB Labs analyte name (ex. 'Pb'), its description in the code tables (ex. 'Lead (Total)', or just
+            'Lead'), or WaterTrax analyte code.
+        client : str
+            the client ID, client identifier, or client name, or None for every client.
+        location : str
+            the sample location, or None for every location.
+        date_from, date_to : str
+            the first and last dates to include, as 'yyyy-mm-dd', or None.
+
+        Returns
+        -------
+        rows : list(tuple)
+            one row per result, with the columns in SERIES_COLUMNS.
+        """
+
+        analyte_codes = self.get_analyte_codes(analyte)
+        conditions = ['(analyte_code IN (%s) OR (analyte_code IS NULL AND analyte = ?))' %
+                      ', '.join('?' * len(analyte_codes))]
+        parameters = analyte_codes + [analyte]
+        if client is not None:
+            client_column, client_value = self.get_client_filter(client)
+            conditions.append(client_column + ' = ?')
+            parameters.append(client_value)
+        if location is not None:
+            conditions.append('location = ?')
+            parameters.append(location)
+        if date_from is not None:
+            conditions.append('date >= ?')
+            parameters.append(date_from)
+        if date_to is not None:
+            conditions.append('date <= ?')
+            parameters.append(date_to)
+        return self.connection.execute('SELECT ' + ', '.join(SERIES_COLUMNS) + ' FROM results WHERE ' +
+                                       ' AND '.join(conditions) + ' ORDER BY date, time, job_number, sample_id',
+                                       parameters).fetchall()
+
+    def get_analyte_codes(self, analyte):
+        """returns the analyte codes an analyte stands for: the codes of the MB Labs analyte names or descriptions
+        (from EasyTraxCodes.json) it matches, and the analyte itself, in case it is already a code.
+
+        MB Labs names are mostly element symbols ('Pb'), so the analyte is matched to the descriptions as well, with
+        or without the part in brackets ('Lead (Total)' or 'Lead'). Both are matched ignoring case. Different MB Labs
+        names can share a code, and a description without its brackets can match more than one ('Phosphate').
+        """
+
+        analyte_codes = []
+        analyte_lower = analyte.lower()
+        for name, (analyte_code, description) in self.code_registry.analyte_codes.items():
+            description = description.lower()
+            if analyte_lower in (name.lower(), description, description.split(' (')[0]):
+                if str(analyte_code) not in analyte_codes:
+                    analyte_codes.append(str(analyte_code))
+        if analyte not in analyte_codes:
+            analyte_codes.append(analyte)
+        return analyte_codes
+
+    def get_client_filter(self, client):
+        """returns the column of the results table, and the value, to find a client by. A client ID is used as it
+        is, and a client identifier or client name is swapped for its client ID if it has one. Part of a name (ex.
+        'Cranbrook') is enough, as long as only one client matches it.
+
+        Returns
+        -------
+        client_column, client_value : str, str
+            ex. ('client_id', '11273').
+        """
+
+        if client.isdigit():
+            return 'client_id', client
+        clients = self.code_registry.required_file_fields[6]
+        for client_name, client_identifier, client_id in clients:
+            if client in (client_name, client_identifier):
+                return 'client_id', str(client_id)
+        matching_ids = set(str(client_id) for client_name, client_identifier, client_id in clients
+                           if client.lower() in client_name.lower() or client.lower() in client_identifier.lower())
+        if len(matching_ids) == 1:
+            return 'client_id', matching_ids.pop()
+        return 'client_identifier', client
+
+
+def get_iso_date(date_value, month_codes):
+    """turns a sample date in the MB Labs format ('02Jan21') into 'yyyy-mm-dd' ('2021-01-02'), or None if it isn't
+    one."""
+
+    try:
+        return '20%s-%s-%s' % (date_value[5:7], month_codes[date_value[2:5]], date_value[0:2])
+    except KeyError:
+        return None
+
+
+def store_report(report_path, database_path=DEFAULT_DATABASE, column_mode='split'):
+    """parses a report, and stores its results, without converting it. Used by the ingest command.
+
+    Returns
+    -------
+    job_number, results_stored : str, int
+        the job number, and the amount of results stored.
+    """
+
+    job_number = os.path.splitext(os.path.basename(report_path))[0][1:]
+    parsing_script = Parse.EasyTraxParse(job_number, Input.read_report_lines(report_path), column_mode=column_mode)
+    samples_dictionary, job_dictionary, parse_log = parsing_script.easy_trax_parse_controller()
+    with EasyTraxResultsStore(database_path) as results_store:
+        return job_dictionary['job number'], results_store.store_job(samples_dictionary, job_dictionary,
+                                                                     report_path)
+
+
+def main(argv=None):
+    """command line entry point. 'ingest' stores reports, 'query' prints the results for an analyte.
+
+    Returns
+    -------
+    int
+        0, or 1 if a report couldn't be stored, or a query found nothing.
+    """
+
+    parser = argparse.ArgumentParser(description='Store parsed results in a SQLite database, and look them up.')
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='the SQLite database file.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    ingest_parser = subparsers.add_parser('ingest', help='parse reports and store their results.')
+    ingest_parser.add_argument('reports', nargs='+', help='reports, or directories of W*.txt reports.')
+    ingest_parser.add_argument('--fixed-width', action='store_true',
+                               help='read data tables by column position rather than by splitting on spaces.')
+    query_parser = subparsers.add_parser('query', help='print the results for an analyte, oldest first.')
+    query_parser.add_argument('analyte', help="the MB Labs analyte name (ex. 'Pb'), its description (ex. 'Lead'), or "
+                                              "WaterTrax analyte code.")
+    query_parser.add_argument('--client', default=None, help='client ID, identifier, or name.')
+    query_parser.add_argument('--location', default=None, help='sample location.')
+    query_parser.add_argument('--from', dest='date_from', default=None, help='first date, yyyy-mm-dd.')
+    query_parser.add_argument('--to', dest='date_to', default=None, help='last date, yyyy-mm-dd.')
+    query_parser.add_argument('--years', type=float, default=None,
+                              help='only the last this many years (instead of --from).')
+    query_parser.add_argument('--csv', action='store_true', help='print comma separated values.')
+    args = parser.parse_args(argv)
+    if args.command == 'ingest':
+        report_paths = []
+        for report in args.reports:
+            if os.path.isdir(report):
+                report_paths += sorted(glob.glob(os.path.join(report, 'W*.txt')))
+            else:
+                report_paths.append(report)
+        failed = 0
+        for report_path in report_paths:
+            try:
+                job_number, results_stored = store_report(report_path, args.database,
+                                                          'fixed-width' if args.fixed_width else 'split')
+            except Exception as exc:
+                failed += 1
+                print(report_path + ': ' + type(exc).__name__ + ': ' + str(exc))
+                continue
+            print(job_number + ': ' + str(results_stored) + ' results stored.')
+        return 1 if failed else 0
+    date_from = args.date_from
+    if args.years is not None:
+        date_from = (datetime.date.today() - datetime.timedelta(days=round(args.years * 365.25))).isoformat()
+    start = time.perf_counter()
+    with EasyTraxResultsStore(args.database) as results_store:
+        rows = results_store.query_time_series(args.analyte, args.client, args.location, date_from, args.date_to)
+    query_seconds = time.perf_counter() - start
+    if args.csv:
+        print(','.join(SERIES_COLUMNS))
+        for row in rows:
+            print(','.join('' if item is None else '"' + str(item).replace('"', '""') + '"' for item in row))
+    else:
+        print('%-10s %-5s %-8s %-8s %-10s %-10s %s' % ('Date', 'Time', 'Job', 'Sample', 'Location', 'Value', 'Unit'))
+        for row in rows:
+            print('%-10s %-5s %-8s %-8s %-10s %-10s %s' % (row[0] or '', row[1] or '', row[2], row[3], row[5] or '',
+                                                           row[10], row[8] or ''))
+        print('\n' + str(len(rows)) + ' results, %.1f ms.' % (query_seconds * 1000))
+    return 0 if rows else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+import argparse
+import os
+import random
+import sys
+
+
+# (analyte, unit) of the horizontal table columns, in the order they are used. pH has no unit on the 'SAMPLE' line.
+HORIZONTAL_ANALYTES = [('Alkalinity', '(mg/L)'), ('pH', None), ('Cl-', '(mg/L)'), ('Turbidity', '(NTU)'),
+                       ('NO3-N', '(mg/L)'), ('F-', '(mg/L)'), ('E.C.', '(uS/cm)'), ('Colour', '(TCU)'),
+                       ('NH3-N', '(mg/L)'), ('NO2-N', '(mg/L)'), ('SO42-', '(mg/L)'), ('TKN', '(mg/L)'),
+                       ('T.O.C.', '(mg/L)'), ('TDS', '(mg/L)'), ('TSS', '(mg/L)'), ('UVT', '(%)'),
+                       ('Ortho-PO43--P', '(mg/L)'), ('TPO43--P', '(mg/L)'), ('TN', '(mg/L)'), ('Bromate', '(ug/L)')]
+MICROCYSTINS = ['MC-LR', 'MC-YR', 'MC-RR', 'MC-LA', 'MC-LF', 'MC-LW', 'T.MC']
+# the 33 metals of an ICP table, in the order FirstChoice prints them.
+METALS = [('Aluminum', 'Al'), ('Antimony', 'Sb'), ('Arsenic', 'As'), ('Barium', 'Ba'), ('Beryllium', 'Be'),
+          ('Boron', 'B'), ('Calcium', 'Ca'), ('Cadmium', 'Cd'), ('Chromium', 'Cr'), ('Cobalt', 'Co'),
+          ('Copper', 'Cu'), ('Gold', 'Au'), ('Iron', 'Fe'), ('Lanthanum', 'La'), ('Lead', 'Pb'),
+          ('Magnesium', 'Mg'), ('Manganese', 'Mn'), ('Mercury', 'Hg'), ('Molybdenum', 'Mo'), ('Nickel', 'Ni'),
+          ('Phosphorus', 'P'), ('Potassium', 'K'), ('Scandium', 'Sc'), ('Selenium', 'Se'), ('Silicon', 'Si'),
+          ('Silver', 'Ag'), ('Sodium', 'Na'), ('Strontium', 'Sr'), ('Tin', 'Sn'), ('Titanium', 'Ti'),
+          ('Tungsten', 'W'), ('Vanadium', 'V'), ('Zinc', 'Zn')]
+# the drinking water limits printed after the unit of an ICP row. Each ends in one of the words EasyTraxParse looks
+# for ('listed', 'AO', 'hard'), or is two words long.
+DRINKING_WATER_LIMITS = ['0.1 MAC', '- Not listed', '<= 0.3 mg/L AO', '< 500 very hard']
+# the most samples in one ICP table, and in one line of the 'Samples:' header.
+ICP_SAMPLES_PER_TABLE = 6
+HEADER_SAMPLES_PER_LINE = 2
+VALUE_WIDTH = 10
+ICP_VALUE_WIDTH = 9
+
+
+class EasyTraxSyntheticReport:
+    """Makes made-up FirstChoice reports, laid out the way EasyTraxParse expects real ones to be.
+
+    There are only a handful of real reports to try changes on, and none of them are big. This class makes reports
+    of any size, so the parser and converter can be timed on 10, 100 or 1000 samples (see EasyTraxBenchmark). The
+    same settings and seed always make the same report.
+
+    A report has:
+
+    * the client header line, with the client identifier and job number.
+    * the 'Samples:' header block, with the name, location code, date and time of every sample.
+    * tables horizontal 'SAMPLE' tables, each with analytes columns (taken in turn from HORIZONTAL_ANALYTES, so the
+      first table has a pH column), one row per sample, and a Lab Blank row. Some values are '---' (no value) or
+      below the detection limit.
+    * if icp is True, one 33 row 'ELEMENTS' table per ICP_SAMPLES_PER_TABLE samples, with a Hardness row, and the
+      drinking water limits ('... listed', '... AO', '... hard') after each row.
+    * if microcystins is True, a horizontal table of microcystins in (ug/L).
+
+    Can be run from the command line, to write reports to a directory:
+
+        python EasyTraxSynthetic.py reports -n 10 100 1000
+
+    Attributes
+    ----------
+    samples : int
+        the amount of samples in the report.
+
+    tables : int
+        the amount of horizontal tables (not counting the microcystin table).
+
+    analytes : int
+        the amount of analytes in each horizontal table.
+
+    icp : bool
+        whether the report has ICP tables.
+
+    microcystins : bool
+        whether the report has a microcystin table.
+
+    seed : int
+        the seed of the random values.
+
+    job_number : str
+        the job number, with the 'W' (ex. 'W160000').
+
+    client : str
+        the client identifier, as written on the report (ex. 'BC Ferry').
+
+    Methods
+    -------
+    * `generate()` -
+        returns the lines of the report.
+
+        * `get_sample_metadata(sample_number)` -
+            returns the name, location, date and time of a sample.
+
+        * `get_header_lines()` -
+            returns the client line and the 'Samples:' block.
+
+        * `get_horizontal_table_lines(table_analytes, first_table)` -
+            returns the lines of one 'SAMPLE' table.
+
+        * `get_icp_table_lines(sample_numbers)` -
+            returns the lines of one 'ELEMENTS' table.
+    """
+
+    def __init__(self, samples=10, tables=2, analytes=5, icp=True, microcystins=True, seed=0,
+                 job_number='W160000', client='BC Ferry'):
+        """
+        Parameters
+        ----------
+        samples : int
+            the amount of samples in the report.
+        tables : int
+            the amount of horizontal tables.
+        analytes : int
+            the amount of analytes in each horizontal table.
+        icp : bool
+            whether to add ICP tables.
+        microcystins : bool
+            whether to add a microcystin table.
+        seed : int
+            the seed of the random values.
+        job_number : str
+            the job number, with the 'W'.
+        client : str
+            the client identifier.
+        """
+
+        self.samples = samples
+        self.tables = tables
+        self.analytes = analytes
+        self.icp = icp
+        self.microcystins = microcystins
+        self.seed = seed
+        self.job_number = job_number
+        self.client = client
+        self.random = random.Random(seed)
+
+    def generate(self):
+        """returns the lines of the report, each ending in a new line, the same as readlines() would.
+
+        Returns
+        -------
+        mb_file_contents : list(str)
+            the lines of the report.
+        """
+
+        self.random = random.Random(self.seed)
+        lines = self.get_header_lines()
+        for table in range(self.tables):
+            table_analytes = [HORIZONTAL_ANALYTES[(table * self.analytes + analyte) % len(HORIZONTAL_ANALYTES)]
+                              for analyte in range(self.analytes)]
+            lines.extend(self.get_horizontal_table_lines(table_analytes, table == 0))
+        if self.icp:
+            for first_sample in range(1, self.samples + 1, ICP_SAMPLES_PER_TABLE):
+                lines.extend(self.get_icp_table_lines(
+                    list(range(first_sample, min(self.samples + 1, first_sample + ICP_SAMPLES_PER_TABLE)))))
+        if self.microcystins:
+            lines.extend(self.get_horizontal_table_lines([(name, '(ug/L)') for name in MICROCYSTINS], False))
+        return [line + '\n' for line in lines]
+
+    def get_sample_metadata(self, sample_number):
+        """returns the name, location code, date and time of a sample (ex. '12 Site 12 Tap', 'A012B', '13Jan21',
+        '09:12a')."""
+
+        return ('%d Site %d Tap' % (sample_number, sample_number),
+                'A%03dB' % (sample_number % 1000),
+                '%02dJan21' % (sample_number % 28 + 1),
+                '%02d:%02d%s' % (7 + sample_number % 10, sample_number % 60, 'a' if sample_number % 10 < 5 else 'p'))
+
+    def get_header_lines(self):
+        """returns the client line, and the 'Samples:' block listing every sample, followed by a blank line."""
+
+        lines = [self.client + ' Terminal Services            Final Report                 ' + self.job_number, '']
+        header_samples = []
+        for sample_number in range(1, self.samples + 1):
+            name, location, date, time = self.get_sample_metadata(sample_number)
+            header_samples.append(name.replace(' ', ') ', 1) + ' ' + location + ' ' + date + ' ' + time)
+        for first in range(0, len(header_samples), HEADER_SAMPLES_PER_LINE):
+            lines.append(('Samples: ' if first == 0 else '         ') +
+                         '  '.join(header_samples[first:first + HEADER_SAMPLES_PER_LINE]))
+        lines.append('')
+        return lines
+
+    def get_value(self, detection_limit='<1'):
+        """returns a random value: usually a number, sometimes '---' (no value) or below the detection limit."""
+
+        roll = self.random.random()
+        if roll < 0.05:
+            return '---'
+        if roll < 0.15:
+            return detection_limit
+        return '%.2f' % (self.random.random() * 100)
+
+    def get_horizontal_table_lines(self, table_analytes, first_table):
+        """returns the lines of one horizontal 'SAMPLE' table, followed by a blank line.
+
+        Parameters
+        ----------
+        table_analytes : list(tuple)
+            (analyte, unit) of each column. A unit of None leaves the column blank on the 'SAMPLE' line, like pH.
+        first_table : bool
+            whether this is the first table of the report, which has a '0' at the start of its analyte line.
+
+        Returns
+        -------
+        lines : list(str)
+            the analyte line, the 'SAMPLE' line, the dashes, one line per sample, the Lab Blank, and a blank line.
+        """
+
+        # a column is wide enough for its analyte name and unit, with at least one space before them
+        widths = [max(VALUE_WIDTH, len(analyte) + 1, len(unit or '') + 1) for analyte, unit in table_analytes]
+        analyte_line = ('0' if first_table else '').ljust(44) + ''.join(analyte.rjust(width) for (analyte, unit), width
+                                                                        in zip(table_analytes, widths))
+        units_line = 'SAMPLE'.ljust(28) + 'DATE'.ljust(9) + 'TIME'.ljust(7) + ''.join((unit or '').rjust(width)
+                                                                                       for (analyte, unit), width
+                                                                                       in zip(table_analytes, widths))
+        lines = [analyte_line, units_line, '-' * len(analyte_line)]
+        for sample_number in range(1, self.samples + 1):
+            name, location, date, time = self.get_sample_metadata(sample_number)
+            lines.append(name.ljust(20) + ' ' + location.ljust(6) + ' ' + date.ljust(8) + ' ' + time.ljust(6) +
+                         ''.join(self.get_value().rjust(width) for width in widths))
+        lines.append('Lab Blank'.ljust(44) + ''.join('<1'.rjust(width) for width in widths))
+        lines.append('')
+        return lines
+
+    def get_icp_table_lines(self, sample_numbers):
+        """returns the lines of one vertical 'ELEMENTS' ICP table, followed by a blank line.
+
+        Parameters
+        ----------
+        sample_numbers : list(int)
+            the samples in the table, one column each.
+
+        Returns
+        -------
+        lines : list(str)
+            the sample number line, the 'ELEMENTS' line, the dashes, the 33 metals, Hardness, and a blank line.
+        """
+
+        values_width = ICP_VALUE_WIDTH * len(sample_numbers)
+        lines = [''.ljust(26) + ''.join(str(sample_number).rjust(ICP_VALUE_WIDTH) for sample_number in sample_numbers)
+                 + '           Maximum Limits Permissable',
+                 'ELEMENTS'.ljust(26) + ''.ljust(values_width) + '           In Drinking Water',
+                 '-' * (26 + values_width + 36)]
+        for row, (name, symbol) in enumerate(METALS):
+            lines.append(('%d) %s %s' % (row + 1, name, symbol)).ljust(26) +
+                         ''.join(self.get_value('<0.01').replace('---', '<0.01').rjust(ICP_VALUE_WIDTH)
+                                 for _ in sample_numbers) +
+                         '   mg/L    ' + DRINKING_WATER_LIMITS[row % len(DRINKING_WATER_LIMITS)])
+        lines.append('Hardness (mg/L CaCO3)'.ljust(26) +
+                     ''.join(('%.1f' % (self.random.random() * 200)).rjust(ICP_VALUE_WIDTH) for _ in sample_numbers) +
+                     '   mg/L    - Not listed')
+        lines.append('')
+        return lines
+
+
+def write_report(report_path, mb_file_contents):
+    """writes the lines of a report to report_path."""
+
+    with open(report_path, 'w') as report_file:
+        report_file.writelines(mb_file_contents)
+
+
+def main(argv=None):
+    """command line entry point. Writes one made-up report per sample count to a directory.
+
+    Returns
+    -------
+    int
+        0.
+    """
+
+    parser = argparse.ArgumentParser(description='Write made-up FirstChoice reports for testing EasyTrax.')
+    parser.add_argument('directory', help='directory to write the reports to (made if needed).')
+    parser.add_argument('-n', '--samples', type=int, nargs='+', default=[10],
+                        help='sample counts, one report each.')
+    parser.add_argument('-t', '--tables', type=int, default=2, help='horizontal tables in each report.')
+    parser.add_argument('-a', '--analytes', type=int, default=5, help='analytes in each horizontal table.')
+    parser.add_argument('--no-icp', action='store_true', help="don't add ICP tables.")
+    parser.add_argument('--no-microcystins', action='store_true', help="don't add a microcystin table.")
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random values.')
+    args = parser.parse_args(argv)
+    os.makedirs(args.directory, exist_ok=True)
+    for number, samples in enumerate(args.samples):
+        job_number = 'W%06d' % (160000 + number)
+        report = EasyTraxSyntheticReport(samples, args.tables, args.analytes, not args.no_icp,
+                                         not args.no_microcystins, args.seed, job_number)
+        report_path = os.path.join(args.directory, job_number + '.txt')
+        write_report(report_path, report.generate())
+        print(report_path + ': ' + str(samples) + ' samples')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
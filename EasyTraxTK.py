@@ -1,63 +1,118 @@
+import queue
+import re
+import threading
 import tkinter as Tk
-import EasyTraxParse as Parse
-import EasyTraxConvert as Convert
+import EasyTraxBatch as Batch
+import EasyTraxCache as Cache
+import EasyTraxShare as Share
 
 
 class MainApplication(Tk.Frame):
     """Runs the TK window that allows the user to interact with EasyTrax.
 
-    currently a very simple frame, consisting of one Tk.Entry box (where the user inputs the job number)
-    and one button that runs easy_trax_controller.
+    currently a very simple frame, consisting of one Tk.Text box (where the user inputs one or more job numbers),
+    one button that runs easy_trax_controller, a status row for each job, and the log.
 
-    The controller function gets the jobnumber, gets the corresponding file from /Files_To_Report/,
-    and reads it line by line into mb_file_contents.
+    The controller function gets the job numbers, and puts each one on job_queue. The window never does the work
+    itself, so it doesn't freeze while a big report (or a slow network share) is being read.
 
-    It passes mb_file_contents and job_number to EasyTraxParse. It receives back an intermediate sample dictionary
-    and job dictionary.
+    A background worker thread takes the jobs off job_queue one at a time. For each, it finds the corresponding file
+    in /Files_To_Report/, and converts it with EasyTraxBatch.convert_report_file, which reads the file, passes it to
+    EasyTraxParse, and passes the intermediate sample dictionary and job dictionary to EasyTraxConvert, which handles
+    the conversion and file writing processes.
 
-    It passes these dictionaries to EasyTraxConvert, which handles the conversion and file writing processes.
+    Files_To_Report and WTX_reports are on the T: drive (or wherever EASYTRAX_INPUT_ROOT and EASYTRAX_OUTPUT_ROOT
+    point). Reports are read through a local copy (see EasyTraxShare.EasyTraxInputCache), which the worker fills with
+    every report in Files_To_Report when it starts, and WTX reports are written to the local disk, then copied to
+    WTX_reports in the background by a spooler, which tries again if the share can't be reached. A job's status shows
+    when its WTX report has reached the share.
+
+    The worker never touches the window (Tk widgets can only be used from the thread running the window). It puts
+    status updates and log text on message_queue, which the window checks every MESSAGE_CHECK_MS.
 
     Last Updated: 10 June 2021, P.L.
 
     Attributes
     ----------
     job_number : str
-        the job number belonging to the report to be created.
+        the job number belonging to the report being created.
 
     file_path_and_name : str
-        the full filename (name and path) of the file to be read.
+        the full filename (name and path) of the file being read.
+
+    file_dump_directory_location : str
+        the location of the files we are going to be looking for (Files_To_Report).
 
-    mb_file : str
-        the full file, as one continuous string.
+    input_cache : EasyTraxShare.EasyTraxInputCache
+        the local copies of the reports in file_dump_directory_location.
 
-    mb_file_contents : list(str)
-        the lines in the file, line by line, in list format.
+    spooler : EasyTraxShare.EasyTraxSpooler
+        copies the WTX reports to the share in the background.
 
-    file_dump_directory_location : str
-        the location of the files we are going to be looking for.
+    spooled_jobs : dict
+        WTX report in the spool : (job number, WTX lines), for the jobs waiting to be copied to the share.
+
+    table_cache : EasyTraxCache.EasyTraxTableCache
+        parsed tables from earlier runs, so running a job again after fixing one table only parses that table.
+
+    job_queue : queue.Queue
+        job numbers waiting for the worker.
+
+    message_queue : queue.Queue
+        (kind, job number, text) messages from the worker to the window. kind is 'status' or 'log'.
 
-    job_number_entry : Tk.Entry
-        where the user inputs the job number of the report they want to make.
+    worker : threading.Thread
+        the background thread converting the jobs on job_queue.
 
-    EasyTraxMakerLog : Tk.Entry
-        where the user can see the error log for the file they want to parse.
+    job_number_entry : Tk.Text
+        where the user inputs the job numbers of the reports they want to make, separated by spaces, commas, or
+        new lines.
+
+    job_status_frame : Tk.Frame
+        holds one status row per job.
+
+    job_status_labels : dict
+        job number : the Tk.Label showing the status of the job.
+
+    EasyTraxMakerLog : Tk.Text
+        where the user can see the error log for the files being parsed.
 
     Methods
     -------
     * `easy_trax_controller()` -
-        executes the various methods/functions in the script in the right order. Essentially controls the whole
-        program.
+        queues the job numbers in job_number_entry for the worker.
+
+    * `get_job_numbers_from_entry()` -
+        returns the job numbers typed (or pasted) into job_number_entry.
 
     * `clear_text()` -
-        clears the text from job_number_entry, so another job can be entered.
+        clears the text from job_number_entry, so more jobs can be entered.
+
+    * `easy_trax_worker()` -
+        runs in the worker thread, converting the jobs on job_queue one at a time.
+
+        * `convert_job(job_number)` -
+            converts one job, reporting its status and log through message_queue.
 
-    * `get_file_from_job_number()` -
-        tries to open the requested file. If it can find the file, reads it line by line into mb_file_contents (list).
+        * `get_file_from_job_number(job_number)` -
+            returns the full filename of the (local copy of the) report for a job number, or False if there isn't one.
+
+    * `report_synced(spool_path, error)` -
+        called by the spooler once a WTX report has been copied to the share (or given up on).
+
+    * `check_message_queue()` -
+        shows the messages the worker has put on message_queue, then checks again in MESSAGE_CHECK_MS.
+
+    * `set_job_status(job_number, status)` -
+        adds or updates the status row of a job.
 
     * `write_log_to_text_box()` -
-        clears any text in EasyTraxMakerLog, and then writes the passed text to the Text box.
+        adds the passed text to the end of EasyTraxMakerLog, clearing it first if asked.
     """
 
+    # how often (in milliseconds) the window checks for messages from the worker.
+    MESSAGE_CHECK_MS = 100
+
     def __init__(self, parent, **kwargs):
         """
         Parameters
@@ -72,79 +127,220 @@ class MainApplication(Tk.Frame):
         # Variables
         self.job_number = ""
         self.file_path_and_name = ""
-        self.mb_file = ""
-        self.mb_file_contents = ""
-        self.file_dump_directory_location = 'T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Files_To_Report\\W'
+        self.file_dump_directory_location = Share.get_input_root()
+        self.table_cache = Cache.EasyTraxTableCache()
+        self.input_cache = Share.EasyTraxInputCache(self.file_dump_directory_location)
+        self.spooler = Share.EasyTraxSpooler(on_synced=self.report_synced)
+        self.spooled_jobs = {}
+        self.job_queue = queue.Queue()
+        self.message_queue = queue.Queue()
+        self.worker = threading.Thread(target=self.easy_trax_worker, daemon=True)
+        self.job_status_labels = {}
         # TKinter stuff
-        self.job_number_entry = Tk.Entry(self)
-        self.EasyTraxMakerLog = Tk.Text(self, height=25, width=60)
+        self.job_number_entry = Tk.Text(self, height=3, width=20)
+        self.job_status_frame = Tk.Frame(self)
+        self.EasyTraxMakerLog = Tk.Text(self, height=20, width=60)
         self.EasyTraxMakerLog.config(state=Tk.DISABLED)
         self.job_number_entry.grid(row=0, column=0, sticky=Tk.W, padx=5, pady=5)
         Tk.Button(self,
                   text="Create WTX File",
                   command=self.easy_trax_controller).grid(row=1, column=0, sticky=Tk.W, padx=5)
+        self.job_status_frame.grid(row=2, column=0, columnspan=2, sticky=Tk.W, padx=5)
         self.EasyTraxMakerLog.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
+        self.worker.start()
+        self.spooler.start()
+        self.after(self.MESSAGE_CHECK_MS, self.check_message_queue)
 
     def easy_trax_controller(self):
-        """executes the various methods/functions in the script in the right order.
+        """queues the job numbers in job_number_entry for the worker.
 
-        gets the job number, clears the text from the entry box. Gets the file, and reads the file line by
-        line into a list, stored in mb_file_contents. if mb_file_contents isn't empty, then we have our file.
-        It's first passed to the parsing script. The intermediate file format is collected, and passed
-        to the converting script. The converting script handles the writing of the file. If no file is found,
-        an error message is printed to the console.
+        gets the job numbers, clears the text from the entry box, and adds a 'queued' status row for each job. The
+        worker thread picks them up from job_queue in the order they were entered, so the window is free straight
+        away. If no job number was entered, an error message is written to the log.
         """
 
-        self.job_number = self.job_number_entry.get()
+        job_numbers = self.get_job_numbers_from_entry()
         self.clear_text()
-        self.get_file_from_job_number()
-        if self.mb_file_contents:
-            self.write_log_to_text_box("MB Labs file found, attempting to create WTX file.\n", True)
-            parsing_script = Parse.EasyTraxParse(self.job_number, self.mb_file_contents)
-            samples_dictionary, job_dictionary, parse_log = parsing_script.easy_trax_parse_controller()
-            self.write_log_to_text_box(parse_log)
-            converting_script = Convert.EasyTraxConvert(samples_dictionary, job_dictionary)
-            convert_log = converting_script.easy_trax_convert_controller()
-            self.write_log_to_text_box(convert_log)
-        else:
-            self.write_log_to_text_box("No MB Labs file found with that job number.\n" +
-                                       "You either incorrectly typed it in, or it \n" +
-                                       "doesn't exist in Files_To_Report. Remember,\n" +
-                                       "don't type the 'W' before the job number.\n", True)
+        if not job_numbers:
+            self.write_log_to_text_box("No job number entered. Type or paste one or more\n" +
+                                       "job numbers, separated by spaces or new lines.\n")
+            return
+        for job_number in job_numbers:
+            self.set_job_status(job_number, 'queued')
+            self.job_queue.put(job_number)
+
+    def get_job_numbers_from_entry(self):
+        """returns the job numbers in job_number_entry, in order, each once.
+
+        job numbers can be separated by spaces, commas, or new lines. A 'W' typed before a job number is dropped.
+
+        Returns
+        -------
+        job_numbers : list(str)
+            the job numbers, without the 'W'.
+        """
+
+        job_numbers = []
+        for job_number in re.split(r'[\s,;]+', self.job_number_entry.get('1.0', Tk.END)):
+            if job_number[:1] in ('W', 'w'):
+                job_number = job_number[1:]
+            if job_number and job_number not in job_numbers:
+                job_numbers.append(job_number)
+        return job_numbers
 
     def clear_text(self):
-        """clears the text from job_number_entry, so another job can be entered.
+        """clears the text from job_number_entry, so more jobs can be entered.
         """
 
-        self.job_number_entry.delete(0, 'end')
+        self.job_number_entry.delete('1.0', Tk.END)
 
-    def get_file_from_job_number(self):
-        """tries to open the requested file. Reads it line by line into mb_file_contents (list).
+    def easy_trax_worker(self):
+        """runs in the worker thread: converts the jobs on job_queue one at a time, for as long as the window is open.
 
-        If the file isn't found, sets mb_file_contents to False so it can be detected in the controller.
+        an unexpected error in one job is reported as a failed job, and the worker carries on with the next one.
+
+        before the first job, every report in Files_To_Report is copied to the local disk (only the ones that have
+        changed since last time), so most jobs can be read without waiting on the share.
+        """
+
+        self.input_cache.prefetch()
+        while True:
+            job_number = self.job_queue.get()
+            try:
+                self.convert_job(job_number)
+            except Exception as exc:
+                self.message_queue.put(('status', job_number, 'failed'))
+                self.message_queue.put(('log', job_number, type(exc).__name__ + ': ' + str(exc) + '\n'))
+
+    def convert_job(self, job_number):
+        """converts one job, in the worker thread. Its status and logs are put on message_queue for the window.
+
+        Parameters
+        ----------
+        job_number : str
+            the job number, without the 'W'.
+        """
+
+        self.job_number = job_number
+        self.message_queue.put(('status', job_number, 'reading'))
+        self.file_path_and_name = self.get_file_from_job_number(job_number)
+        if not self.file_path_and_name:
+            self.message_queue.put(('status', job_number, 'not found'))
+            self.message_queue.put(('log', job_number,
+                                    "W" + job_number + ": No MB Labs file found with that job number.\n" +
+                                    "You either incorrectly typed it in, or it \n" +
+                                    "doesn't exist in Files_To_Report.\n"))
+            return
+        self.message_queue.put(('status', job_number, 'converting'))
+        self.message_queue.put(('log', job_number,
+                                "W" + job_number + ": MB Labs file found, attempting to create WTX file.\n"))
+        job_result = Batch.convert_report_file(self.file_path_and_name,
+                                               wtx_reports_directory=self.spooler.spool_directory,
+                                               cache_directory=self.table_cache.cache_directory)
+        self.message_queue.put(('log', job_number, job_result['parse log'].render()))
+        self.message_queue.put(('log', job_number, job_result['convert log'].render()))
+        if job_result['status'] == 'ok':
+            self.message_queue.put(('status', job_number, 'copying ' + str(job_result['lines']) + ' WTX lines'))
+            self.spooled_jobs[job_result['wtx path']] = (job_number, job_result['lines'])
+            self.spooler.submit(job_result['wtx path'])
+        else:
+            self.message_queue.put(('status', job_number, 'failed'))
+            self.message_queue.put(('log', job_number, job_result['error'] + '\n'))
+
+    def get_file_from_job_number(self, job_number):
+        """returns the full filename of the report for a job number. This is the local copy of the report (see
+        EasyTraxShare.EasyTraxInputCache), copied from Files_To_Report if it has changed.
+
+        Returns
+        -------
+        str or False
+            the full filename, or False if the file isn't found, so it can be detected in convert_job.
+        """
+
+        file_path_and_name = self.input_cache.get_report("W" + job_number + ".txt")
+        if file_path_and_name:
+            return file_path_and_name
+        return False
+
+    def report_synced(self, spool_path, error):
+        """called by the spooler (in its own thread) once a WTX report has been copied to the share, or couldn't be.
+        The job's status is updated through message_queue.
+
+        Parameters
+        ----------
+        spool_path : str
+            the WTX report in the spool.
+        error : str
+            why the report couldn't be copied, or '' if it was.
+        """
+
+        job_number, lines = self.spooled_jobs.pop(spool_path, (None, 0))
+        if job_number is None:
+            # left in the spool by an earlier run
+            if error:
+                self.message_queue.put(('log', None, spool_path + " couldn't be copied to the share: " + error + '\n'))
+            return
+        if error:
+            self.message_queue.put(('status', job_number, 'not copied to the share'))
+            self.message_queue.put(('log', job_number,
+                                    "W" + job_number + ": the WTX report couldn't be copied to\n" +
+                                    self.spooler.output_root + "\n" + error + "\n" +
+                                    "It will be tried again next time EasyTrax is opened.\n"))
+        else:
+            self.message_queue.put(('status', job_number, 'done, ' + str(lines) + ' WTX lines'))
+
+    def check_message_queue(self):
+        """shows every message the worker has put on message_queue since the last check, then checks again in
+        MESSAGE_CHECK_MS. Runs in the window's thread, so it is the only place the worker's results reach the widgets.
         """
 
-        self.file_path_and_name = self.file_dump_directory_location + self.job_number + ".txt"
         try:
-            self.mb_file = open(self.file_path_and_name, 'r')
-            self.mb_file_contents = self.mb_file.readlines()
-        except FileNotFoundError:
-            self.mb_file_contents = False
+            while True:
+                kind, job_number, text = self.message_queue.get_nowait()
+                if kind == 'status':
+                    self.set_job_status(job_number, text)
+                else:
+                    self.write_log_to_text_box(text)
+        except queue.Empty:
+            pass
+        self.after(self.MESSAGE_CHECK_MS, self.check_message_queue)
+
+    def set_job_status(self, job_number, status):
+        """adds a status row for a job to job_status_frame, or updates the one already there.
+
+        Parameters
+        ----------
+        job_number : str
+            the job number, without the 'W'.
+        status : str
+            the status to show (ex. 'queued', 'converting', 'done, 120 WTX lines').
+        """
+
+        if job_number not in self.job_status_labels:
+            row = len(self.job_status_labels)
+            Tk.Label(self.job_status_frame, text='W' + job_number).grid(row=row, column=0, sticky=Tk.W)
+            self.job_status_labels[job_number] = Tk.Label(self.job_status_frame, text=status)
+            self.job_status_labels[job_number].grid(row=row, column=1, sticky=Tk.W, padx=10)
+        else:
+            self.job_status_labels[job_number].config(text=status)
 
     def write_log_to_text_box(self, passed_text, with_delete=False):
-        """clears any text in EasyTraxMakerLog, and then writes the passed text to the Text box."""
+        """adds the passed text to the end of EasyTraxMakerLog, clearing any text in it first if with_delete is True.
+
+        only the new text is inserted (the text already in the box is never read back), so adding to a long log is as
+        quick as adding to an empty one.
+        """
 
         self.EasyTraxMakerLog.config(state=Tk.NORMAL)
         if with_delete:
             self.EasyTraxMakerLog.delete('1.0', Tk.END)
-        if len(self.EasyTraxMakerLog.get("1.0", Tk.END)) == 1:
-            self.EasyTraxMakerLog.insert(Tk.END, passed_text)
-        else:
-            self.EasyTraxMakerLog.insert(Tk.END, passed_text)
+        self.EasyTraxMakerLog.insert(Tk.END, passed_text)
+        self.EasyTraxMakerLog.see(Tk.END)
         self.EasyTraxMakerLog.config(state=Tk.DISABLED)
 
 
-root = Tk.Tk()
-root.geometry('495x470')
-MainApplication(root, height=470, width=495).grid()
-root.mainloop()
+if __name__ == '__main__':
+    root = Tk.Tk()
+    root.geometry('495x560')
+    MainApplication(root, height=560, width=495).grid()
+    root.mainloop()
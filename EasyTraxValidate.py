@@ -0,0 +1,382 @@
+import argparse
+import datetime
+import re
+import sys
+import time
+
+import EasyTraxCodes as Codes
+import EasyTraxConvert as Convert
+import EasyTraxReader as Reader
+
+
+# the 30 fields of a WTX line, by position, as named in WTX_Report_Format_Doc.pdf (which numbers them from 1).
+FIELD_NAMES = ('Version No.', 'Transaction Purpose', 'Value Status', 'WTX Lab ID', 'Notify Email', 'WTX Client ID',
+               'Sampling Point Locator', 'Report ID', 'Report Name', 'Sample ID', 'Group ID', 'Collection Date',
+               'Collection Time', 'Lab Sample Comment', 'Analysis Type', 'Analyte Code', 'Value', 'Units Code',
+               'Lab Result Comment', 'Analytical Method', 'Detection Limit', 'Field Result', 'Analysis Start Date',
+               'Analysis Start Time', 'Analysis End Date', 'Analysis End Time', 'Reporting Limit', 'Unused',
+               'Unused', 'Sample Collector')
+# the fields that have to be filled in: the 11 marked Required in WTX_Report_Format_Doc.pdf (version, transaction
+# purpose, lab ID, client ID, sampling point, report ID, sample ID, collection date, analyte code, value, and units
+# code), and the value status and collection time, which are optional there but EasyTrax always fills in, 13 in all.
+# Every other field (ex. analysis type) is optional, and left empty by EasyTrax.
+MANDATORY_FIELDS = (Convert.VERSION_FIELD, Convert.PURPOSE_FIELD, 2, Convert.LAB_ID_FIELD, Convert.CLIENT_ID_FIELD,
+                    Convert.LOCATION_FIELD, Convert.REPORT_ID_FIELD, Convert.SAMPLE_ID_FIELD, Convert.DATE_FIELD,
+                    Convert.TIME_FIELD, Convert.ANALYTE_CODE_FIELD, Convert.VALUE_FIELD, Convert.UNIT_CODE_FIELD)
+# a line can stop after the last mandatory field, the optional fields after it can be left off.
+MINIMUM_FIELD_COUNT = Convert.UNIT_CODE_FIELD + 1
+# field : the most characters it can hold.
+FIELD_LENGTHS = {4: 256, Convert.CLIENT_ID_FIELD: 5, Convert.LOCATION_FIELD: 6, Convert.REPORT_ID_FIELD: 15, 8: 256,
+                 Convert.SAMPLE_ID_FIELD: 30, 10: 15, 13: 1000, 18: 256, 19: 256}
+# the fields that are the same on every line of a report, and of a sample.
+REPORT_HEADER_FIELDS = (0, 1, 2, 3, 4, 5, 7, 8)
+SAMPLE_HEADER_FIELDS = (6, 9, 10, 11, 12, 13, 14)
+VALUE_STATUSES = frozenset(('P', 'F'))
+ANALYSIS_TYPES = frozenset(('NA', 'RFS', 'RDS', 'TFS', 'TDS'))
+FIELD_RESULTS = frozenset(('Y', 'N'))
+# the words a value can be instead of a number (see field 17 in WTX_Report_Format_Doc.pdf).
+VALUE_CODES = frozenset(('ND', 'U', 'OR', 'NT', 'NR', 'IG', 'P', 'A', 'PR', 'Y', 'N', 'OG', 'TNTC', 'ER', 'SC'))
+NUMBER = re.compile(r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)')
+# a number, a non-detect with its detection limit (0.5U), or detected less than / greater than a number
+VALUE = re.compile(r'(?:DLT|DGT)?[+-]?(?:\d+(?:\.\d*)?|\.\d+)U?')
+DATE = re.compile(r'\d{8}')
+COLLECTION_TIME = re.compile(r'(?:[01]\d|2[0-3])(?::[0-5]\d(?::[0-5]\d)?|[0-5]\d(?:[0-5]\d)?)')
+ANALYSIS_TIME = re.compile(r'(?:[01]\d|2[0-3])[0-5]\d(?:[0-5]\d)?')
+
+
+class EasyTraxWTXValidator:
+    """Checks WTX reports against the WTX 2.0 file specification, before they are uploaded.
+
+    EasyTraxConvert writes whatever lines it makes, and WaterTrax rejects a whole report file if any line in it is
+    wrong ('No client ID' in place of a client, a missing location, a date that isn't one), which is only found out
+    from an email after it has been uploaded. This class checks every line of a WTX report the way WaterTrax does
+    (see 'File Fields' and 'Error Checking' in WTX_Report_Format_Doc.pdf), and reports every problem it finds with
+    its line and field number, rather than stopping at the first.
+
+    Each line is checked for:
+
+    * the amount of fields (at least up to the units code, at most 30)
+
+    * the mandatory fields being filled in, and no field being longer than it can be, or holding a comma
+
+    * the version, transaction purpose, value status, lab ID, and client ID being ones in the code tables
+      (EasyTraxCodes.json)
+
+    * the analyte and unit codes being in the code tables, and the value being a number or one of the allowed codes
+
+    * the dates being real mmddyyyy dates, and the times being hh:mm (or one of the other allowed formats)
+
+    and the lines together are checked for:
+
+    * the report header fields being the same on every line of a report, and the sample header fields being the
+      same on every line of a sample
+
+    * the lines of each report, and of each sample, being kept together
+
+    * an analyte not being in a sample twice with the same (or no) analytical method
+
+    Files are read one line at a time, and no lines are kept. What is kept is the header fields and sample IDs of the
+    report being checked, the analytes of the sample being checked, the report IDs already checked in the file, and
+    each date seen (see check_date()). So the memory used grows with the amount of reports in a file, and of dates
+    in it, but not with the amount of lines. The upload files made by EasyTraxBundle hold several reports one after
+    another, each is checked as its own report.
+
+    Can be run from the command line:
+
+        python EasyTraxValidate.py "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\WTX_reports"
+
+    Attributes
+    ----------
+    code_registry : EasyTraxCodes.EasyTraxCodeRegistry
+        the code tables the codes are checked against.
+
+    line_count : int
+        the amount of lines checked so far.
+
+    violation_counts : dict
+        check : the amount of violations of it found so far (ex. 'bad-client-id' : 12).
+
+    Methods
+    -------
+    * `validate_file(wtx_path)` -
+        yields the violations in one WTX report.
+
+    * `validate_lines(wtx_lines)` -
+        yields the violations in the lines of a WTX report.
+
+        * `check_fields(fields)` -
+            returns the violations in the fields of one line.
+
+        * `check_date(date_value)` -
+            checks a mmddyyyy date is a real date.
+    """
+
+    def __init__(self, code_registry=None):
+        """
+        Parameters
+        ----------
+        code_registry : EasyTraxCodes.EasyTraxCodeRegistry
+            the code tables to check against. If None, the shared one (EasyTraxCodes.get_registry()).
+        """
+
+        self.code_registry = code_registry if code_registry is not None else Codes.get_registry()
+        required_file_fields = self.code_registry.required_file_fields
+        self.version_no = str(required_file_fields[1])
+        self.transaction_purposes = frozenset(str(purpose) for purpose in required_file_fields[2])
+        self.lab_id = str(required_file_fields[4])
+        self.client_ids = frozenset(str(client_id) for client_id in self.code_registry.client_ids.values())
+        self.analyte_codes = frozenset(str(codes[0]) for codes in self.code_registry.analyte_codes.values())
+        self.unit_codes = frozenset(str(unit_code) for unit_code in self.code_registry.unit_codes.values())
+        # date : whether it is a real date. A month of reports only has a few dozen dates.
+        self.dates = {}
+        self.line_count = 0
+        self.violation_counts = {}
+
+    def validate_file(self, wtx_path):
+        """checks a WTX report, one line at a time.
+
+        Parameters
+        ----------
+        wtx_path : str
+            the WTX report.
+
+        Yields
+        ------
+        violation : tuple
+            (line number, field number, check, message). Line and field numbers start at 1, as in the file
+            specification. The field number is 0 for a problem with the whole line.
+        """
+
+        with open(wtx_path, 'r', encoding=Reader.WTX_ENCODING, errors='replace') as wtx_file:
+            yield from self.validate_lines(line.rstrip('\r\n') for line in wtx_file)
+
+    def validate_lines(self, wtx_lines):
+        """checks the lines of a WTX report (or several reports, one after another).
+
+        Parameters
+        ----------
+        wtx_lines : iterable(str)
+            the lines, without line endings.
+
+        Yields
+        ------
+        violation : tuple
+            see validate_file().
+        """
+
+        report_id = None
+        report_header = None
+        reports_done = set()
+        sample_id = None
+        sample_header = None
+        samples_done = set()
+        analytes = set()
+        violation_counts = self.violation_counts
+        for line_number, line in enumerate(wtx_lines, 1):
+            self.line_count += 1
+            if not line:
+                continue
+            fields = line.split('|')
+            violations = self.check_fields(fields)
+            if ',' in line:
+                violations += [(field + 1, 'comma', FIELD_NAMES[field] + " can't hold a comma")
+                               for field, field_value in enumerate(fields[:len(FIELD_NAMES)]) if ',' in field_value]
+            if len(fields) >= MINIMUM_FIELD_COUNT:
+                # the lines of a report, and of a sample, have to be kept together, with the same header fields
+                if fields[Convert.REPORT_ID_FIELD] != report_id:
+                    if report_id is not None:
+                        reports_done.add(report_id)
+                    report_id = fields[Convert.REPORT_ID_FIELD]
+                    report_header = [fields[field] for field in REPORT_HEADER_FIELDS]
+                    sample_id = None
+                    samples_done = set()
+                    if report_id in reports_done:
+                        violations.append((Convert.REPORT_ID_FIELD + 1, 'report-not-grouped',
+                                           'the lines of report ' + report_id + ' are not all together'))
+                else:
+                    for field, report_value in zip(REPORT_HEADER_FIELDS, report_header):
+                        if fields[field] != report_value:
+                            violations.append((field + 1, 'report-header-changed',
+                                               FIELD_NAMES[field] + " is '" + fields[field] + "', but '" +
+                                               report_value + "' earlier in report " + report_id))
+                if fields[Convert.SAMPLE_ID_FIELD] != sample_id:
+                    if sample_id is not None:
+                        samples_done.add(sample_id)
+                    sample_id = fields[Convert.SAMPLE_ID_FIELD]
+                    sample_header = [fields[field] for field in SAMPLE_HEADER_FIELDS]
+                    analytes = set()
+                    if sample_id in samples_done:
+                        violations.append((Convert.SAMPLE_ID_FIELD + 1, 'sample-not-grouped',
+                                           'the lines of sample ' + sample_id + ' are not all together'))
+                else:
+                    for field, sample_value in zip(SAMPLE_HEADER_FIELDS, sample_header):
+                        if fields[field] != sample_value:
+                            violations.append((field + 1, 'sample-header-changed',
+                                               FIELD_NAMES[field] + " is '" + fields[field] + "', but '" +
+                                               sample_value + "' earlier in sample " + sample_id))
+                analytical_method = fields[19] if len(fields) > 19 else ''
+                analyte = (fields[Convert.ANALYTE_CODE_FIELD], analytical_method)
+                if analyte in analytes:
+                    violations.append((Convert.ANALYTE_CODE_FIELD + 1, 'duplicate-analyte',
+                                       'analyte ' + analyte[0] + ' is in sample ' + sample_id + ' more than once' +
+                                       (' with the same analytical method' if analytical_method else
+                                        ', without an analytical method')))
+                analytes.add(analyte)
+            for field_number, check, message in violations:
+                violation_counts[check] = violation_counts.get(check, 0) + 1
+                yield line_number, field_number, check, message
+
+    def check_fields(self, fields):
+        """checks the fields of one WTX line on their own.
+
+        Parameters
+        ----------
+        fields : list(str)
+            the line, split on '|'.
+
+        Returns
+        -------
+        violations : list(tuple)
+            (field number, check, message) of each problem, field numbers starting at 1.
+        """
+
+        violations = []
+        field_count = len(fields)
+        if field_count == len(FIELD_NAMES) + 1 and not fields[-1]:
+            # the last field can be followed by a '|'
+            field_count -= 1
+        if field_count < MINIMUM_FIELD_COUNT or field_count > len(FIELD_NAMES):
+            violations.append((0, 'field-count', 'the line has ' + str(field_count) + ' fields, it should have ' +
+                               str(MINIMUM_FIELD_COUNT) + ' to ' + str(len(FIELD_NAMES))))
+            if field_count < MINIMUM_FIELD_COUNT:
+                return violations
+        for field in MANDATORY_FIELDS:
+            if not fields[field]:
+                violations.append((field + 1, 'empty-field', FIELD_NAMES[field] + ' is empty'))
+        for field, field_length in FIELD_LENGTHS.items():
+            if field < field_count and len(fields[field]) > field_length:
+                violations.append((field + 1, 'too-long', FIELD_NAMES[field] + ' is longer than ' +
+                                   str(field_length) + ' characters'))
+        version_no = fields[Convert.VERSION_FIELD]
+        if version_no and version_no != self.version_no:
+            violations.append((Convert.VERSION_FIELD + 1, 'bad-version',
+                               "'" + version_no + "' is not the file version, " + self.version_no))
+        purpose = fields[Convert.PURPOSE_FIELD]
+        if purpose and purpose not in self.transaction_purposes:
+            violations.append((Convert.PURPOSE_FIELD + 1, 'bad-purpose',
+                               "'" + purpose + "' is not a transaction purpose (" +
+                               ', '.join(sorted(self.transaction_purposes)) + ')'))
+        if fields[2] and fields[2] not in VALUE_STATUSES:
+            violations.append((3, 'bad-value-status', "'" + fields[2] + "' is not a value status (P, F)"))
+        lab_id = fields[Convert.LAB_ID_FIELD]
+        if lab_id and lab_id != self.lab_id:
+            violations.append((Convert.LAB_ID_FIELD + 1, 'bad-lab-id', "'" + lab_id + "' is not the lab ID, " +
+                               self.lab_id))
+        client_id = fields[Convert.CLIENT_ID_FIELD]
+        if client_id and client_id not in self.client_ids:
+            violations.append((Convert.CLIENT_ID_FIELD + 1, 'bad-client-id',
+                               "'" + client_id + "' is not a WaterTrax client ID in the code tables"))
+        for field in (Convert.DATE_FIELD, 22, 24):
+            if field < field_count and fields[field] and not self.check_date(fields[field]):
+                violations.append((field + 1, 'bad-date', FIELD_NAMES[field] + " '" + fields[field] +
+                                   "' is not a date (mmddyyyy)"))
+        collection_time = fields[Convert.TIME_FIELD]
+        if collection_time and not COLLECTION_TIME.fullmatch(collection_time):
+            violations.append((Convert.TIME_FIELD + 1, 'bad-time', FIELD_NAMES[Convert.TIME_FIELD] + " '" +
+                               collection_time + "' is not a time (hh:mm, hh:mm:ss, hhmm, or hhmmss)"))
+        for field in (23, 25):
+            if field < field_count and fields[field] and not ANALYSIS_TIME.fullmatch(fields[field]):
+                violations.append((field + 1, 'bad-time', FIELD_NAMES[field] + " '" + fields[field] +
+                                   "' is not a time (hhmm or hhmmss)"))
+        if fields[14] and fields[14] not in ANALYSIS_TYPES:
+            violations.append((15, 'bad-code', "'" + fields[14] + "' is not an analysis type (" +
+                               ', '.join(sorted(ANALYSIS_TYPES)) + ')'))
+        analyte_code = fields[Convert.ANALYTE_CODE_FIELD]
+        if analyte_code and analyte_code not in self.analyte_codes:
+            violations.append((Convert.ANALYTE_CODE_FIELD + 1, 'bad-analyte-code',
+                               "'" + analyte_code + "' is not an analyte code in the code tables"))
+        value = fields[Convert.VALUE_FIELD]
+        if value and value not in VALUE_CODES and not VALUE.fullmatch(value):
+            violations.append((Convert.VALUE_FIELD + 1, 'bad-value',
+                               "'" + value + "' is not a number, or one of the value codes (ex. ND, DLT0.5)"))
+        unit_code = fields[Convert.UNIT_CODE_FIELD]
+        if unit_code and unit_code not in self.unit_codes:
+            violations.append((Convert.UNIT_CODE_FIELD + 1, 'bad-unit-code',
+                               "'" + unit_code + "' is not a unit code in the code tables"))
+        for field in (20, 26):
+            if field < field_count and fields[field] and not NUMBER.fullmatch(fields[field]):
+                violations.append((field + 1, 'bad-number', FIELD_NAMES[field] + " '" + fields[field] +
+                                   "' is not a number"))
+        if field_count > 21 and fields[21] and fields[21] not in FIELD_RESULTS:
+            violations.append((22, 'bad-code', "'" + fields[21] + "' is not a field result (Y, N)"))
+        return violations
+
+    def check_date(self, date_value):
+        """checks a date in the WTX format, mmddyyyy, is a real date. Each date is only worked out once.
+
+        Returns
+        -------
+        bool
+            True if it is a real date.
+        """
+
+        try:
+            return self.dates[date_value]
+        except KeyError:
+            pass
+        is_date = False
+        if DATE.fullmatch(date_value):
+            try:
+                datetime.date(int(date_value[4:8]), int(date_value[0:2]), int(date_value[2:4]))
+                is_date = True
+            except ValueError:
+                pass
+        self.dates[date_value] = is_date
+        return is_date
+
+
+def main(argv=None):
+    """command line entry point. Checks WTX reports (or every .txt file under directories), and prints every
+    violation, then how many of each were found.
+
+    Returns
+    -------
+    int
+        0 if every report is valid, 1 if any violations were found.
+    """
+
+    parser = argparse.ArgumentParser(description='Check WTX reports against the WTX 2.0 file specification.')
+    parser.add_argument('wtx_paths', nargs='+', help='WTX reports, or directories of them (ex. WTX_reports).')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='only print the files with violations, and the totals.')
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    validator = EasyTraxWTXValidator()
+    file_count = 0
+    invalid_files = 0
+    for wtx_path in args.wtx_paths:
+        wtx_reader = Reader.EasyTraxWTXReader(wtx_path)
+        wtx_reader.find_wtx_reports()
+        for wtx_report in wtx_reader.wtx_paths:
+            file_count += 1
+            violation_count = 0
+            for line_number, field_number, check, message in validator.validate_file(wtx_report):
+                violation_count += 1
+                if not args.quiet:
+                    print(wtx_report + ':' + str(line_number) + ': ' +
+                          ('field ' + str(field_number) + ': ' if field_number else '') + message + ' [' + check + ']')
+            if violation_count:
+                invalid_files += 1
+                if args.quiet:
+                    print(wtx_report + ': ' + str(violation_count) + ' violations')
+    print(str(file_count) + ' files, ' + str(validator.line_count) + ' lines checked, ' + str(invalid_files) +
+          ' files with violations, %.1f s.' % (time.perf_counter() - start))
+    for check, count in sorted(validator.violation_counts.items()):
+        print('    ' + check + ': ' + str(count))
+    if invalid_files:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,516 @@
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import EasyTraxBatch as Batch
+import EasyTraxCache as Cache
+import EasyTraxShare as Share
+
+
+REPORT_PATTERN = 'W*.txt'
+# inotify event flags (see 'man inotify')
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_INOTIFY_EVENT_HEADER = struct.Struct('iIII')
+
+
+class EasyTraxWatch:
+    """Watches Files_To_Report, and converts every report that is saved there, with nobody at the keyboard.
+
+    EasyTraxTK needs someone to type in each job number. This class is left running instead: whenever a W*.txt report
+    is added to (or changed in) report_directory, it is converted to WTX format a few seconds later, the same way
+    EasyTraxBatch converts it.
+
+    Reports are often still being written (or copied over the network) when they first show up, so a report is only
+    converted once its size and modified time haven't changed for settle_seconds. Up to workers reports are converted
+    at once, in a process pool; the rest wait their turn. If a report changes while it is being converted, it is
+    converted again once it settles.
+
+    A status record is kept for every job, as <job number>.json in status_directory: the job number, the report,
+    whether it is queued, converting, ok, or failed, the sample and line counts, timings, and the log. When the watcher
+    is started again, reports that were already converted (and haven't changed since) are skipped.
+
+    On Linux, inotify is used to hear about new reports straight away. Anywhere else (or if inotify can't be used, ex.
+    on a network share), the directory is checked every poll_seconds instead.
+
+    Can be run from the command line:
+
+        python EasyTraxWatch.py "T:\\ANALYST WORK FILES\\Peter\\EasyTrax\\Files_To_Report"
+
+    Attributes
+    ----------
+    report_directory : str
+        the directory to watch (usually Files_To_Report).
+
+    wtx_reports_directory : str
+        the directory WTX reports are written under. If None, EasyTraxConvert's default (WTX_reports) is used.
+
+    status_directory : str
+        the directory status records are written to.
+
+    workers : int
+        the most reports converted at once.
+
+    settle_seconds : float
+        how long a report has to stay the same before it is converted.
+
+    poll_seconds : float
+        how often the directory is checked when inotify isn't being used, and the longest the watcher waits between
+        checks on running jobs.
+
+    column_mode : str
+        how EasyTraxParse reads the data tables, 'split' or 'fixed-width'.
+
+    cache_directory : str
+        the directory parsed tables are cached in (see EasyTraxCache), or None.
+
+    watcher : InotifyWatcher or PollingWatcher
+        tells the watch which reports have changed.
+
+    pending : dict
+        report name : [(modified time, size), time it was last seen changing], for reports waiting to settle.
+
+    ready : list(str)
+        the names of settled reports, waiting for a worker.
+
+    running : dict
+        report name : [future, (modified time, size) when it was queued].
+
+    job_status : dict
+        report name : the latest status record of the job.
+
+    jobs_finished : list(str)
+        the names of the reports converted since the watch was started, in the order they finished.
+
+    Methods
+    -------
+    * `easy_trax_watch_controller(stop_when_idle=False)` -
+        watches the directory and converts reports until stopped (or until there is nothing left to do).
+
+    * `load_status_records()` -
+        reads the status records left by an earlier run, so unchanged reports aren't converted again.
+
+    * `note_change(name)` -
+        adds a new or changed report to pending.
+
+    * `check_pending()` -
+        moves reports that have settled from pending to ready.
+
+    * `submit_ready(executor)` -
+        starts converting ready reports, while there are free workers.
+
+    * `collect_finished()` -
+        records the results of finished conversions.
+
+    * `write_status(name, status_record)` -
+        writes the status record of a job.
+
+    * `stop()` -
+        stops the watch after the jobs already running have finished.
+    """
+
+    def __init__(self, report_directory, wtx_reports_directory=None, status_directory=None, workers=2,
+                 settle_seconds=2.0, poll_seconds=1.0, column_mode='split', cache_directory=None, use_inotify=True):
+        """
+        Parameters
+        ----------
+        report_directory : str
+            the directory to watch.
+        wtx_reports_directory : str
+            the directory WTX reports are written under.
+        status_directory : str
+            the directory to write status records to. If None, EasyTrax_status in report_directory.
+        workers : int
+            the most reports to convert at once.
+        settle_seconds : float
+            how long a report has to stay the same before it is converted.
+        poll_seconds : float
+            how often to check the directory when inotify isn't used.
+        column_mode : str
+            'split' or 'fixed-width', see EasyTraxParse.
+        cache_directory : str
+            the directory to cache parsed tables in, or None.
+        use_inotify : bool
+            if False, the directory is always polled.
+        """
+
+        self.report_directory = report_directory
+        self.wtx_reports_directory = wtx_reports_directory
+        if status_directory is None:
+            status_directory = os.path.join(report_directory, 'EasyTrax_status')
+        self.status_directory = status_directory
+        self.workers = max(workers, 1)
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.column_mode = column_mode
+        self.cache_directory = cache_directory
+        self.watcher = None
+        if use_inotify:
+            try:
+                self.watcher = InotifyWatcher(report_directory)
+            except OSError:
+                self.watcher = None
+        if self.watcher is None:
+            self.watcher = PollingWatcher(report_directory)
+        self.pending = {}
+        self.ready = []
+        self.running = {}
+        self.job_status = {}
+        self.jobs_finished = []
+        self.stopped = False
+
+    def easy_trax_watch_controller(self, stop_when_idle=False):
+        """watches report_directory and converts reports, until stop() is called (or Ctrl+C is pressed).
+
+        Every report already in the directory is looked at first, so reports dropped in while the watcher wasn't
+        running are converted too (unless their status record says they already have been).
+
+        Parameters
+        ----------
+        stop_when_idle : bool
+            if True, returns as soon as nothing is pending, ready, or running (ex. to convert whatever is in the
+            directory once).
+        """
+
+        self.load_status_records()
+        for name in self.watcher.scan():
+            self.note_change(name)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=ignore_interrupts) as executor:
+                while not self.stopped:
+                    self.check_pending()
+                    self.submit_ready(executor)
+                    self.collect_finished()
+                    if stop_when_idle and not (self.pending or self.ready or self.running):
+                        break
+                    for name in self.watcher.wait_for_changes(self.get_wait_seconds()):
+                        self.note_change(name)
+                for name, (future, signature) in list(self.running.items()):
+                    future.result()
+                self.collect_finished()
+        finally:
+            self.watcher.close()
+
+    def get_wait_seconds(self):
+        """returns how long to wait for changes before the pending and running jobs need looking at again."""
+
+        wait_seconds = self.poll_seconds
+        now = time.monotonic()
+        for signature, last_changed in self.pending.values():
+            wait_seconds = min(wait_seconds, max(last_changed + self.settle_seconds - now, 0.05))
+        if self.running:
+            wait_seconds = min(wait_seconds, 0.25)
+        return wait_seconds
+
+    def load_status_records(self):
+        """reads the status records of jobs converted by an earlier run into job_status."""
+
+        try:
+            entries = [entry for entry in os.scandir(self.status_directory) if entry.name.endswith('.json')]
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                with open(entry.path, 'r') as status_file:
+                    status_record = json.load(status_file)
+                self.job_status[os.path.basename(status_record['report path'])] = status_record
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+
+    def note_change(self, name):
+        """adds a new or changed report to pending, unless its status record says it has already been converted.
+
+        Parameters
+        ----------
+        name : str
+            the file name of the report (ex. 'W161000.txt').
+        """
+
+        if not fnmatch.fnmatch(name, REPORT_PATTERN):
+            return
+        signature = get_file_signature(os.path.join(self.report_directory, name))
+        if signature is None:
+            # deleted (or renamed away) before we got to it
+            self.pending.pop(name, None)
+            return
+        status_record = self.job_status.get(name)
+        if status_record is not None and status_record.get('status') in ('ok', 'failed') and \
+                tuple(status_record.get('signature') or ()) == signature and name not in self.running:
+            return
+        if name in self.pending and self.pending[name][0] == signature:
+            return
+        self.pending[name] = [signature, time.monotonic()]
+
+    def check_pending(self):
+        """moves reports whose size and modified time haven't changed for settle_seconds from pending to ready."""
+
+        now = time.monotonic()
+        for name, (signature, last_changed) in list(self.pending.items()):
+            current_signature = get_file_signature(os.path.join(self.report_directory, name))
+            if current_signature is None:
+                del self.pending[name]
+            elif current_signature != signature:
+                self.pending[name] = [current_signature, now]
+            elif now - last_changed >= self.settle_seconds and name not in self.running:
+                del self.pending[name]
+                if name not in self.ready:
+                    self.ready.append(name)
+                    self.write_status(name, {'status': 'queued', 'signature': list(signature)})
+
+    def submit_ready(self, executor):
+        """starts converting ready reports (oldest first), while fewer than workers reports are being converted."""
+
+        while self.ready and len(self.running) < self.workers:
+            name = self.ready.pop(0)
+            report_path = os.path.join(self.report_directory, name)
+            signature = get_file_signature(report_path)
+            if signature is None:
+                continue
+            future = executor.submit(Batch.convert_report_file, report_path, self.wtx_reports_directory,
+                                     self.column_mode, self.cache_directory)
+            self.running[name] = [future, signature]
+            self.write_status(name, {'status': 'converting', 'signature': list(signature)})
+
+    def collect_finished(self):
+        """writes the status record of every finished conversion. Reports that changed while they were being converted
+        are added back to pending."""
+
+        for name, (future, signature) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[name]
+            try:
+                job_result = future.result()
+            except Exception as exc:
+                # the worker process itself died (convert_report_file catches everything else)
+                job_result = {'status': 'failed', 'error': type(exc).__name__ + ': ' + str(exc)}
+            status_record = {'signature': list(signature)}
+            for key, value in job_result.items():
+                if key in ('parse log', 'convert log'):
+                    status_record[key] = str(value)
+                    status_record[key.replace('log', 'messages')] = value.as_dicts()
+                else:
+                    status_record[key] = value
+            self.write_status(name, status_record)
+            self.jobs_finished.append(name)
+            if get_file_signature(os.path.join(self.report_directory, name)) != signature:
+                self.note_change(name)
+
+    def write_status(self, name, status_record):
+        """writes the status record of a job to <job number>.json in status_directory, via a temporary file so a
+        half written record is never seen. If it can't be written, the record is still kept in job_status.
+
+        Parameters
+        ----------
+        name : str
+            the file name of the report.
+        status_record : dict
+            the fields to record. The report path, job number, and time are added.
+        """
+
+        status_record['report path'] = os.path.join(self.report_directory, name)
+        status_record.setdefault('job number', os.path.splitext(name)[0])
+        status_record['updated'] = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.job_status[name] = status_record
+        filename = os.path.join(self.status_directory, os.path.splitext(name)[0] + '.json')
+        try:
+            os.makedirs(self.status_directory, exist_ok=True)
+            with Share.replacing_file(filename, 'w') as status_file:
+                json.dump(status_record, status_file, indent=1)
+        except OSError:
+            pass
+
+    def stop(self):
+        """stops the watch. Jobs that are already running are finished first."""
+
+        self.stopped = True
+
+
+class PollingWatcher:
+    """Finds changed reports by looking at the directory every so often. Works anywhere, including network shares.
+
+    Methods
+    -------
+    * `scan()` -
+        returns the names of every report in the directory.
+
+    * `wait_for_changes(timeout)` -
+        waits timeout seconds, then returns the names of reports that are new or have changed.
+
+    * `close()` -
+        does nothing, there is nothing to close.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.signatures = {}
+
+    def get_signatures(self):
+        """returns report name : (modified time, size) for every report in the directory."""
+
+        signatures = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return signatures
+        for entry in entries:
+            if fnmatch.fnmatch(entry.name, REPORT_PATTERN):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                signatures[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def scan(self):
+        self.signatures = self.get_signatures()
+        return list(self.signatures)
+
+    def wait_for_changes(self, timeout):
+        time.sleep(timeout)
+        signatures = self.get_signatures()
+        changed = [name for name, signature in signatures.items() if self.signatures.get(name) != signature]
+        self.signatures = signatures
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Finds changed reports with Linux's inotify, so a new report is seen as soon as it is written.
+
+    inotify is reached through ctypes, so nothing needs to be installed. Raises OSError if inotify isn't available
+    (not Linux, or too many watches), in which case EasyTraxWatch polls instead.
+
+    Methods are the same as PollingWatcher.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.file_descriptor = -1
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.file_descriptor = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.file_descriptor < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.file_descriptor, os.fsencode(directory), mask) < 0:
+            error_number = ctypes.get_errno()
+            self.close()
+            raise OSError(error_number, 'inotify_add_watch failed on ' + directory)
+
+    def scan(self):
+        try:
+            return [name for name in os.listdir(self.directory) if fnmatch.fnmatch(name, REPORT_PATTERN)]
+        except OSError:
+            return []
+
+    def wait_for_changes(self, timeout):
+        readable = select.select([self.file_descriptor], [], [], timeout)[0]
+        if not readable:
+            return []
+        try:
+            events = os.read(self.file_descriptor, 64 * 1024)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset + _INOTIFY_EVENT_HEADER.size <= len(events):
+            watch_descriptor, mask, cookie, name_length = _INOTIFY_EVENT_HEADER.unpack_from(events, offset)
+            offset += _INOTIFY_EVENT_HEADER.size
+            name = os.fsdecode(events[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+            if mask & IN_Q_OVERFLOW:
+                # too many events to keep up with, look at everything
+                return self.scan()
+            if name and name not in changed:
+                changed.append(name)
+        return changed
+
+    def close(self):
+        if self.file_descriptor >= 0:
+            os.close(self.file_descriptor)
+            self.file_descriptor = -1
+
+
+def ignore_interrupts():
+    """run in each worker process, so Ctrl+C only stops the watch (which lets running jobs finish), not the jobs."""
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def get_file_signature(path):
+    """returns (modified time, size) of a file, or None if it doesn't exist."""
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def main(argv=None):
+    """command line entry point. Watches a directory until Ctrl+C is pressed (or the process is told to stop).
+
+    Returns
+    -------
+    int
+        0
+    """
+
+    parser = argparse.ArgumentParser(description='Convert W*.txt reports to WTX format as they are saved to a '
+                                                 'directory.')
+    parser.add_argument('report_directory', help='directory to watch (usually Files_To_Report).')
+    parser.add_argument('-o', '--output', default=None,
+                        help='directory to write WTX reports under (defaults to WTX_reports on the T: drive).')
+    parser.add_argument('-s', '--status', default=None,
+                        help='directory to write job status records to (defaults to EasyTrax_status in the watched '
+                             'directory).')
+    parser.add_argument('-j', '--workers', type=int, default=2, help='most reports to convert at once.')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='seconds a report has to stay unchanged before it is converted.')
+    parser.add_argument('--poll', type=float, default=1.0, help='seconds between checks when polling.')
+    parser.add_argument('--polling', action='store_true', help="always poll the directory, don't use inotify.")
+    parser.add_argument('--fixed-width', action='store_true',
+                        help='read data tables by column position rather than by splitting on spaces.')
+    parser.add_argument('--cache', nargs='?', const=Cache.DEFAULT_CACHE_DIRECTORY, default=None,
+                        help='cache parsed tables between runs (optionally in the given directory).')
+    parser.add_argument('--once', action='store_true',
+                        help='convert the reports in the directory, then stop rather than keep watching.')
+    args = parser.parse_args(argv)
+    watch = EasyTraxWatch(args.report_directory, args.output, args.status, args.workers, args.settle, args.poll,
+                          'fixed-width' if args.fixed_width else 'split', args.cache, not args.polling)
+    if hasattr(signal, 'SIGTERM'):
+        signal.signal(signal.SIGTERM, lambda signal_number, frame: watch.stop())
+    print('Watching ' + args.report_directory + ' (' + type(watch.watcher).__name__ + '), Ctrl+C to stop.')
+    try:
+        watch.easy_trax_watch_controller(stop_when_idle=args.once)
+    except KeyboardInterrupt:
+        pass
+    for name in watch.jobs_finished:
+        status_record = watch.job_status[name]
+        print(status_record['job number'] + ': ' + status_record['status'] +
+              (' - ' + status_record['error'] if status_record.get('error') else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,4 @@
-"""**EasyTrax**
+r"""**EasyTrax**
 
 EasyTrax is a python module that converts human-readable analytical reports
 into a delimited ASCII flat file. This file format (.WTX) is used to upload
@@ -23,6 +23,12 @@ opened using notepad.
   "Create WTX File". The .WTX file format will be created
   and saved in WTX_reports.
 
+- more than one job can be done at once: type or paste several job numbers into
+  the box, separated by spaces, commas, or new lines. Each job gets a status row
+  (queued, converting, done or failed) under the button, and the jobs are
+  converted one after another in the background, so the window can be used
+  while they run.
+
 - log in to lab.watertrax.com and sign in using the lab credentials
 
 - under "Service Functions", select "Lab Reports". Then select "Upload Report".
@@ -30,6 +36,213 @@ opened using notepad.
 
 - File will be submitted at this point. Open up the file to review, if desired.
 
+**Converting Many Reports at Once**
+
+- run **EasyTraxBatch.py** with the directory holding the reports, for example
+  `python EasyTraxBatch.py "T:\ANALYST WORK FILES\Peter\EasyTrax\Files_To_Report"`
+
+- every W*.txt file in the directory is converted in parallel, and a summary table
+  of each job (samples, WTX lines written, timings) is printed when done. The WTX
+  files are the same as the ones made with EasyTraxTK.
+
+- a WTX report that is already the same as the new one isn't written again, so its
+  modified time shows when it last really changed. Reports are written to a
+  temporary file first, then renamed, so a crash never leaves half a report. A job
+  whose WTX report can't be written is marked failed, with the reason.
+
+- `-o <directory>` writes the WTX reports somewhere other than WTX_reports, `-j <n>`
+  sets the amount of worker processes, and `-v` prints the log of each job.
+
+- `--fixed-width` reads the data tables by column position instead of splitting
+  lines on spaces. Tables that don't line up are read the normal way. To compare the
+  speed of both ways on some reports, run
+  `python EasyTraxBenchmark.py columns <report> <report> ...`
+
+- `--cache` keeps the parsed tables of each report, so running the batch again only
+  parses reports (and tables) that have changed. EasyTraxTK always does this.
+
+- `--metrics <directory>` records how long each stage of each job took (finding the
+  tables, parsing them, merging, writing the WTX file) and how much it did, and saves
+  it as `<job>.metrics.json`. Add `--slow <seconds>` to only save slow jobs, and
+  `--profile` to also save a `<job>.prof` file that can be opened with pstats.
+
+- to check how fast EasyTrax is on big reports, run
+  `python EasyTraxBenchmark.py scaling -n 10 100 1000 -o results.json`. It makes
+  reports of each size with EasyTraxSynthetic.py, and prints the time and peak memory
+  of reading, parsing and converting them. Add `--compare results.json` to a later
+  run to see if a change made it faster or slower.
+
+**Converting a Multi-Job Export**
+
+- when the LIMS prints many final reports into one text file, run
+  `python EasyTraxSplit.py <file>`. It finds the header line of each report, and
+  converts every job in it (in parallel) to its own WTX file, the same as if each
+  report had been saved on its own. Takes the same `-o`, `-j`, `--fixed-width`,
+  `--cache` and `-v` options as EasyTraxBatch.py.
+
+- if a job was printed more than once in the file, only the last copy is converted.
+
+- a report whose job number on the header line can't be read (ex. W170009A) is
+  listed as failed, with the reason, instead of being converted.
+
+**Bundling WTX Reports for Upload**
+
+- `python EasyTraxBundle.py <WTX_reports directory> -o <upload directory>` merges the
+  WTX reports of every job into a few upload files per WaterTrax client, named
+  `<client ID>_001.txt`, `<client ID>_002.txt`, etc. Jobs are kept whole in one file
+  where they fit.
+
+- each file holds at most 20000 lines and 2 MB. Change this with `--max-lines` and
+  `--max-bytes`. `manifest.json` in the upload directory lists which jobs went into
+  which file. Jobs whose client has no WaterTrax ID are left out, and listed there too.
+
+- EasyTraxBatch.py and EasyTraxSplit.py do the same for the jobs they convert with
+  `--bundle <upload directory>` (and `--bundle-lines`, `--bundle-bytes`).
+
+**Re-Uploading Corrected Reports**
+
+- when a report that was already uploaded is corrected and issued again, run
+  EasyTraxBatch.py (or EasyTraxSplit.py) with `--replacement`. The new report is
+  compared to the WTX report made last time, result by result (sample and analyte).
+  If any results are new or have changed, the report is also written to
+  `<job>_R.txt` next to it, marked as a replacement ("R") instead of an original
+  ("O"). Upload that file. If nothing has changed, there is nothing to upload.
+
+- WaterTrax swaps everything it has for the report with the replacement, and won't
+  take one with fewer results than before, so the replacement holds the whole
+  report. If results were taken out of the report, no replacement is made, the job
+  fails, and the last WTX report is kept: delete the report in WaterTrax, convert
+  the job again without `--replacement`, and upload the new WTX report as an
+  original.
+
+- if there is no earlier WTX report, the whole report is uploaded as usual. With
+  `--bundle`, only the reports that need uploading are bundled, and EasyTraxBundle.py
+  leaves replacement reports out.
+
+**Converting Reports Automatically**
+
+- run **EasyTraxWatch.py** with the Files_To_Report directory, and leave it running:
+  `python EasyTraxWatch.py "T:\ANALYST WORK FILES\Peter\EasyTrax\Files_To_Report"`
+
+- every W*.txt report saved to the directory is converted a couple of seconds after
+  it has finished saving. Nobody has to type in a job number.
+
+- the outcome of each job (ok or failed, with the log) is written to
+  EasyTrax_status\<job number>.json in the watched directory. Reports that were
+  already converted aren't converted again when the watcher is restarted.
+
+- `-o`, `-j`, `--fixed-width`, and `--cache` work the same as for EasyTraxBatch.py.
+  `--settle <seconds>` changes how long a report has to be left alone before it is
+  converted, and `--once` converts whatever is in the directory and then stops.
+
+**Working Over the Network Share**
+
+- Files_To_Report and WTX_reports are on the T: drive. To use other directories (for
+  example two local folders, for testing), set the `EASYTRAX_INPUT_ROOT` and
+  `EASYTRAX_OUTPUT_ROOT` environment variables. EasyTraxBatch.py then also uses
+  `EASYTRAX_INPUT_ROOT` when no directory is given.
+
+- EasyTraxTK copies the reports in Files_To_Report to the local disk when it starts
+  (only the ones that have changed since last time), and reads them from there. A
+  report is copied again if its size or modified time on the share changes. If the
+  share can't be reached, the last copy is used.
+
+- EasyTraxTK writes WTX reports to the local disk first, and copies them to
+  WTX_reports in the background, trying again a few times if the share can't be
+  reached. The job's status says "done" once the report is on the share. Reports that
+  still couldn't be copied are copied the next time EasyTraxTK is opened. Once one
+  report has been given up on, the rest are only tried once each until the share is
+  back, so an outage doesn't hold every report up in turn.
+
+- EasyTraxBatch.py does the same with `--input-cache` and `--spool` (each can be given
+  a local directory to use). `--retries <n>` sets how many times a copy is tried again.
+  Once the jobs are done, the batch waits at most two minutes for the copies to finish,
+  and the reports left over stay in the spool for next time.
+
+**Converting for Other Programs**
+
+- `python EasyTraxServer.py` starts a small conversion server on this computer
+  (http://127.0.0.1:8765, change it with `--port`). It loads the code tables and starts
+  its worker processes once, so each conversion after that takes milliseconds.
+
+- `GET /job/<job number>` converts that report from Files_To_Report (or `-r <directory>`),
+  and `POST /convert` converts the report text sent with the request. Both answer with
+  JSON: the status, counts, logs, and the WTX report itself in "wtx". `GET /health`
+  checks that it is running.
+
+- from python, use `EasyTraxServer.request_conversion(job_number='161000')` or
+  `request_conversion(report_text=...)`.
+
+- if the same job is asked for again while it is still being converted, the second
+  request waits for the first conversion rather than starting another.
+
+**Looking Up Old Results**
+
+- add `--store` to EasyTraxBatch.py or EasyTraxSplit.py to also keep the parsed results
+  of each job in a SQLite database (EasyTraxResults.sqlite3, or the file given). A job
+  converted again replaces what was stored for it.
+
+- reports converted before then can be added with
+  `python EasyTraxStore.py ingest <reports or directories>`.
+
+- `python EasyTraxStore.py query Lead --client Cranbrook --location A001B --years 2`
+  prints every lead result at that location over the last two years, oldest first,
+  without opening any reports. The analyte can be the MB Labs name (Pb), its
+  description in EasyTraxCodes.json (Lead, or Lead (Total)), or the WaterTrax code,
+  and the client its ID, identifier, or name. `--from`/`--to` take dates as
+  yyyy-mm-dd, and `--csv` prints comma separated values for a spreadsheet.
+
+**Reading WTX Reports Back**
+
+- `python EasyTraxReader.py <WTX report or directory>` reads WTX reports (a single
+  report, WTX_reports, or a directory of upload files) and prints how many jobs,
+  samples, and lines are in them. `--job W161000` prints the samples and results of
+  a job, with the analyte names and units from EasyTraxCodes.json, and
+  `--sample 1` (plus `--analyte <code>`) prints the WTX lines of one sample (or
+  result), without reading the rest of the files.
+
+- from python, `EasyTraxReader.EasyTraxWTXReader(path).open().read_job('W161000')`
+  gives back the samples and job the same way EasyTraxParse makes them, so a WTX
+  report can be compared with, or converted again like, a new one.
+
+**Checking WTX Reports Before Uploading**
+
+- `python EasyTraxValidate.py <WTX reports or directories>` checks every line of the
+  reports the way WaterTrax does when they are uploaded (see
+  WTX_Report_Format_Doc.pdf): the amount of fields, the mandatory fields, the client,
+  analyte and unit codes (against EasyTraxCodes.json), values, dates and times, and
+  that the lines of each report and sample are together and agree with each other.
+
+- every problem is printed with its file, line, and field number, followed by how
+  many of each kind were found. `-q` only prints the files with problems. It reads
+  one line at a time, so a whole month of WTX_reports, or the upload files made by
+  EasyTraxBundle.py, can be checked in a few seconds.
+
+**Converting the Archive**
+
+- `python EasyTraxBackfill.py <archive directory> --store` converts every W*.txt report
+  in the archive (and every directory under it) in parallel, to fill the results
+  database or make the WTX reports again after the codes have changed.
+
+- each report is written to a journal (EasyTrax_backfill.jsonl, or `--journal <file>`)
+  as soon as it is done. If the backfill is stopped, run the same command again: it
+  skips every report already done, and carries on with the rest. Reports that have
+  changed since, and every report once EasyTraxCodes.json, `-o`, `--store` or
+  `--fixed-width` changes, are done again.
+
+- reports that failed are not tried again unless `--retry-failed` is given. `-o`, `-j`,
+  `--fixed-width`, and `--cache` work the same as for EasyTraxBatch.py.
+
+**Analyte, Unit, and Client Codes**
+
+- the WaterTrax codes (analytes, units, clients, lab ID) are kept in
+  **EasyTraxCodes.json**. To add a new analyte, unit, or client, add it to this file
+  and update the "revision" line. No python needs to be edited.
+
+- the file is read once and shared by every conversion. Programs that are left
+  running (like EasyTraxTK) notice when the file has been saved and pick up the new
+  codes within a couple of seconds.
+
 **Data Formats**
 
 as of June 9th, 2021
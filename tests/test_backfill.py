@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import EasyTraxBackfill as Backfill
+import EasyTraxSynthetic as Synthetic
+
+
+class EasyTraxBackfillTest(unittest.TestCase):
+    """resuming and retrying a backfill, with a few synthetic reports."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.archive_directory = os.path.join(self.directory, 'archive')
+        os.makedirs(os.path.join(self.archive_directory, '2021'))
+        for job_number in ('W170001', 'W170002', 'W170003'):
+            report = Synthetic.EasyTraxSyntheticReport(samples=3, job_number=job_number)
+            Synthetic.write_report(os.path.join(self.archive_directory, '2021', job_number + '.txt'),
+                                   report.generate())
+        self.journal_path = os.path.join(self.directory, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_backfill(self, output_directory, retry_failed=False, results_database=None):
+        backfill = Backfill.EasyTraxBackfill(self.archive_directory, self.journal_path, output_directory, workers=1,
+                                             results_database=results_database, retry_failed=retry_failed)
+        backfill.easy_trax_backfill_controller()
+        return backfill
+
+    def test_resume_skips_done_reports(self):
+        output_directory = os.path.join(self.directory, 'out')
+        self.assertEqual(self.run_backfill(output_directory).counts['converted'], 3)
+        backfill = self.run_backfill(output_directory)
+        self.assertEqual(backfill.counts['skipped'], 3)
+        self.assertEqual(backfill.counts['converted'], 0)
+
+    def test_changed_output_directory_converts_again(self):
+        self.run_backfill(os.path.join(self.directory, 'out'))
+        output_directory = os.path.join(self.directory, 'out2')
+        backfill = self.run_backfill(output_directory)
+        self.assertEqual(backfill.counts['converted'], 3)
+        self.assertTrue(os.path.isfile(os.path.join(output_directory, 'W170001', 'W170001.txt')))
+
+    def test_store_after_plain_run_converts_again(self):
+        output_directory = os.path.join(self.directory, 'out')
+        self.run_backfill(output_directory)
+        results_database = os.path.join(self.directory, 'results.sqlite3')
+        backfill = self.run_backfill(output_directory, results_database=results_database)
+        self.assertEqual(backfill.counts['converted'], 3)
+        connection = sqlite3.connect(results_database)
+        job_numbers = connection.execute('SELECT DISTINCT job_number FROM results ORDER BY job_number').fetchall()
+        connection.close()
+        self.assertEqual(job_numbers, [('W170001',), ('W170002',), ('W170003',)])
+        self.assertEqual(self.run_backfill(output_directory, results_database=results_database).counts['skipped'], 3)
+
+    def test_retry_failed_converts_failed_reports(self):
+        # a file in the way of the output directory makes every report fail
+        blocked_directory = os.path.join(self.directory, 'blocked')
+        with open(blocked_directory, 'w'):
+            pass
+        backfill = self.run_backfill(os.path.join(blocked_directory, 'out'))
+        self.assertEqual(backfill.counts['failed'], 3)
+        output_directory = os.path.join(blocked_directory, 'out')
+        # without --retry-failed the failed reports are left alone
+        self.assertEqual(self.run_backfill(output_directory).counts['skipped'], 3)
+        os.remove(blocked_directory)
+        backfill = self.run_backfill(output_directory, retry_failed=True)
+        self.assertEqual(backfill.counts['converted'], 3)
+        self.assertEqual(backfill.counts['unchanged'], 0)
+        self.assertTrue(os.path.isfile(os.path.join(output_directory, 'W170002', 'W170002.txt')))
+        with open(self.journal_path, encoding='utf-8') as journal_file:
+            journal_records = [json.loads(line) for line in journal_file]
+        self.assertEqual({journal_record['status'] for journal_record in journal_records[-3:]}, {'ok'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import EasyTraxBatch as Batch
+import EasyTraxSynthetic as Synthetic
+
+
+class EasyTraxBatchTest(unittest.TestCase):
+    """the status of converted jobs."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_converted_job_is_ok(self):
+        mb_file_contents = Synthetic.EasyTraxSyntheticReport(samples=3, job_number='W170001').generate()
+        job_result = Batch.convert_report_lines(mb_file_contents, '170001', 'W170001.txt', self.directory)
+        self.assertEqual(job_result['status'], 'ok')
+        self.assertGreater(job_result['lines'], 0)
+
+    def test_job_without_wtx_lines_fails(self):
+        mb_file_contents = Synthetic.EasyTraxSyntheticReport(samples=3, job_number='W170001').generate()
+        job_result = Batch.convert_report_lines(mb_file_contents[:2], '170001', 'W170001.txt', self.directory)
+        self.assertEqual(job_result['status'], 'failed')
+        self.assertEqual(job_result['lines'], 0)
+        self.assertIn('no WTX lines', job_result['error'])
+        self.assertIn('1 jobs, 0 converted, 1 failed, 0 WTX reports already up to date',
+                      Batch.format_summary_table([job_result]))
+
+    def test_failed_job_is_not_stored_or_up_to_date(self):
+        mb_file_contents = Synthetic.EasyTraxSyntheticReport(samples=3, job_number='W170001').generate()
+        results_database = os.path.join(self.directory, 'results.sqlite3')
+        job_results = [Batch.convert_report_lines(mb_file_contents[:2], '170001', 'W170001.txt', self.directory,
+                                                  results_database=results_database) for attempt in range(2)]
+        self.assertEqual(job_results[1]['status'], 'failed')
+        self.assertEqual(job_results[1]['results stored'], 0)
+        self.assertFalse(os.path.exists(results_database))
+        self.assertIn('0 WTX reports already up to date', Batch.format_summary_table(job_results[1:]))
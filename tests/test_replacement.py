@@ -0,0 +1,75 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import EasyTraxBatch as Batch
+import EasyTraxConvert as Convert
+import EasyTraxSynthetic as Synthetic
+
+
+class EasyTraxReplacementTest(unittest.TestCase):
+    """replacement reports for a job converted again, with a synthetic report."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.mb_file_contents = Synthetic.EasyTraxSyntheticReport(samples=3, job_number='W170001').generate()
+        self.wtx_path = os.path.join(self.directory, 'W170001', 'W170001.txt')
+        self.replacement_path = os.path.join(self.directory, 'W170001', 'W170001_R.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def convert(self, mb_file_contents):
+        return Batch.convert_report_lines(mb_file_contents, '170001', 'W170001.txt', self.directory,
+                                          replacement=True)
+
+    def read_wtx_lines(self, wtx_path):
+        with open(wtx_path, 'r', encoding=Convert.WTX_ENCODING) as wtx_file:
+            return wtx_file.read().splitlines()
+
+    def test_first_run_uploads_the_wtx_report(self):
+        job_result = self.convert(self.mb_file_contents)
+        self.assertEqual(job_result['status'], 'ok')
+        self.assertEqual(job_result['upload path'], self.wtx_path)
+        self.assertFalse(os.path.exists(self.replacement_path))
+        self.assertIn('nothing to replace', str(job_result['convert log']))
+
+    def test_changed_value_writes_whole_replacement_report(self):
+        self.convert(self.mb_file_contents)
+        original_lines = self.read_wtx_lines(self.wtx_path)
+        changed_contents = [line.replace('22.08', '22.09') for line in self.mb_file_contents]
+        job_result = self.convert(changed_contents)
+        self.assertEqual(job_result['status'], 'ok')
+        self.assertEqual(job_result['lines changed'], 1)
+        self.assertEqual(job_result['upload path'], self.replacement_path)
+        replacement_lines = [line.split('|') for line in self.read_wtx_lines(self.replacement_path)]
+        self.assertEqual(len(replacement_lines), len(original_lines))
+        self.assertEqual(set(fields[Convert.PURPOSE_FIELD] for fields in replacement_lines), {'R'})
+        self.assertEqual(['|'.join(fields[Convert.PURPOSE_FIELD + 1:]) for fields in replacement_lines],
+                         ['|'.join(line.split('|')[Convert.PURPOSE_FIELD + 1:])
+                          for line in self.read_wtx_lines(self.wtx_path)])
+
+    def test_unchanged_rerun_uploads_nothing(self):
+        self.convert(self.mb_file_contents)
+        job_result = self.convert(self.mb_file_contents)
+        self.assertEqual(job_result['status'], 'ok')
+        self.assertTrue(job_result['wtx unchanged'])
+        self.assertEqual(job_result['upload path'], '')
+        self.assertEqual(job_result['lines changed'], 0)
+        self.assertFalse(os.path.exists(self.replacement_path))
+
+    def test_removed_results_fail_and_keep_the_last_report(self):
+        self.convert(self.mb_file_contents)
+        original_lines = self.read_wtx_lines(self.wtx_path)
+        removed_contents = [line for line in self.mb_file_contents if not line.startswith('Hardness')]
+        for attempt in range(2):
+            job_result = self.convert(removed_contents)
+            self.assertEqual(job_result['status'], 'failed')
+            self.assertIn('not in this one', job_result['error'])
+            self.assertEqual(job_result['upload path'], '')
+            self.assertFalse(os.path.exists(self.replacement_path))
+            self.assertEqual(self.read_wtx_lines(self.wtx_path), original_lines)
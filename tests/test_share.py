@@ -0,0 +1,59 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import EasyTraxShare as Share
+
+
+class EasyTraxSpoolerTest(unittest.TestCase):
+    """copying spooled WTX reports to a share that can't be reached."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.spool_directory = os.path.join(self.directory, 'spool')
+        self.spool_paths = []
+        for job_number in ('W170001', 'W170002', 'W170003'):
+            os.makedirs(os.path.join(self.spool_directory, job_number))
+            spool_path = os.path.join(self.spool_directory, job_number, job_number + '.txt')
+            with open(spool_path, 'w') as spool_file:
+                spool_file.write('WTX_2.0|O|F|3393||11273|A001B|' + job_number + '\n')
+            self.spool_paths.append(spool_path)
+        self.spooler = Share.EasyTraxSpooler(os.path.join(self.directory, 'share'), self.spool_directory, retries=3,
+                                             retry_seconds=0.0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_share_outage_is_retried_once_then_fails_fast(self):
+        # an unmapped share gives FileNotFoundError on Windows
+        with mock.patch.object(Share, 'copy_file', side_effect=FileNotFoundError(3, 'path not found')) as copy_file:
+            errors = [self.spooler.sync_report(spool_path) for spool_path in self.spool_paths]
+        self.assertTrue(all(error.startswith('FileNotFoundError') for error in errors))
+        # the first report goes through every retry, the rest are only tried once
+        self.assertEqual(copy_file.call_count, 4 + 1 + 1)
+        self.assertTrue(self.spooler.share_error)
+        self.assertTrue(all(os.path.isfile(spool_path) for spool_path in self.spool_paths))
+
+    def test_share_back_copies_and_clears_outage(self):
+        with mock.patch.object(Share, 'copy_file', side_effect=OSError('share down')):
+            self.spooler.sync_report(self.spool_paths[0])
+        self.assertEqual(self.spooler.sync_report(self.spool_paths[1]), '')
+        self.assertEqual(self.spooler.share_error, '')
+        self.assertTrue(os.path.isfile(self.spooler.get_share_path(self.spool_paths[1])))
+
+    def test_report_missing_from_spool_is_not_retried(self):
+        os.remove(self.spool_paths[0])
+        with mock.patch.object(Share, 'copy_file') as copy_file:
+            error = self.spooler.sync_report(self.spool_paths[0])
+        self.assertTrue(error.startswith('FileNotFoundError'))
+        self.assertEqual(copy_file.call_count, 0)
+        self.assertEqual(self.spooler.share_error, '')
+
+    def test_flush_gives_up_after_timeout(self):
+        self.spooler.submit(self.spool_paths[0])
+        self.assertFalse(self.spooler.flush(0.1))
@@ -0,0 +1,46 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import EasyTraxSplit as Split
+import EasyTraxSynthetic as Synthetic
+
+
+class EasyTraxSplitTest(unittest.TestCase):
+    """finding the jobs in a multi-job export, with a few synthetic reports."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.export_path = os.path.join(self.directory, 'Export.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_split(self, job_numbers):
+        export_lines = []
+        for job_number in job_numbers:
+            export_lines.extend(Synthetic.EasyTraxSyntheticReport(samples=3, job_number=job_number).generate())
+        Synthetic.write_report(self.export_path, export_lines)
+        split = Split.EasyTraxSplit(self.export_path, os.path.join(self.directory, 'out'), workers=1)
+        summary_table = split.easy_trax_split_controller()
+        return split, summary_table
+
+    def test_header_line_shape(self):
+        self.assertEqual(Split.get_header_job_number('Cranbrook, City       Final Report     W161001\n'), 'W161001')
+        self.assertEqual(Split.get_header_job_number('\fCranbrook, City   Final Report   W161001 pg 2\n'), 'W161001')
+        self.assertEqual(Split.get_header_job_number('Cranbrook, City       Final Report     W170009A\n'), 'W170009A')
+        self.assertEqual(Split.get_header_job_number('Cranbrook, City       Final Report\n'), '')
+        self.assertIsNone(Split.get_header_job_number('1) Aluminum Al     <0.01    0.703    0.375   mg/L\n'))
+
+    def test_unreadable_job_number_is_a_failed_job(self):
+        split, summary_table = self.run_split(['W170008', 'W170009A', 'W170010'])
+        self.assertEqual([result['job number'] for result in split.job_results], ['W170008', 'W170009A', 'W170010'])
+        self.assertEqual([result['status'] for result in split.job_results], ['ok', 'failed', 'ok'])
+        self.assertIn('W170009A', split.job_results[1]['error'])
+        self.assertIn('3 jobs, 2 converted, 1 failed', summary_table)
+        # the misprinted job isn't folded into the one before it
+        self.assertEqual(split.job_results[0]['lines'], split.job_results[2]['lines'])